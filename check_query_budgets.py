@@ -0,0 +1,37 @@
+# check_query_budgets.py - Fail if any page runs more SQL than its @query_budget or repeats a query
+import os
+import sys
+
+os.environ['QUERY_INSPECTOR'] = 'strict'
+
+from muranga_dashboard import app, Patient, ANCVisit
+from src.query_inspector import QueryBudgetExceeded
+
+def check_query_budgets(username: str = 'doctor1', password: str = 'doctor123') -> bool:
+    app.testing = True  # Let QueryBudgetExceeded propagate out of the test client
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': password})
+
+    with app.app_context():
+        patient = Patient.query.first()
+        visit = ANCVisit.query.first()
+
+    paths = ['/', '/patients', '/patients?sort=risk', '/alerts', '/reports', '/followups',
+             '/outreach?risk_level=HIGH&risk_level=CRITICAL']
+    if patient:
+        paths += [f'/patient/{patient.patient_id}', f'/api/patient/{patient.patient_id}/bp-series']
+    if visit:
+        paths.append(f'/api/visit/{visit.id}')
+
+    ok = True
+    for path in paths:
+        try:
+            response = client.get(path)
+            print(f"✅ {path} ({response.status_code})")
+        except QueryBudgetExceeded as e:
+            print(f"❌ {e}")
+            ok = False
+    return ok
+
+if __name__ == '__main__':
+    sys.exit(0 if check_query_budgets() else 1)
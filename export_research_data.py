@@ -0,0 +1,35 @@
+# export_research_data.py - De-identified ANC visit export for the public health registry
+import argparse
+import os
+from datetime import datetime
+
+from muranga_dashboard import app, db
+from src.replicas import read_engine
+from src.sharding import shard_map
+from src.research_export import ResearchExporter
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def main():
+    parser = argparse.ArgumentParser(description="Export anonymized ANC visits as chunked Parquet/CSV files")
+    parser.add_argument('output_dir')
+    parser.add_argument('--start', type=parse_date, help="First visit date to include (YYYY-MM-DD)")
+    parser.add_argument('--end', type=parse_date, help="Visit date to stop before (YYYY-MM-DD)")
+    parser.add_argument('--format', choices=['parquet', 'csv'], help="Defaults to parquet when pyarrow is installed")
+    parser.add_argument('-k', type=int, default=5, help="Minimum distinct patients per quasi-identifier class (month, age band, sub-county, gestation, visit)")
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    with app.app_context():
+        # Read-only connections, so a long export never blocks assessments; every
+        # facility database is exported when sharded
+        shards = shard_map()
+        engines = [db.engine] + ([shards.engine(key) for key in shards.keys()] if shards else [])
+        exporter = ResearchExporter([read_engine(engine) for engine in engines],
+                                    k=args.k, chunk_size=args.chunk_size, workers=args.workers)
+        exporter.export(args.output_dir, start=args.start, end=args.end, fmt=args.format)
+
+if __name__ == '__main__':
+    main()
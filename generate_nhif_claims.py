@@ -0,0 +1,18 @@
+# generate_nhif_claims.py - Month-end NHIF claims file for all ANC visits in a period
+import argparse
+
+from muranga_dashboard import app
+from src.nhif_claims import NHIFClaimsGenerator
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate NHIF claims for unclaimed ANC visits")
+    parser.add_argument('period', help="Claim month as YYYYMM")
+    parser.add_argument('--output-dir', default='claims')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        NHIFClaimsGenerator(chunk_size=args.chunk_size).generate(args.period, args.output_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+# generate_synthetic_data.py - Fill the database with a seeded, county-scale ANC population
+import argparse
+
+from muranga_dashboard import app, db, MURANGA_CLINICS
+from src.database import create_schema
+from src.sharding import shard_map
+from src.synthetic_data import SyntheticDataGenerator
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-insert synthetic patients, ANC visits and alerts")
+    parser.add_argument('--patients', type=int, help="Number of patients to add")
+    parser.add_argument('--visits', type=int, help="Stop once about this many visits have been added")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Patients generated and inserted per transaction")
+    args = parser.parse_args()
+
+    if not args.patients and not args.visits:
+        parser.error("give --patients, --visits or both")
+
+    with app.app_context():
+        create_schema()
+        # With SHARD_DIR set each patient goes to her home facility's database
+        generator = SyntheticDataGenerator(db.engine, MURANGA_CLINICS, seed=args.seed, chunk_size=args.chunk_size,
+                                           shards=shard_map())
+        generator.generate(patients=args.patients, visits=args.visits)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# gunicorn.conf.py - Production server settings, tunable through environment variables
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# WEB_CONCURRENCY worker processes each run GUNICORN_THREADS request threads (gthread).
+# SQLite allows one writer at a time, so more processes add read throughput but not
+# write throughput; keep workers low and use threads for concurrency. Each open
+# /api/alerts/stream connection holds a thread for as long as the page is open, so each
+# worker serves at most SSE_MAX_STREAMS (default 4) at once and asks further pages to retry.
+#
+# Per-worker state: the cohort index lives in each worker process. Alert events are
+# written to the database and every worker polls them into its SSE buffer. Each worker
+# writes its request metrics to METRICS_DIR (a temp directory by default, emptied when
+# the master starts) and /metrics sums them, so any worker answers a scrape with the
+# same totals. Background services (follow-ups, escalation, notification outbox,
+# daily digest) run in every worker; their database updates are conditional, so a
+# timer firing in two workers still acts only once.
+#
+# Expected throughput (load_test.py, 8 users, default nurse=3,doctor=1 mix, no think time,
+# 5,000 synthetic patients, load generator on the same single vCPU):
+#
+#   Werkzeug threaded dev server        ~8.4 req/s
+#   gunicorn, 2 workers x 8 threads     ~7.5 req/s, 0 errors, 0 lock errors
+#
+# On one core the app is CPU-bound either way (the slowest steps are /reports, /alerts and
+# login's password hash), so gunicorn pays off with more cores: expect roughly one core's
+# worth of throughput per worker until SQLite writes (assess) start to queue. Re-measure with
+#   python load_test.py --url http://127.0.0.1:5001 --users 16 --duration 60
+import os
+import tempfile
+
+# Read by muranga_dashboard when the master imports it (preload_app below)
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f"muranga-metrics-{os.environ.get('PORT', '5001')}"))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# Import and warm the app once in the master; workers fork with templates compiled and mappers configured
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+# Threads started before fork do not exist in the workers, so wsgi.py starts none and
+# each worker starts its own in post_fork
+_background_services = os.environ.get('ENABLE_SCHEDULERS', '1') == '1'
+
+def on_starting(server):
+    from src.metrics import clear_metrics_dir
+
+    # Counters start from zero with a new master, as Prometheus expects after a restart
+    clear_metrics_dir(os.environ['METRICS_DIR'])
+
+    # INIT_DB_ON_START=1 does `flask init-db` here, in the already loaded master, for hosts
+    # whose disk starts empty; it saves importing the app a second time before serving
+    if os.environ.get('INIT_DB_ON_START') == '1':
+        from muranga_dashboard import app, create_default_users
+        from src.database import create_schema
+
+        with app.app_context():
+            create_schema()
+            create_default_users()
+
+def post_fork(server, worker):
+    from muranga_dashboard import app, db, shard_map, start_background_services
+
+    # Never share SQLite connections (or fan-out pool threads) the master may have opened
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        if shard_map():
+            shard_map().dispose()
+        app.extensions['read_engines'].dispose()
+
+    if _background_services:
+        start_background_services()
+    server.log.info(f"Worker {worker.pid} ready (background services {'on' if _background_services else 'off'})")
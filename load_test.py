@@ -0,0 +1,233 @@
+# load_test.py - Closed-loop nurse/doctor sessions against a local server, reported per workflow step
+import argparse
+import http.cookiejar
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+LOGINS = {
+    'nurse': ('nurse1', 'nurse123'),
+    'doctor': ('doctor1', 'doctor123'),
+}
+
+# The steps of one session for each role, in order
+SESSIONS = {
+    'nurse': ['login', 'dashboard', 'search_patient', 'view_profile', 'assess', 'alerts'],
+    'doctor': ['login', 'dashboard', 'alerts', 'view_profile', 'reports'],
+}
+
+LOCK_ERROR = 'database is locked'
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class StepStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)  # step -> [ms]
+        self.errors = defaultdict(int)
+        self.lock_errors = defaultdict(int)
+        self.sessions = defaultdict(int)
+
+    def record(self, step: str, elapsed_ms: float, ok: bool, locked: bool):
+        with self._lock:
+            self.latencies[step].append(elapsed_ms)
+            if not ok:
+                self.errors[step] += 1
+            if locked:
+                self.lock_errors[step] += 1
+
+    def summary(self, elapsed_seconds: float) -> dict:
+        rows = {}
+        with self._lock:
+            for step, values in self.latencies.items():
+                values = sorted(values)
+                rows[step] = {
+                    'requests': len(values),
+                    'throughput': round(len(values) / elapsed_seconds, 2),
+                    'p50_ms': round(percentile(values, 50), 1),
+                    'p90_ms': round(percentile(values, 90), 1),
+                    'p99_ms': round(percentile(values, 99), 1),
+                    'max_ms': round(values[-1], 1),
+                    'errors': self.errors[step],
+                    'error_rate': round(self.errors[step] / len(values), 4),
+                    'lock_errors': self.lock_errors[step],
+                }
+        return rows
+
+class VirtualUser(threading.Thread):
+    """Runs whole sessions back to back (closed loop) until the deadline"""
+    def __init__(self, number: int, base_url: str, mix: dict, samples: dict, stats: StepStats,
+                 deadline: float, think_ms: float, seed: int):
+        super().__init__(name=f"load-user-{number}", daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.samples = samples
+        self.stats = stats
+        self.deadline = deadline
+        self.think_ms = think_ms
+        self.rng = random.Random(seed + number)
+
+    def request(self, opener, path: str, data: dict = None):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        try:
+            with opener.open(self.base_url + path, data=body, timeout=60) as response:
+                return response.status, response.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace')
+        except (urllib.error.URLError, OSError) as e:
+            return 0, str(e)
+
+    def step(self, opener, role: str, name: str):
+        rng = self.rng
+        if name == 'login':
+            username, password = LOGINS[role]
+            return self.request(opener, '/login', {'username': username, 'password': password})
+        if name == 'dashboard':
+            return self.request(opener, '/')
+        if name == 'search_patient':
+            query = {'village': rng.choice(self.samples['villages']), 'risk_level': rng.choice(['MODERATE', 'HIGH'])}
+            return self.request(opener, '/outreach?' + urllib.parse.urlencode(query))
+        if name == 'view_profile':
+            return self.request(opener, f"/patient/{rng.choice(self.samples['patient_ids'])}")
+        if name == 'assess':
+            systolic = int(rng.gauss(118, 16))
+            return self.request(opener, '/assess', {
+                'patient_id': rng.choice(self.samples['patient_ids']),
+                'name': 'Load Test',
+                'dob': '1995-06-01',
+                'gestation_weeks': str(rng.randint(12, 40)),
+                'systolic_bp': str(systolic),
+                'diastolic_bp': str(int(systolic * 0.65)),
+                'urine_protein': str(rng.choice([0, 0, 0, 1, 2])),
+                'symptoms': rng.sample(['severe_headache', 'fatigue', 'swelling_face_hands'], rng.randint(0, 1)),
+            })
+        if name == 'alerts':
+            return self.request(opener, '/alerts')
+        if name == 'reports':
+            return self.request(opener, '/reports')
+        raise ValueError(f"Unknown step: {name}")
+
+    def run(self):
+        roles, weights = zip(*self.mix.items())
+        while time.monotonic() < self.deadline:
+            role = self.rng.choices(roles, weights)[0]
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            for name in SESSIONS[role]:
+                if time.monotonic() >= self.deadline:
+                    return
+                started = time.perf_counter()
+                status, body = self.step(opener, role, name)
+                elapsed = (time.perf_counter() - started) * 1000
+                locked = LOCK_ERROR in body
+                # Routes flash caught exceptions and redirect, so a 200 can still be a failure
+                ok = 200 <= status < 400 and not locked and 'Error during assessment' not in body
+                self.stats.record(name, elapsed, ok, locked)
+                if self.think_ms:
+                    time.sleep(self.rng.expovariate(1000 / self.think_ms))
+            with self.stats._lock:
+                self.stats.sessions[role] += 1
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(','):
+        role, _, weight = part.partition('=')
+        if role.strip() not in SESSIONS:
+            raise argparse.ArgumentTypeError(f"Unknown role '{role}' (use {', '.join(SESSIONS)})")
+        mix[role.strip()] = float(weight or 1)
+    return mix
+
+def start_local_server(app, port: int):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def print_report(rows: dict, sessions: dict, elapsed: float):
+    header = (f"{'Step':<16} {'Requests':>9} {'Req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+              f"{'Max ms':>9} {'Errors':>7} {'Error %':>8} {'Locked':>7}")
+    print(header)
+    print('-' * len(header))
+    order = [step for role in SESSIONS.values() for step in role]
+    for step in sorted(rows, key=order.index):
+        row = rows[step]
+        print(f"{step:<16} {row['requests']:>9} {row['throughput']:>8.1f} {row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f} {row['errors']:>7} {row['error_rate'] * 100:>7.2f}% "
+              f"{row['lock_errors']:>7}")
+    total = sum(row['requests'] for row in rows.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s); sessions completed: "
+          + ', '.join(f"{role} {count}" for role, count in sorted(sessions.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop load test of clinic workflows")
+    parser.add_argument('--users', type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to run")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('nurse=3,doctor=1'),
+                        help="Relative share of sessions per role, e.g. nurse=3,doctor=1")
+    parser.add_argument('--think-ms', type=float, default=0, help="Mean pause between steps (0 = flat out)")
+    parser.add_argument('--url', help="Use an already running local server (e.g. gunicorn) instead of starting one")
+    parser.add_argument('--port', type=int, default=0, help="Port for the built-in server (0 = any free port)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Also write the results as JSON, to compare runs")
+    args = parser.parse_args()
+
+    # Also used to sample ids from the same database the server uses
+    from muranga_dashboard import app
+    from src.database import db, Patient
+
+    with app.app_context():
+        patient_ids = [row[0] for row in db.session.query(Patient.patient_id).order_by(db.func.random()).limit(2000)]
+        villages = [row[0] for row in db.session.query(Patient.village).filter(
+            Patient.village.isnot(None), Patient.village != '').distinct()]
+    if not patient_ids:
+        print("❌ No patients in the database - run generate_synthetic_data.py first")
+        return 1
+    samples = {'patient_ids': patient_ids, 'villages': villages or ["Murang'a Town"]}
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server, base_url = start_local_server(app, args.port)
+    print(f"✅ Load testing {base_url} with {args.users} users for {args.duration:.0f}s "
+          f"(mix {', '.join(f'{role}={weight:g}' for role, weight in args.mix.items())})")
+
+    stats = StepStats()
+    started = time.monotonic()
+    deadline = started + args.duration
+    users = [VirtualUser(n, base_url, args.mix, samples, stats, deadline, args.think_ms, args.seed)
+             for n in range(args.users)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+
+    if server:
+        server.shutdown()
+
+    rows = stats.summary(elapsed)
+    print_report(rows, stats.sessions, elapsed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'users': args.users, 'duration': elapsed, 'mix': args.mix, 'think_ms': args.think_ms,
+                       'url': base_url, 'steps': rows, 'sessions': dict(stats.sessions)}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+    failed = sum(row['errors'] for row in rows.values())
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
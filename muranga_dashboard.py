@@ -1,18 +1,37 @@
 # muranga_dashboard.py - WITH COMPLETE UPDATES
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash
+from flask import Flask, request, jsonify, render_template, redirect, url_for, session, flash, g, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+import click
+import itertools
 import json
 import sys
 import os
+import time
 from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import case, func
 
 sys.path.append(os.path.dirname(__file__))
 
 try:
     from src.muranga_adapter import MurangaANCAdapter
     from src.hypertension_ai import PregnancyRiskLevel
-    from src.database import db, Patient, ANCVisit, Alert, init_db
+    from src.database import db, Patient, ANCVisit, Alert, ESCALATION_ROLES, init_db, create_schema, assign_legacy_facility, risk_status, has_symptom, has_history
+    from src.clinical_codes import SYMPTOM_CODES, HISTORY_CODES, encode_symptoms, encode_history, decode_flags
+    from src.indicators import ANCIndicatorEngine, period_bounds
+    from src.cohort_index import CohortBitmapIndex, Q
+    from src.cohort_query import CohortQueryBuilder, CohortQueryError
+    from src.followups import FollowUpScheduler, due_list
+    from src.escalation import AlertEscalationEngine
+    from src.events import EventBus
+    from src.notifications import NotificationWorker, providers_from_env, queue_alert_notifications
+    from src.digest import DailyDigestJob
+    from src.metrics import RequestMetrics
+    from src.query_inspector import QueryInspector, query_budget
+    from src.principals import PrincipalCache, UserPrincipal
+    from src.facility_scope import COUNTY_ROLES, init_facility_scope, facility_scope
+    from src.sharding import init_sharding, current_shard, fan_out, shard_map, shards_where
+    from src.replicas import read_only, reading
     print("✅ All modules loaded successfully!")
 except ImportError as e:
     print(f"❌ Import error: {e}")
@@ -21,9 +40,24 @@ except ImportError as e:
 app = Flask(__name__)
 app.secret_key = 'muranga-health-secret-key-2024'
 
-# Initialize Database FIRST
+# Configure the database FIRST (tables are created by `flask init-db`)
 init_db(app)
 
+# Latency, SQL and template timings for /metrics; requests slower than SLOW_REQUEST_MS are logged.
+# With METRICS_DIR set (gunicorn.conf.py does) /metrics sums every worker's counts.
+metrics = RequestMetrics(slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', 500)),
+                         metrics_dir=os.environ.get('METRICS_DIR')).init_app(app)
+
+# QUERY_INSPECTOR=1 reports N+1 and slow queries; =strict also fails requests over their @query_budget
+QUERY_INSPECTOR = os.environ.get('QUERY_INSPECTOR', '')
+query_inspector = None
+if QUERY_INSPECTOR:
+    query_inspector = QueryInspector(
+        repeat_threshold=int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5)),
+        slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+        strict=QUERY_INSPECTOR == 'strict'
+    ).init_app(app)
+
 # THEN create adapter after app is configured
 adapter = MurangaANCAdapter()
 
@@ -33,6 +67,9 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access the system.'
 
+# Patients, visits and alerts are limited to the user's facility; county users see all
+init_facility_scope(app)
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -43,6 +80,7 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(100), nullable=False)
     facility = db.Column(db.String(100), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    auth_version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on password/role/facility change
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -50,14 +88,37 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+principal_cache = PrincipalCache(ttl_seconds=float(os.environ.get('PRINCIPAL_CACHE_SECONDS', 60)))
+
+# Changing any of these signs the user out of every existing session
+AUTH_FIELDS = ('password_hash', 'role', 'facility')
+
+@db.event.listens_for(User, 'before_update')
+def _bump_auth_version(mapper, connection, user):
+    state = db.inspect(user)
+    if any(state.attrs[name].history.has_changes() for name in AUTH_FIELDS):
+        user.auth_version = (user.auth_version or 0) + 1
+        principal_cache.invalidate(user.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Cached principal for the session's auth version; the users table is read at most once per TTL"""
+    version = session.get('auth_version')
+    principal = principal_cache.get(int(user_id), version)
+    if principal is not None:
+        return principal
+    
+    user = User.query.get(int(user_id))
+    if user is None:
+        return None
+    if version is None:
+        session['auth_version'] = user.auth_version  # Session from before version stamps
+    elif version != user.auth_version:
+        return None  # Password, role or facility changed since this session logged in
+    return principal_cache.put(UserPrincipal.from_user(user))
 
 def create_default_users():
     with app.app_context():
-        db.create_all()
-        
         if not User.query.filter_by(username='nurse1').first():
             nurse = User(
                 username='nurse1',
@@ -78,65 +139,95 @@ def create_default_users():
             doctor.set_password('doctor123')
             db.session.add(doctor)
         
+        if not User.query.filter_by(username='county1').first():
+            county = User(
+                username='county1',
+                role='county',
+                full_name='County Reproductive Health Coordinator',
+                facility="Murang'a County Health Office"
+            )
+            county.set_password('county123')
+            db.session.add(county)
+        
         db.session.commit()
         print("✅ Default users created successfully!")
 
-create_default_users()
-
 MURANGA_CLINICS = [
     "Murang'a County Hospital", "Kangema Sub-County Hospital", 
     "Maragua Hospital", "Kiharu Health Centre", "Gatanga Health Centre"
 ]
 
+# SHARD_DIR=<dir> gives each clinic its own database file; see src/sharding.py
+init_sharding(app, MURANGA_CLINICS)
+
+VISITS_PER_PAGE = 10
+BP_SERIES_MAX_POINTS = 60
+
 def generate_patient_id():
-    last_patient = Patient.query.order_by(Patient.id.desc()).first()
-    if last_patient:
-        last_id = int(last_patient.patient_id.replace('MUR', ''))
-        new_id = f"MUR{last_id + 1:03d}"
+    # IDs are county-wide, so with per-facility databases the highest in any of them counts
+    last_ids = [
+        int(last_patient.patient_id.replace('MUR', ''))
+        for last_patient in fan_out(
+            lambda: Patient.query.execution_options(all_facilities=True).order_by(Patient.id.desc()).first(),
+            everywhere=True
+        ) if last_patient
+    ]
+    if last_ids:
+        new_id = f"MUR{max(last_ids) + 1:03d}"
     else:
         new_id = "MUR001"
     return new_id
 
+def patient_visible(patient_id, all_facilities: bool = False) -> bool:
+    """Whether the current user's facility scope (or any facility) includes this patient"""
+    return db.session.query(Patient.id).filter(Patient.patient_id == patient_id).execution_options(
+        all_facilities=all_facilities
+    ).first() is not None
+
+def count_patient_stats() -> dict:
+    return {
+        'total_patients': Patient.query.count(),
+        'total_visits': ANCVisit.query.count(),
+        'total_alerts': Alert.query.count(),
+        'critical_alerts': Alert.query.filter_by(priority='CRITICAL').count()
+    }
+
 def get_patient_stats():
     try:
-        total_patients = Patient.query.count()
-        total_visits = ANCVisit.query.count()
-        total_alerts = Alert.query.count()
-        critical_alerts = Alert.query.filter_by(priority='CRITICAL').count()
-        
-        return {
-            'total_patients': total_patients,
-            'total_visits': total_visits,
-            'total_alerts': total_alerts,
-            'critical_alerts': critical_alerts
-        }
+        # Summed over every facility database for county users when sharded
+        stats = {'total_patients': 0, 'total_visits': 0, 'total_alerts': 0, 'critical_alerts': 0}
+        for counts in fan_out(count_patient_stats):
+            for key, value in counts.items():
+                stats[key] += value
+        return stats
     except Exception as e:
         print(f"Error getting stats: {e}")
         return {'total_patients': 0, 'total_visits': 0, 'total_alerts': 0, 'critical_alerts': 0}
 
 def get_recent_patients():
     try:
-        recent_visits = ANCVisit.query.order_by(ANCVisit.visit_date.desc()).limit(5).all()
+        # The latest-visit snapshot on Patient answers this in a single query per
+        # facility database; county users get the latest five across all of them
+        def shard_recent():
+            shard = current_shard()
+            return [(shard, patient) for patient in Patient.query.filter(Patient.last_visit_date.isnot(None)).order_by(
+                Patient.last_visit_date.desc()
+            ).limit(5)]
+        
+        patients = sorted(itertools.chain.from_iterable(fan_out(shard_recent)),
+                          key=lambda row: row[1].last_visit_date, reverse=True)[:5]
         recent_patients = []
         
-        for visit in recent_visits:
-            patient = Patient.query.filter_by(patient_id=visit.patient_id).first()
-            if patient:
-                if visit.risk_level == 'LOW':
-                    status = 'normal'
-                elif visit.risk_level == 'MODERATE':
-                    status = 'warning'
-                else:
-                    status = 'critical'
-                
-                recent_patients.append({
-                    'name': patient.name,
-                    'id': patient.patient_id,
-                    'visit_date': visit.visit_date,
-                    'bp_systolic': visit.systolic_bp,
-                    'bp_diastolic': visit.diastolic_bp,
-                    'status': status
-                })
+        for shard, patient in patients:
+            recent_patients.append({
+                'name': patient.name,
+                'id': patient.patient_id,
+                'shard': shard,
+                'visit_date': patient.last_visit_date,
+                'bp_systolic': patient.last_systolic_bp,
+                'bp_diastolic': patient.last_diastolic_bp,
+                'status': risk_status(patient.last_risk_level)
+            })
         
         if not recent_patients:
             recent_patients = [
@@ -169,11 +260,11 @@ def create_test_alerts():
                 # Create test patients
                 test_patients = [
                     Patient(patient_id="MUR001", name="Mary Wanjiku", dob=date(1990, 5, 15), 
-                           gestation_weeks=28, phone="0712345678", village="Kangema"),
+                           gestation_weeks=28, phone="0712345678", village="Kangema", facility=MURANGA_CLINICS[0]),
                     Patient(patient_id="MUR002", name="Grace Nyambura", dob=date(1985, 8, 22), 
-                           gestation_weeks=32, phone="0723456789", village="Maragua"),
+                           gestation_weeks=32, phone="0723456789", village="Maragua", facility=MURANGA_CLINICS[0]),
                     Patient(patient_id="MUR003", name="Esther Wairimu", dob=date(1995, 3, 10), 
-                           gestation_weeks=25, phone="0734567890", village="Kiharu")
+                           gestation_weeks=25, phone="0734567890", village="Kiharu", facility=MURANGA_CLINICS[0])
                 ]
                 for patient in test_patients:
                     db.session.add(patient)
@@ -186,17 +277,17 @@ def create_test_alerts():
                      message="Critical blood pressure reading: 160/110 mmHg", 
                      priority="CRITICAL", risk_score=9.5,
                      risk_factors=json.dumps(["Hypertension", "Proteinuria"]),
-                     created_at=datetime.now()),
+                     facility=patients[0].facility, created_at=datetime.now()),
                 Alert(patient_id=patients[1].patient_id, 
                      message="Moderate risk: Elevated blood pressure with symptoms", 
                      priority="HIGH", risk_score=7.2,
                      risk_factors=json.dumps(["Headache", "Visual disturbances"]),
-                     created_at=datetime.now() - timedelta(hours=2)),
+                     facility=patients[1].facility, created_at=datetime.now() - timedelta(hours=2)),
                 Alert(patient_id=patients[2].patient_id, 
                      message="Monitor for pre-eclampsia symptoms", 
                      priority="MEDIUM", risk_score=5.8,
                      risk_factors=json.dumps(["First pregnancy", "Family history"]),
-                     created_at=datetime.now() - timedelta(days=1))
+                     facility=patients[2].facility, created_at=datetime.now() - timedelta(days=1))
             ]
             
             for alert in test_alerts:
@@ -209,8 +300,109 @@ def create_test_alerts():
             print(f"❌ Error creating test alerts: {e}")
             db.session.rollback()
 
-# Create test alerts on startup
-create_test_alerts()
+# Built on first use and rebuilt periodically, so each worker also picks up assessments made by other workers
+COHORT_INDEX_REFRESH_SECONDS = int(os.environ.get('COHORT_INDEX_REFRESH_SECONDS', 300))
+cohort_index = CohortBitmapIndex(refresh_interval=COHORT_INDEX_REFRESH_SECONDS)
+
+def latest_patient_states():
+    return db.session.query(
+        Patient.patient_id, Patient.last_risk_level, Patient.gestation_weeks, Patient.village,
+        Patient.facility, ANCVisit.symptom_flags, ANCVisit.history_flags
+    ).outerjoin(ANCVisit, ANCVisit.id == Patient.last_visit_id).execution_options(
+        all_facilities=True  # Shared by every user; cohort queries add the facility themselves
+    )
+
+def build_cohort_index():
+    """Load every patient's latest-visit state into the bitmap index in one query (one per shard, in parallel)"""
+    with reading():
+        if shard_map():
+            cohort_index.build(itertools.chain.from_iterable(
+                fan_out(lambda: latest_patient_states().all(), everywhere=True)))
+        else:
+            cohort_index.build(latest_patient_states().yield_per(10000))
+
+follow_up_scheduler = FollowUpScheduler(app)
+escalation_engine = AlertEscalationEngine(app)
+notification_worker = NotificationWorker(app, providers_from_env())
+digest_job = DailyDigestJob(app, MURANGA_CLINICS, hour=int(os.environ.get('DIGEST_HOUR', 6)),
+                            notification_worker=notification_worker)
+# Alert events go through the database, so every worker's streams see them; each open
+# stream holds a server thread, so leave most of GUNICORN_THREADS for ordinary requests
+event_bus = EventBus(app, max_streams=int(os.environ.get('SSE_MAX_STREAMS', 4)))
+
+def alert_event_data(alert) -> dict:
+    return {
+        'id': alert.id,
+        'patient_id': alert.patient_id,
+        'priority': alert.priority,
+        'message': alert.message,
+        'risk_score': alert.risk_score,
+        'facility': alert.facility,
+        'created_at': alert.created_at.strftime('%Y-%m-%d %H:%M') if alert.created_at else None,
+        'escalated_to': alert.escalated_to if alert.escalation_level else None,
+        'acknowledged_by': alert.acknowledged_by,
+        'resolved': bool(alert.resolved),
+        'shard': current_shard()  # Ids repeat across facility databases
+    }
+
+def publish_alert_event(event_type, alert, roles=None):
+    event_bus.publish(event_type, alert_event_data(alert), facility=alert.facility, roles=roles)
+
+def notify_escalation(alert, role):
+    """Tell the users holding the role; nurses and doctors at the alert's facility, county staff anywhere"""
+    recipients = User.query.filter_by(role=role)
+    if role != 'county' and alert.facility:
+        recipients = recipients.filter_by(facility=alert.facility)
+    for user in recipients:
+        print(f"🔔 {user.full_name} ({role}): {alert.priority} alert for {alert.patient_id} unresolved - {alert.message}")
+    
+    if queue_alert_notifications(alert, [role]):
+        db.session.commit()
+        notification_worker.wake()
+
+escalation_engine.notifiers.append(notify_escalation)
+# Escalations reach the role now responsible and everyone above it
+escalation_engine.notifiers.append(
+    lambda alert, role: publish_alert_event('alert.escalated', alert, roles=ESCALATION_ROLES[ESCALATION_ROLES.index(role):])
+)
+
+def start_background_services():
+    """Start the timer and outbox threads; gunicorn calls this in each worker after fork"""
+    follow_up_scheduler.start()
+    escalation_engine.start()
+    notification_worker.start()
+    digest_job.start()
+
+def create_app(start_services: bool = None):
+    """
+    Get the app ready to serve. Importing this module only registers routes; the
+    engine opens on the first query and the cohort index fills on first use.
+    Schema and seed data come from `flask --app muranga_dashboard init-db` and
+    `seed-demo`. Set ENABLE_SCHEDULERS=0 to serve without background services.
+    """
+    if start_services is None:
+        start_services = os.environ.get('ENABLE_SCHEDULERS', '1') == '1'
+    if start_services:
+        start_background_services()
+    return app
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create missing tables and columns, and the default users"""
+    create_schema()
+    create_default_users()
+
+@app.cli.command('assign-facility')
+@click.argument('facility')
+def assign_facility_command(facility):
+    """Assign visits recorded without a facility (and their patients and alerts) to FACILITY"""
+    count = assign_legacy_facility(facility)
+    print(f"✅ Assigned {count} visits to {facility}")
+
+@app.cli.command('seed-demo')
+def seed_demo_command():
+    """Add demo patients and alerts to a database that has no alerts yet"""
+    create_test_alerts()
 
 @app.route('/error/<error>')
 def handle_errors(error):
@@ -278,6 +470,7 @@ def login():
             session['user_name'] = user.full_name
             session['user_role'] = user.role
             session['facility'] = user.facility
+            session['auth_version'] = user.auth_version
             flash('Login successful!', 'success')
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('dashboard'))
@@ -295,6 +488,7 @@ def logout():
     return redirect(url_for('login'))
 
 @app.route('/')
+@query_budget(8)
 @login_required
 def dashboard():
     try:
@@ -338,11 +532,14 @@ def add_patient():
                 gestation_weeks=gestation_weeks,
                 phone=phone,
                 village=village,
+                facility=current_user.facility,
                 registered_date=datetime.utcnow()
             )
             
             db.session.add(new_patient)
             db.session.commit()
+            cohort_index.update_patient(patient_id, gestation_weeks=gestation_weeks, village=village,
+                                        facility=new_patient.facility)
             
             flash(f'Patient {name} added successfully with ID: {patient_id}', 'success')
             return redirect(url_for('list_patients'))
@@ -370,6 +567,8 @@ def assess_patient():
                 'urine_protein': int(request.form['urine_protein']),
                 'symptoms': request.form.getlist('symptoms'),
                 'medical_history': request.form.getlist('medical_history'),
+                'symptom_flags': encode_symptoms(request.form.getlist('symptoms')),
+                'history_flags': encode_history(request.form.getlist('medical_history')),
                 'visit_date': datetime.now().strftime('%Y-%m-%d'),
                 'assessed_by': current_user.full_name
             }
@@ -388,7 +587,13 @@ def assess_patient():
                     return redirect(url_for('assess_patient'))
                 
                 # Check if patient exists, create if not
-                patient = Patient.query.filter_by(patient_id=patient_data['patient_id']).first()
+                # Patient IDs are county-wide, so look beyond this facility before creating one.
+                # When sharded, a referred patient's records all stay in her home facility's
+                # database, so write there for the rest of this request.
+                g.shard = next(iter(shards_where(lambda: patient_visible(patient_data['patient_id'], True))),
+                               current_shard())
+                patient = Patient.query.execution_options(all_facilities=True).filter_by(
+                    patient_id=patient_data['patient_id']).first()
                 if not patient:
                     patient = Patient(
                         patient_id=patient_data['patient_id'],
@@ -397,26 +602,41 @@ def assess_patient():
                         gender='female',
                         gestation_weeks=patient_data['gestation_weeks'],
                         phone='',  # Provide default values
-                        village=''
+                        village='',
+                        facility=current_user.facility
                     )
                     db.session.add(patient)
                     db.session.flush()  # Get the patient ID without committing
                 
+                # Visit sequence number drives the ANC1/ANC4 indicators; counted in every
+                # facility database, in case earlier visits were recorded elsewhere
+                previous_visits = sum(fan_out(lambda: ANCVisit.query.execution_options(all_facilities=True).filter_by(
+                    patient_id=patient_data['patient_id']).count(), everywhere=True))
+                
                 # Create the visit record with proper datetime object
                 visit = ANCVisit(
                     patient_id=patient_data['patient_id'],
                     visit_date=datetime.now(),  # Use datetime object
+                    facility=current_user.facility,
+                    visit_number=previous_visits + 1,
                     gestation_weeks=patient_data['gestation_weeks'],
                     systolic_bp=patient_data['systolic_bp'],
                     diastolic_bp=patient_data['diastolic_bp'],
                     urine_protein=patient_data['urine_protein'],
-                    symptoms=json.dumps(patient_data['symptoms']),
-                    medical_history=json.dumps(patient_data['medical_history']),
+                    symptom_flags=patient_data['symptom_flags'],
+                    history_flags=patient_data['history_flags'],
                     risk_score=risk['risk_score'],
                     risk_level=risk['risk_level'].value,
                     recommendation=risk['recommendation']
                 )
                 db.session.add(visit)
+                db.session.flush()
+                
+                # Keep the patient's latest-visit snapshot in the same transaction
+                patient.record_visit(visit)
+                
+                # This visit completes any open follow-up and sets the next one
+                follow_up, completed_follow_ups = FollowUpScheduler.create_for_visit(patient, visit)
                 
                 # Create alert if needed
                 if result.get('alert'):
@@ -426,13 +646,28 @@ def assess_patient():
                         priority=result['alert']['priority'],
                         risk_score=risk['risk_score'],
                         risk_factors=json.dumps(risk['risk_factors']),
+                        facility=visit.facility,
                         created_at=datetime.now()
                     )
                     db.session.add(alert)
+                    db.session.flush()
+                    
+                    # Queued with the alert; the worker delivers after commit, never in this request
+                    queue_alert_notifications(alert, ['nurse', 'doctor'])
                 
                 # Commit all changes
                 db.session.commit()
                 
+                follow_up_scheduler.schedule(follow_up, completed_follow_ups)
+                if result.get('alert'):
+                    escalation_engine.track(alert)
+                    publish_alert_event('alert.created', alert)
+                    notification_worker.wake()
+                cohort_index.update_patient(
+                    patient.patient_id, visit.risk_level, visit.gestation_weeks, patient.village,
+                    patient.facility, visit.symptom_flags, visit.history_flags
+                )
+                
                 # Return assessment result
                 return render_template('assessment_result.html',
                                      risk=risk,
@@ -451,50 +686,145 @@ def assess_patient():
     return render_template('assessment_form.html')
 
 @app.route('/patients')
+@query_budget(4)
 @login_required
 def list_patients():
     try:
-        patients = Patient.query.all()
-        return render_template('patients.html', patients=patients)
+        sort = request.args.get('sort', 'id')
+        
+        def shard_patients():
+            query = Patient.query
+            if sort == 'risk':
+                # Indexed ORDER BY on the snapshot column; never-assessed patients sort last
+                query = query.order_by(Patient.last_risk_score.desc())
+            elif sort == 'recent':
+                query = query.order_by(Patient.last_visit_date.desc())
+            else:
+                query = query.order_by(Patient.id)
+            shard = current_shard()
+            return [(shard, patient) for patient in query]
+        
+        # Each facility database for county users when sharded; ids repeat across
+        # shards, so each patient travels with its shard key for the profile link
+        patients = list(itertools.chain.from_iterable(fan_out(shard_patients)))
+        if sort == 'risk':
+            patients.sort(key=lambda row: row[1].last_risk_score if row[1].last_risk_score is not None else -1, reverse=True)
+        elif sort == 'recent':
+            patients.sort(key=lambda row: row[1].last_visit_date or datetime.min, reverse=True)
+        return render_template('patients.html', patients=patients, sort=sort)
     except Exception as e:
         flash(f'Error loading patients: {str(e)}', 'error')
-        return render_template('patients.html', patients=[])
+        return render_template('patients.html', patients=[], sort='id')
 
 @app.route('/patient/<patient_id>')
+@query_budget(6)
 @login_required
 def patient_profile(patient_id):
     try:
         patient = Patient.query.filter_by(patient_id=patient_id).first()
+        if not patient and shard_map() and facility_scope() is None and 'shard' not in request.args:
+            # A county link that doesn't name the patient's facility database (e.g. from a live alert)
+            shard = next(iter(shards_where(lambda: patient_visible(patient_id))), None)
+            if shard is not None:
+                return redirect(url_for('patient_profile', patient_id=patient_id, shard=shard, **request.args))
         if not patient:
             flash('Patient not found', 'error')
             return redirect(url_for('list_patients'))
         
-        visits = ANCVisit.query.filter_by(patient_id=patient_id).order_by(ANCVisit.visit_date.desc()).all()
+        # Only one page of visits is rendered; details and the BP chart load on demand.
+        # A visible patient's history includes visits at other facilities (referrals).
+        page = request.args.get('page', 1, type=int)
+        visits = ANCVisit.query.execution_options(all_facilities=True).filter_by(patient_id=patient_id).order_by(
+            ANCVisit.visit_date.desc()
+        ).paginate(page=page, per_page=VISITS_PER_PAGE, error_out=False)
         
         return render_template('patient_profile.html', 
                              patient=patient, 
-                             visits=visits)
+                             visits=visits,
+                             shard=current_shard())
     except Exception as e:
         flash(f'Error loading patient profile: {str(e)}', 'error')
         return redirect(url_for('list_patients'))
 
+@app.route('/api/visit/<int:visit_id>')
+@query_budget(3)
+@login_required
+def api_visit_details(visit_id):
+    visit = ANCVisit.query.execution_options(all_facilities=True).get(visit_id)
+    if not visit or not patient_visible(visit.patient_id):
+        return jsonify({'error': 'Visit not found'}), 404
+    
+    return jsonify({
+        'id': visit.id,
+        'patient_id': visit.patient_id,
+        'visit_date': visit.visit_date.strftime('%Y-%m-%d %H:%M'),
+        'facility': visit.facility,
+        'gestation_weeks': visit.gestation_weeks,
+        'systolic_bp': visit.systolic_bp,
+        'diastolic_bp': visit.diastolic_bp,
+        'urine_protein': visit.urine_protein,
+        'symptoms': decode_flags(visit.symptom_flags, SYMPTOM_CODES),
+        'medical_history': decode_flags(visit.history_flags, HISTORY_CODES),
+        'risk_score': visit.risk_score,
+        'risk_level': visit.risk_level,
+        'recommendation': visit.recommendation
+    })
+
+@app.route('/api/patient/<patient_id>/bp-series')
+@query_budget(3)
+@login_required
+def api_bp_series(patient_id):
+    """BP readings oldest-first, downsampled to at most `points` readings for the chart"""
+    max_points = max(2, min(request.args.get('points', BP_SERIES_MAX_POINTS, type=int), 500))
+    if not patient_visible(patient_id):
+        return jsonify({'error': 'Patient not found'}), 404
+    readings = db.session.query(
+        ANCVisit.visit_date, ANCVisit.systolic_bp, ANCVisit.diastolic_bp
+    ).filter(ANCVisit.patient_id == patient_id).order_by(ANCVisit.visit_date).execution_options(
+        all_facilities=True
+    ).all()
+    
+    total = len(readings)
+    if total > max_points:
+        # Keep the highest systolic reading in each bucket so hypertensive peaks stay visible
+        bucket_size = total / max_points
+        readings = [
+            max(readings[int(i * bucket_size):int((i + 1) * bucket_size)], key=lambda r: r[1])
+            for i in range(max_points)
+        ]
+    
+    return jsonify({
+        'total': total,
+        'downsampled': total > max_points,
+        'dates': [r[0].strftime('%Y-%m-%d') for r in readings],
+        'systolic': [r[1] for r in readings],
+        'diastolic': [r[2] for r in readings]
+    })
+
 @app.route('/alerts')
+@query_budget(4)
 @login_required
 def list_alerts():
     try:
-        alerts = Alert.query.order_by(Alert.created_at.desc()).all()
+        # Alerts and their patients (with current risk snapshot) in one joined query, per
+        # facility database for county users when sharded; ids repeat across shards, so
+        # each alert travels with its shard key
+        def shard_alerts():
+            shard = current_shard()
+            return [(shard, alert, patient) for alert, patient in db.session.query(Alert, Patient).outerjoin(
+                Patient, Alert.patient_id == Patient.patient_id
+            ).order_by(Alert.created_at.desc())]
+        
+        rows = sorted(itertools.chain.from_iterable(fan_out(shard_alerts)),
+                      key=lambda row: row[1].created_at or datetime.min, reverse=True)
         
-        # Get patient information for each alert
-        patient_map = {}
-        for alert in alerts:
-            patient = Patient.query.filter_by(patient_id=alert.patient_id).first()
-            if patient:
-                patient_map[alert.patient_id] = patient
+        alerts = [(shard, alert) for shard, alert, patient in rows]
+        patient_map = {patient.patient_id: patient for shard, alert, patient in rows if patient}
         
         # Count alerts by priority
-        critical_count = len([a for a in alerts if a.priority == 'CRITICAL'])
-        high_count = len([a for a in alerts if a.priority == 'HIGH'])
-        medium_count = len([a for a in alerts if a.priority == 'MEDIUM'])
+        critical_count = len([a for shard, a in alerts if a.priority == 'CRITICAL'])
+        high_count = len([a for shard, a in alerts if a.priority == 'HIGH'])
+        medium_count = len([a for shard, a in alerts if a.priority == 'MEDIUM'])
         
         return render_template('alerts.html', 
                              alerts=alerts,
@@ -512,8 +842,47 @@ def list_alerts():
                              high_count=0,
                              medium_count=0)
 
+@app.route('/alerts/<int:alert_id>/acknowledge', methods=['POST'])
+@login_required
+def acknowledge_alert(alert_id):
+    # The form's ?shard= has already pinned the alert's database (see init_sharding)
+    alert = Alert.query.get_or_404(alert_id)
+    if current_user.role not in ESCALATION_ROLES:
+        flash('Only clinical and county staff can acknowledge alerts', 'error')
+    elif not alert.resolved:
+        escalation_engine.acknowledge(alert, current_user.full_name)
+        publish_alert_event('alert.acknowledged', alert)
+        flash(f'Alert for {alert.patient_id} acknowledged', 'success')
+    return redirect(url_for('list_alerts'))
+
+@app.route('/alerts/<int:alert_id>/resolve', methods=['POST'])
+@login_required
+def resolve_alert(alert_id):
+    # The form's ?shard= has already pinned the alert's database (see init_sharding)
+    alert = Alert.query.get_or_404(alert_id)
+    if not alert.can_be_resolved_by(current_user.role):
+        flash(f'This alert has been escalated to {alert.escalated_to} level and can only be resolved from there', 'error')
+    elif not alert.resolved:
+        escalation_engine.resolve(alert, current_user.full_name)
+        publish_alert_event('alert.resolved', alert)
+        flash(f'Alert for {alert.patient_id} resolved', 'success')
+    return redirect(url_for('list_alerts'))
+
+@app.route('/api/alerts/stream')
+@login_required
+def alert_stream():
+    """Server-Sent Events for alerts at the user's facility; browsers resume with Last-Event-ID"""
+    stream = event_bus.stream(current_user.facility, current_user.role, request.headers.get('Last-Event-ID'))
+    db.session.close()  # The stream never touches the database, so don't hold a pooled connection open
+    response = Response(stream_with_context(stream), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
 @app.route('/reports')
+@query_budget(10)
 @login_required
+@read_only
 def reports():
     try:
         # Basic statistics
@@ -610,6 +979,251 @@ def reports():
         flash(f'Error generating reports: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
 
+@app.route('/api/cohorts/clinical-counts')
+@login_required
+@read_only
+def api_clinical_counts():
+    """Visits reporting each symptom / history factor in a date range, from one indexed pass"""
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if 'end' in request.args else datetime.now()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if 'start' in request.args else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    columns = [func.count(ANCVisit.id)]
+    columns += [func.sum(case((has_symptom(name), 1), else_=0)) for name in SYMPTOM_CODES]
+    columns += [func.sum(case((has_history(name), 1), else_=0)) for name in HISTORY_CODES]
+    # Partial sums from each facility database when sharded, added column by column
+    rows = fan_out(lambda: db.session.query(*columns).filter(
+        ANCVisit.visit_date >= start, ANCVisit.visit_date < end
+    ).one())
+    row = [sum(values[i] or 0 for values in rows) for i in range(len(columns))]
+    
+    symptom_count = len(SYMPTOM_CODES)
+    return jsonify({
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'visits': row[0],
+        'symptoms': dict(zip(SYMPTOM_CODES, (value or 0 for value in row[1:1 + symptom_count]))),
+        'medical_history': dict(zip(HISTORY_CODES, (value or 0 for value in row[1 + symptom_count:])))
+    })
+
+@app.route('/api/cohorts/query', methods=['POST'])
+@login_required
+def api_cohort_query():
+    """
+    Count (and optionally list) patients matching a cohort expression, e.g.
+    {"query": {"and": [{"field": "history", "value": "first_pregnancy"},
+                       {"field": "trimester", "value": 3},
+                       {"field": "risk_level", "at_least": "MODERATE"}]},
+     "ids": true, "limit": 100}
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        query = Q.from_json(body.get('query') or {})
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    if facility_scope():
+        query = query & Q('facility', facility_scope())
+    
+    if cohort_index.is_stale():
+        build_cohort_index()
+    
+    started = time.perf_counter()
+    try:
+        result = {'count': cohort_index.count(query)}
+        if body.get('ids'):
+            result['patient_ids'] = cohort_index.patient_ids(query, limit=min(int(body.get('limit', 100)), 5000))
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    result['elapsed_us'] = round((time.perf_counter() - started) * 1e6, 1)
+    return jsonify(result)
+
+OUTREACH_PAGE_SIZE = 50
+
+def outreach_filters_from_request() -> dict:
+    args = request.args
+    return {
+        'village': args.get('village', '').strip(),
+        'facility': args.get('facility', '').strip(),
+        'risk_levels': args.getlist('risk_level'),
+        'gestation_min': args.get('gestation_min', type=int),
+        'gestation_max': args.get('gestation_max', type=int),
+        'min_days_since_visit': args.get('min_days_since_visit', type=int),
+        'max_days_since_visit': args.get('max_days_since_visit', type=int),
+        'symptoms': args.getlist('symptom'),
+        'history': args.getlist('history')
+    }
+
+@app.route('/outreach')
+@query_budget(6)
+@login_required
+@read_only
+def outreach():
+    """Community outreach lists: structured filters, keyset paging and CSV download"""
+    filters = outreach_filters_from_request()
+    has_filters = any(value not in (None, '', []) for value in filters.values())
+    patients, next_cursor, warnings, error = [], None, [], None
+    
+    if has_filters:
+        try:
+            builder = CohortQueryBuilder(filters)
+            warnings = builder.check_plan()
+            
+            if request.args.get('format') == 'csv':
+                response = Response(stream_with_context(builder.stream_csv()), mimetype='text/csv')
+                response.headers['Content-Disposition'] = f"attachment; filename=outreach_{datetime.now():%Y%m%d}.csv"
+                return response
+            
+            patients, next_cursor = builder.page(request.args.get('after', 0), OUTREACH_PAGE_SIZE)
+        except CohortQueryError as e:
+            error = str(e)
+    
+    villages = sorted(set(itertools.chain.from_iterable(fan_out(lambda: [row[0] for row in db.session.query(
+        Patient.village).filter(Patient.village.isnot(None), Patient.village != '').distinct()]))))
+    
+    query_args = request.args.to_dict(flat=False)
+    query_args.pop('after', None)
+    csv_url = url_for('outreach', **query_args, format='csv')
+    next_url = url_for('outreach', **query_args, after=next_cursor) if next_cursor else None
+    
+    return render_template('outreach.html',
+                         filters=filters,
+                         patients=patients,
+                         csv_url=csv_url,
+                         next_url=next_url,
+                         warnings=warnings,
+                         error=error,
+                         villages=villages,
+                         muranga_clinics=MURANGA_CLINICS,
+                         symptom_codes=SYMPTOM_CODES,
+                         history_codes=HISTORY_CODES)
+
+@app.route('/api/cohorts/outreach')
+@login_required
+@read_only
+def api_outreach():
+    try:
+        builder = CohortQueryBuilder(outreach_filters_from_request())
+        warnings = builder.check_plan()
+        limit = min(request.args.get('limit', OUTREACH_PAGE_SIZE, type=int), 1000)
+        patients, next_cursor = builder.page(request.args.get('after', 0), limit)
+    except CohortQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'patients': patients, 'next_cursor': next_cursor, 'warnings': warnings})
+
+@app.route('/followups')
+@query_budget(5)
+@login_required
+def followups():
+    """Follow-ups due at a facility in the next few days, plus recent missed ones"""
+    facility = facility_scope() or request.args.get('facility', current_user.facility)
+    days = min(request.args.get('days', 3, type=int), 90)
+    now = datetime.now()
+    
+    def shard_due():
+        shard = current_shard()
+        lists = due_list(facility, now + timedelta(days=days))
+        patient_ids = {f.patient_id for f in lists['due'] + lists['missed']}
+        # Follow-ups owed here include referred patients whose home facility is elsewhere
+        patients = Patient.query.execution_options(all_facilities=True).filter(
+            Patient.patient_id.in_(patient_ids)).all() if patient_ids else []
+        return shard, lists, patients
+    
+    # A referred patient's follow-ups live with the patient's record in the home facility's
+    # database, so every shard is read, and each row keeps its shard for links
+    due, missed, patients = [], [], {}
+    for shard, lists, shard_patients in fan_out(shard_due, everywhere=True):
+        due += [(shard, f) for f in lists['due']]
+        missed += [(shard, f) for f in lists['missed']]
+        patients.update({(shard, p.patient_id): p for p in shard_patients})
+    due.sort(key=lambda row: row[1].due_at)
+    missed.sort(key=lambda row: row[1].due_at, reverse=True)
+    
+    return render_template('followups.html',
+                         facility=facility,
+                         days=days,
+                         now=now,
+                         due=due,
+                         missed=missed,
+                         patients=patients,
+                         muranga_clinics=MURANGA_CLINICS)
+
+@app.route('/reports/digest')
+@login_required
+@read_only
+def digest_preview():
+    """
+    Today's digest text for a facility, as it would be sent (nothing is queued).
+    County staff pick a facility with ?facility=, or get every facility's digest.
+    """
+    end = datetime.now()
+    start = end - timedelta(days=1)
+    digests = digest_job.collect(start, end)
+    if current_user.role in COUNTY_ROLES:
+        facilities = [request.args['facility']] if request.args.get('facility') else list(digests)
+    else:
+        facilities = [facility_scope() or current_user.facility]
+    unknown = [facility for facility in facilities if facility not in digests]
+    if unknown:
+        return jsonify({'error': f'Unknown facility: {unknown[0]}'}), 404
+    return Response('\n'.join(digest_job.render(facility, digests[facility], start, end) for facility in facilities),
+                    mimetype='text/plain')
+
+@app.route('/reports/dhis2/<period>')
+@login_required
+@read_only
+def dhis2_export(period):
+    """
+    MOH 711 ANC indicators for a month (YYYYMM) as a DHIS2 dataValueSet. Closed
+    months come from the stored rollups; nothing is written here, so the open
+    month is counted on the fly. POST to /refresh to recompute the rollups.
+    """
+    if current_user.role not in COUNTY_ROLES:
+        return jsonify({'error': 'County-wide indicators are only available to county staff'}), 403
+    try:
+        payload = ANCIndicatorEngine(MURANGA_CLINICS).build_data_value_set(period, store=False)
+    except ValueError:
+        return jsonify({'error': 'Period must be in YYYYMM format'}), 400
+    response = jsonify(payload)
+    response.headers['Content-Disposition'] = f'attachment; filename=moh711_anc_{period}.json'
+    return response
+
+@app.route('/reports/dhis2/<period>/refresh', methods=['POST'])
+@login_required
+def dhis2_refresh(period):
+    """Recompute a month's indicator rollups, e.g. after late visits are entered; only closed months are stored"""
+    if current_user.role not in COUNTY_ROLES:
+        return jsonify({'error': 'County-wide indicators are only available to county staff'}), 403
+    try:
+        rollups = ANCIndicatorEngine(MURANGA_CLINICS).compute_period(period, refresh=True)
+    except ValueError:
+        return jsonify({'error': 'Period must be in YYYYMM format'}), 400
+    return jsonify({'period': period, 'facilities': len(rollups), 'stored': period_bounds(period)[1] <= datetime.now()})
+
+@app.route('/admin/queries')
+@login_required
+def query_reports():
+    """Recent requests flagged by the query inspector (QUERY_INSPECTOR=1)"""
+    if current_user.role not in ('doctor', 'county'):
+        flash('Only doctors and county staff can view query reports', 'error')
+        return redirect(url_for('dashboard'))
+    return render_template('admin_queries.html',
+                         enabled=query_inspector is not None,
+                         reports=list(query_inspector.reports) if query_inspector else [])
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint: a bearer METRICS_TOKEN for scrapers, otherwise county staff only"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    elif not (current_user.is_authenticated and current_user.role in COUNTY_ROLES):
+        return Response('Forbidden - set METRICS_TOKEN for scrapers\n', status=403, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/template-fallback')
 def template_fallback():
     return """
@@ -632,4 +1246,9 @@ def template_fallback():
     """
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
+    # The development server sets everything up itself, as it always has
+    with app.app_context():
+        create_schema()
+        create_default_users()
+        create_test_alerts()
+    create_app().run(host='0.0.0.0', port=5001, debug=False)
\ No newline at end of file
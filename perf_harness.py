@@ -0,0 +1,242 @@
+# perf_harness.py - Per-route query-count and latency budgets against a seeded database
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+# Routes without a @query_budget in muranga_dashboard.py
+HARNESS_QUERY_BUDGETS = {
+    'login': 2,
+    'add_patient': 4,
+    'assess_patient': 16,
+    'api_clinical_counts': 3,
+    'api_cohort_query': 2,
+    'api_outreach': 4,
+    'acknowledge_alert': 6,
+    'resolve_alert': 6,
+    'digest_preview': 6,
+    'dhis2_export': 4,  # The open month is counted on the fly, nothing is written
+    'dhis2_refresh': 14,  # One rollup written per facility
+    'query_reports': 2,
+    'handle_errors': 1,
+    'template_fallback': 0,
+    'prometheus_metrics': 0,
+}
+
+# Never exercised: the SSE stream does not end, and logout ends the session
+SKIPPED_ENDPOINTS = {'static', 'alert_stream', 'logout'}
+
+# County-wide routes, requested as the county user
+COUNTY_ENDPOINTS = {'dhis2_export', 'dhis2_refresh', 'prometheus_metrics'}
+
+def seed_database(patients: int, visits: int, seed: int = 42) -> dict:
+    """Replace all clinical data with a seeded synthetic county"""
+    from muranga_dashboard import MURANGA_CLINICS
+    from src.database import db, Patient, ANCVisit, Alert, FollowUp, NotificationOutbox
+    from src.synthetic_data import SyntheticDataGenerator
+
+    for table in (NotificationOutbox, FollowUp, Alert, ANCVisit, Patient):
+        db.session.execute(table.__table__.delete())
+    db.session.commit()
+
+    # generate() stops at whichever target comes first, so top up with more patients until the visit target is met,
+    # sized from the visits per patient so far
+    generator = SyntheticDataGenerator(db.engine, MURANGA_CLINICS, seed=seed)
+    totals = generator.generate(patients=patients, visits=visits)
+    while totals['visits'] < visits:
+        missing = visits - totals['visits']
+        more = generator.generate(patients=math.ceil(missing * totals['patients'] / totals['visits']), visits=missing)
+        totals = {name: totals[name] + more[name] for name in totals}
+    return totals
+
+def route_plan(samples: dict) -> list:
+    """(endpoint, method, path, request kwargs) for every route, in a safe order"""
+    period = datetime.now().strftime('%Y%m')
+    assessment = {'patient_id': samples['patient_id'], 'name': 'Harness Patient', 'dob': '1994-02-01',
+                  'gestation_weeks': '32', 'systolic_bp': '152', 'diastolic_bp': '101', 'urine_protein': '2',
+                  'symptoms': ['severe_headache']}
+    return [
+        ('login', 'GET', '/login', {}),
+        ('dashboard', 'GET', '/', {}),
+        ('list_patients', 'GET', '/patients', {}),
+        ('list_patients', 'GET', '/patients?sort=risk', {}),
+        ('patient_profile', 'GET', f"/patient/{samples['patient_id']}", {}),
+        ('api_visit_details', 'GET', f"/api/visit/{samples['visit_id']}", {}),
+        ('api_bp_series', 'GET', f"/api/patient/{samples['patient_id']}/bp-series", {}),
+        ('list_alerts', 'GET', '/alerts', {}),
+        ('reports', 'GET', '/reports', {}),
+        ('api_clinical_counts', 'GET', '/api/cohorts/clinical-counts', {}),
+        ('api_cohort_query', 'POST', '/api/cohorts/query',
+         {'json': {'query': {'and': [{'field': 'trimester', 'value': 3},
+                                     {'field': 'risk_level', 'at_least': 'MODERATE'}]}}}),
+        ('outreach', 'GET', '/outreach?risk_level=HIGH&min_days_since_visit=14', {}),
+        ('api_outreach', 'GET', '/api/cohorts/outreach?village=Kangema&risk_level=MODERATE', {}),
+        ('followups', 'GET', '/followups?days=7', {}),
+        ('digest_preview', 'GET', '/reports/digest', {}),
+        ('dhis2_export', 'GET', f"/reports/dhis2/{period}", {}),
+        ('dhis2_refresh', 'POST', f"/reports/dhis2/{period}/refresh", {}),
+        ('query_reports', 'GET', '/admin/queries', {}),
+        ('prometheus_metrics', 'GET', '/metrics', {}),
+        ('handle_errors', 'GET', '/error/harness', {}),
+        ('template_fallback', 'GET', '/template-fallback', {}),
+        ('add_patient', 'GET', '/add-patient', {}),
+        ('assess_patient', 'GET', '/assess', {}),
+        ('assess_patient', 'POST', '/assess', {'data': assessment}),
+        ('acknowledge_alert', 'POST', lambda: f"/alerts/{samples['open_alerts'].pop()}/acknowledge", {}),
+        ('resolve_alert', 'POST', lambda: f"/alerts/{samples['open_alerts'].pop()}/resolve", {}),
+    ]
+
+def run_routes(app, clients: dict, plan: list, repeat: int) -> list:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    counter = {'queries': 0}
+
+    def count(*args):
+        counter['queries'] += 1
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    results = []
+    try:
+        for endpoint, method, path, kwargs in plan:
+            timings, queries, status = [], [], None
+            for attempt in range(repeat + 1):
+                url = path() if callable(path) else path
+                counter['queries'] = 0
+                started = time.perf_counter()
+                client = clients['county' if endpoint in COUNTY_ENDPOINTS else 'doctor']
+                response = client.open(url, method=method, **kwargs)
+                elapsed = (time.perf_counter() - started) * 1000
+                status = response.status_code
+                if attempt:  # First call warms caches and is not timed
+                    timings.append(elapsed)
+                    queries.append(counter['queries'])
+
+            view = app.view_functions[endpoint]
+            query_string = url.partition('?')[2]
+            results.append({
+                'route': f"{method} {url}",
+                # Ids in the URL depend on the data, so baselines are keyed by endpoint
+                'key': f"{method} {endpoint}" + (f"?{query_string}" if query_string else ''),
+                'endpoint': endpoint,
+                'status': status,
+                'queries': max(queries),
+                'budget': getattr(view, 'query_budget', HARNESS_QUERY_BUDGETS.get(endpoint)),
+                'median_ms': round(statistics.median(timings), 2)
+            })
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count)
+    return results
+
+def compare(results: list, baseline: dict, tolerance: float, slack_ms: float) -> bool:
+    ok = True
+    header = f"{'Route':<58} {'Status':>6} {'Queries':>8} {'Budget':>6} {'Median ms':>10} {'Base ms':>9} {'Change':>8}  Result"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        problems = []
+        if result['status'] >= 500:
+            problems.append('error')
+        if result['budget'] is not None and result['queries'] > result['budget']:
+            problems.append('queries')
+
+        base = baseline.get(result['key'])
+        change = ''
+        if base:
+            change = f"{(result['median_ms'] - base['median_ms']) / base['median_ms'] * 100:+.0f}%" if base['median_ms'] else ''
+            if result['median_ms'] > base['median_ms'] * (1 + tolerance) + slack_ms:
+                problems.append('latency')
+
+        ok = ok and not problems
+        print(f"{result['route'][:58]:<58} {result['status']:>6} {result['queries']:>8} "
+              f"{'' if result['budget'] is None else result['budget']:>6} {result['median_ms']:>10.2f} "
+              f"{base['median_ms'] if base else '-':>9} {change:>8}  {'❌ ' + ', '.join(problems) if problems else '✅'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Check every dashboard route against query and latency budgets')
+    parser.add_argument('--db', default='perf_harness.db', help='SQLite file to seed and test against')
+    parser.add_argument('--patients', type=int, default=50000)
+    parser.add_argument('--visits', type=int, default=300000, help='Seed at least this many visits')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reseed', action='store_true', help='Rebuild the data even if the database is already seeded')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed calls per route (median is reported)')
+    parser.add_argument('--baseline', default='perf_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='Record this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown over baseline (0.25 = 25%%)')
+    parser.add_argument('--slack-ms', type=float, default=5.0, help='Absolute slack so tiny routes do not flap')
+    args = parser.parse_args()
+
+    # Must be set before the dashboard module configures the database
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(args.db)}"
+    os.environ.pop('QUERY_INSPECTOR', None)
+
+    import muranga_dashboard as dashboard
+    from src.database import db, create_schema, Patient, ANCVisit, Alert
+
+    app = dashboard.app
+    with app.app_context():
+        create_schema()
+        dashboard.create_default_users()
+        if args.reseed or ANCVisit.query.count() < args.visits or Patient.query.count() < args.patients:
+            seed_database(args.patients, args.visits, args.seed)
+        dataset = {'patients': Patient.query.count(), 'visits': ANCVisit.query.count(), 'alerts': Alert.query.count()}
+        # Latencies are only comparable on a dataset of the size asked for, and of the baseline's size
+        if dataset['patients'] < args.patients or dataset['visits'] < args.visits:
+            print(f"❌ Dataset too small: {dataset['patients']} patients, {dataset['visits']} visits "
+                  f"(wanted {args.patients} and {args.visits})")
+            return 1
+        dashboard.build_cohort_index()
+
+        # Sampled from the harness user's facility, which their requests are scoped to
+        facility = dashboard.User.query.filter_by(username='doctor1').one().facility
+        busiest = db.session.query(ANCVisit.patient_id).join(Patient, Patient.patient_id == ANCVisit.patient_id).filter(
+            Patient.facility == facility).group_by(ANCVisit.patient_id).order_by(db.func.count().desc()).limit(1).scalar()
+        samples = {
+            'patient_id': busiest,
+            'visit_id': ANCVisit.query.filter_by(patient_id=busiest).first().id,
+            'open_alerts': [row[0] for row in db.session.query(Alert.id).filter(
+                Alert.resolved == db.false(), Alert.facility == facility
+            ).order_by(Alert.id.desc()).limit(2 * (args.repeat + 1))]
+        }
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved.get('patients', 0) < args.patients or saved.get('visits', 0) < args.visits:
+            print(f"❌ Baseline was recorded on {saved.get('patients')} patients, {saved.get('visits')} visits; "
+                  f"re-record it with --save-baseline")
+            return 1
+        baseline = saved['routes']
+
+    clients = {}
+    for role, (username, password) in {'doctor': ('doctor1', 'doctor123'), 'county': ('county1', 'county123')}.items():
+        clients[role] = app.test_client()
+        clients[role].post('/login', data={'username': username, 'password': password})
+
+    plan = route_plan(samples)
+    covered = {endpoint for endpoint, *_ in plan}
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint not in covered and rule.endpoint not in SKIPPED_ENDPOINTS:
+            print(f"⚠️ Route not exercised: {rule.rule} ({rule.endpoint})")
+
+    results = run_routes(app, clients, plan, args.repeat)
+
+    ok = compare(results, baseline, args.tolerance, args.slack_ms)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'created_at': datetime.now().isoformat(), **dataset,
+                       'routes': {r['key']: r for r in results}}, f, indent=2)
+        print(f"✅ Baseline saved to {args.baseline}")
+
+    print("✅ All routes within budget" if ok else "❌ Budget regressions found")
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,41 +1,21 @@
-# reset_database.py - Fixed import error
-from muranga_dashboard import app, db
-from src.database import Patient, ANCVisit, Alert
-from muranga_dashboard import User  # Import User from the main app
-from datetime import datetime
+# reset_database.py - Drop every table and rebuild the demo database: `flask init-db` plus `seed-demo`
+from muranga_dashboard import app, db, create_default_users, create_test_alerts
+from src.database import create_schema
+from src.sharding import SHARDED_TABLES, shard_map
 
 def reset_database():
     with app.app_context():
-        # Drop all tables
+        # Drop all tables, in the main database and every facility database
         db.drop_all()
-        
-        # Recreate all tables with new schema
-        db.create_all()
-        
-        print("✅ Database tables created successfully!")
-        
-        # Recreate default users
-        from muranga_dashboard import create_default_users
+        shards = shard_map()
+        for key in (shards.keys() if shards else []):
+            db.metadata.drop_all(bind=shards.engine(key), tables=[db.metadata.tables[name] for name in SHARDED_TABLES])
+
+        # The same steps as `flask --app muranga_dashboard init-db` and `seed-demo`
+        create_schema()
         create_default_users()
-        
-        # Add a sample patient to test the new schema
-        try:
-            sample_patient = Patient(
-                patient_id="MUR001",
-                name="Test Patient",
-                dob=datetime(1990, 5, 15).date(),
-                gestation_weeks=24,
-                phone="0720123456",
-                village="Murang'a Town",
-                registered_date=datetime.utcnow()
-            )
-            db.session.add(sample_patient)
-            db.session.commit()
-            print("✅ Sample patient added with phone and village fields!")
-        except Exception as e:
-            print(f"⚠️ Could not add sample patient: {e}")
-            db.session.rollback()
+    create_test_alerts()
 
 if __name__ == '__main__':
     reset_database()
-    print("✅ Database reset completed!")
\ No newline at end of file
+    print("✅ Database reset completed!")
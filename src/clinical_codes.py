@@ -0,0 +1,70 @@
+# src/clinical_codes.py - Stable bit codes for ANC symptoms and medical history
+#
+# Bit positions are stored in the database. Append new codes at the end and never
+# renumber or reuse a position.
+
+SYMPTOM_CODES = {
+    'severe_headache': 0,
+    'visual_disturbances': 1,
+    'upper_abdominal_pain': 2,
+    'nausea_vomiting': 3,
+    'swelling_face_hands': 4,
+    'shortness_of_breath': 5,
+    'decreased_urine': 6,
+    'chest_pain': 7,
+    'vaginal_bleeding': 8,
+    'fever': 9,
+    'dizziness': 10,
+    'fatigue': 11,
+}
+
+HISTORY_CODES = {
+    'previous_preeclampsia': 0,
+    'chronic_hypertension': 1,
+    'diabetes': 2,
+    'kidney_disease': 3,
+    'autoimmune_disease': 4,
+    'multiple_pregnancy': 5,
+    'first_pregnancy': 6,
+    'family_history': 7,
+    'obesity': 8,
+    'age_under_20': 9,
+    'age_over_35': 10,
+    'ivf_pregnancy': 11,
+}
+
+# Older spellings still found in stored JSON and free-text sources
+SYMPTOM_ALIASES = {
+    'epigastric_pain': 'upper_abdominal_pain',
+    'decreased_urine_output': 'decreased_urine',
+}
+
+def _normalize(value: str) -> str:
+    return value.strip().lower().replace(' ', '_')
+
+def encode_flags(values, codes: dict, aliases: dict = None) -> int:
+    """Turn a list of code names into a bitmask; unknown names are ignored"""
+    flags = 0
+    for value in values or []:
+        name = _normalize(value)
+        name = (aliases or {}).get(name, name)
+        if name in codes:
+            flags |= 1 << codes[name]
+    return flags
+
+def decode_flags(flags: int, codes: dict) -> list:
+    """Turn a bitmask back into code names, in code order"""
+    flags = flags or 0
+    return [name for name, bit in codes.items() if flags & (1 << bit)]
+
+def encode_symptoms(values) -> int:
+    return encode_flags(values, SYMPTOM_CODES, SYMPTOM_ALIASES)
+
+def encode_history(values) -> int:
+    return encode_flags(values, HISTORY_CODES)
+
+def symptom_bit(name: str) -> int:
+    return 1 << SYMPTOM_CODES[name]
+
+def history_bit(name: str) -> int:
+    return 1 << HISTORY_CODES[name]
\ No newline at end of file
@@ -0,0 +1,201 @@
+# src/cohort_index.py - In-process bitmap index over each patient's latest-visit state
+import threading
+import time
+
+from .clinical_codes import HISTORY_CODES, SYMPTOM_CODES
+
+RISK_LEVELS = ['LOW', 'MODERATE', 'HIGH', 'CRITICAL']
+
+def normalize_risk_level(risk_level) -> str:
+    """'Moderate Risk' / 'MODERATE' -> 'MODERATE'; no visit yet -> 'UNASSESSED'"""
+    level = (risk_level or '').split(' ')[0].upper()
+    return level if level in RISK_LEVELS else 'UNASSESSED'
+
+def trimester(gestation_weeks) -> int:
+    if gestation_weeks is None:
+        return 0
+    if gestation_weeks < 14:
+        return 1
+    if gestation_weeks < 28:
+        return 2
+    return 3
+
+class Q:
+    """
+    Cohort expression. Values within one Q are OR'ed; combine with & | ~.
+
+        Q('history', 'first_pregnancy') & Q('trimester', 3) & Q('risk_level', 'MODERATE', 'HIGH', 'CRITICAL')
+    """
+    def __init__(self, field=None, *values, op=None, children=()):
+        self.field = field
+        self.values = values
+        self.op = op
+        self.children = children
+
+    def __and__(self, other):
+        return Q(op='and', children=(self, other))
+
+    def __or__(self, other):
+        return Q(op='or', children=(self, other))
+
+    def __invert__(self):
+        return Q(op='not', children=(self,))
+
+    @classmethod
+    def from_json(cls, expr: dict):
+        """
+        Build from {"and": [...]}, {"or": [...]}, {"not": {...}},
+        {"field": "village", "in": ["Kiharu"]} or {"field": "risk_level", "at_least": "MODERATE"}
+        """
+        if 'and' in expr:
+            return cls(op='and', children=tuple(cls.from_json(child) for child in expr['and']))
+        if 'or' in expr:
+            return cls(op='or', children=tuple(cls.from_json(child) for child in expr['or']))
+        if 'not' in expr:
+            return cls(op='not', children=(cls.from_json(expr['not']),))
+        if 'at_least' in expr:
+            if expr.get('field') != 'risk_level':
+                raise ValueError("'at_least' only applies to risk_level")
+            minimum = RISK_LEVELS.index(expr['at_least'].upper())
+            return cls('risk_level', *RISK_LEVELS[minimum:])
+        if 'field' in expr:
+            values = expr.get('in', [expr.get('value')])
+            return cls(expr['field'], *values)
+        raise ValueError(f"Invalid cohort expression: {expr}")
+
+class CohortBitmapIndex:
+    FIELDS = ('risk_level', 'trimester', 'village', 'facility', 'symptom', 'history')
+
+    def __init__(self, refresh_interval: float = None):
+        self.refresh_interval = refresh_interval
+        self.built_at = None
+        self._lock = threading.RLock()
+        self._slots = {}  # patient_id -> bit position
+        self._patient_ids = []  # bit position -> patient_id
+        self._state = {}  # bit position -> [(field, value), ...] currently set
+        self._bitmaps = {}  # (field, value) -> int used as a bitset
+        self._all = 0
+
+    @staticmethod
+    def _keys(risk_level, gestation_weeks, village, facility, symptom_flags, history_flags) -> list:
+        keys = [
+            ('risk_level', normalize_risk_level(risk_level)),
+            ('trimester', trimester(gestation_weeks)),
+            ('village', (village or '').strip().lower()),
+            ('facility', facility or ''),
+        ]
+        symptom_flags = symptom_flags or 0
+        history_flags = history_flags or 0
+        keys += [('symptom', name) for name, bit in SYMPTOM_CODES.items() if symptom_flags & (1 << bit)]
+        keys += [('history', name) for name, bit in HISTORY_CODES.items() if history_flags & (1 << bit)]
+        return keys
+
+    def build(self, rows):
+        """
+        Rebuild from (patient_id, risk_level, gestation_weeks, village, facility,
+        symptom_flags, history_flags) rows. Bits are set in bytearrays and turned
+        into ints once, so the build is linear in the number of patients.
+        """
+        slots = {}
+        patient_ids = []
+        state = {}
+        buffers = {}
+
+        for row in rows:
+            patient_id = row[0]
+            slot = slots.setdefault(patient_id, len(patient_ids))
+            if slot == len(patient_ids):
+                patient_ids.append(patient_id)
+            keys = self._keys(*row[1:])
+            state[slot] = keys
+            for key in keys:
+                buffer = buffers.get(key)
+                if buffer is None:
+                    buffer = buffers[key] = bytearray((len(patient_ids) + 7) // 8 + 1024)
+                if slot // 8 >= len(buffer):
+                    buffer.extend(bytearray(slot // 8 - len(buffer) + 1024))
+                buffer[slot // 8] |= 1 << (slot % 8)
+
+        bitmaps = {key: int.from_bytes(buffer, 'little') for key, buffer in buffers.items()}
+
+        with self._lock:
+            self._slots = slots
+            self._patient_ids = patient_ids
+            self._state = state
+            self._bitmaps = bitmaps
+            self._all = (1 << len(patient_ids)) - 1
+            self.built_at = time.monotonic()
+
+        print(f"✅ Cohort index built: {len(patient_ids)} patients, {len(bitmaps)} bitmaps")
+
+    def is_stale(self) -> bool:
+        if self.built_at is None:
+            return True
+        return self.refresh_interval is not None and time.monotonic() - self.built_at > self.refresh_interval
+
+    def update_patient(self, patient_id, risk_level=None, gestation_weeks=None, village=None,
+                       facility=None, symptom_flags=0, history_flags=0):
+        """Move one patient to their new latest-visit state"""
+        keys = self._keys(risk_level, gestation_weeks, village, facility, symptom_flags, history_flags)
+
+        with self._lock:
+            slot = self._slots.get(patient_id)
+            if slot is None:
+                slot = self._slots[patient_id] = len(self._patient_ids)
+                self._patient_ids.append(patient_id)
+                self._all |= 1 << slot
+
+            bit = 1 << slot
+            for key in self._state.get(slot, []):
+                self._bitmaps[key] &= ~bit
+            for key in keys:
+                self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+            self._state[slot] = keys
+
+    def _evaluate(self, query: Q) -> int:
+        if query.op == 'and':
+            result = self._all
+            for child in query.children:
+                result &= self._evaluate(child)
+            return result
+        if query.op == 'or':
+            result = 0
+            for child in query.children:
+                result |= self._evaluate(child)
+            return result
+        if query.op == 'not':
+            return self._all & ~self._evaluate(query.children[0])
+
+        if query.field not in self.FIELDS:
+            raise ValueError(f"Unknown cohort field: {query.field}")
+        result = 0
+        for value in query.values:
+            if query.field == 'village':
+                value = (value or '').strip().lower()
+            elif query.field == 'risk_level':
+                value = normalize_risk_level(value)
+            elif query.field == 'trimester':
+                value = int(value)
+            result |= self._bitmaps.get((query.field, value), 0)
+        return result
+
+    def count(self, query: Q) -> int:
+        with self._lock:
+            return self._evaluate(query).bit_count()
+
+    def patient_ids(self, query: Q, limit: int = None) -> list:
+        with self._lock:
+            bits = self._evaluate(query)
+            patient_ids = self._patient_ids
+            result = []
+            while bits and (limit is None or len(result) < limit):
+                lowest = bits & -bits
+                result.append(patient_ids[lowest.bit_length() - 1])
+                bits ^= lowest
+            return result
+
+    def values(self, field: str) -> dict:
+        """Count of patients for every value of a field, e.g. per village"""
+        with self._lock:
+            return {value: bitmap.bit_count() for (name, value), bitmap in self._bitmaps.items()
+                    if name == field and bitmap}
\ No newline at end of file
@@ -0,0 +1,205 @@
+# src/cohort_query.py - Outreach cohort filters compiled to parameterized, index-backed SQL
+import csv
+import io
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, select
+
+from .clinical_codes import HISTORY_CODES, SYMPTOM_CODES
+from .database import db, Patient, ANCVisit, has_history, has_symptom
+from .facility_scope import scoped
+from .hypertension_ai import PregnancyRiskLevel
+from .sharding import current_shard, shard_keys, shard_map, using_shard
+
+# Filters that can lead an index on patients/anc_visits. At least one is required,
+# otherwise the query would read every patient in the county.
+INDEXED_FILTERS = ('village', 'facility', 'risk_levels', 'gestation_min', 'gestation_max',
+                   'min_days_since_visit', 'max_days_since_visit')
+
+FILTER_FIELDS = INDEXED_FILTERS + ('symptoms', 'history')
+
+CSV_COLUMNS = ['patient_id', 'name', 'phone', 'village', 'facility', 'gestation_weeks',
+               'last_visit_date', 'days_since_visit', 'risk_level', 'last_bp']
+
+class CohortQueryError(ValueError):
+    pass
+
+def risk_level_values(levels) -> list:
+    """Stored risk level strings for names like 'MODERATE'"""
+    values = []
+    for level in levels:
+        try:
+            values.append(PregnancyRiskLevel[level.upper()].value)
+        except KeyError:
+            raise CohortQueryError(f"Unknown risk level: {level}")
+    return values
+
+class CohortQueryBuilder:
+    """
+    Structured outreach filters, e.g.
+
+        {'gestation_min': 28, 'risk_levels': ['MODERATE'], 'village': 'Kiharu', 'min_days_since_visit': 14}
+
+    Results are keyset-paged on Patient.id, which every SQLite index already ends with.
+    County users on a sharded install page through each facility database in turn.
+    """
+    def __init__(self, filters: dict, allow_scan: bool = False, now: datetime = None):
+        unknown = set(filters) - set(FILTER_FIELDS)
+        if unknown:
+            raise CohortQueryError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+        self.filters = {key: value for key, value in filters.items() if value not in (None, '', [])}
+        self.allow_scan = allow_scan
+        self.now = now or datetime.now()
+        self.warnings = []
+
+        if not allow_scan and not any(key in self.filters for key in INDEXED_FILTERS):
+            raise CohortQueryError(
+                "Add at least one of village, facility, risk level, gestation or days since visit - "
+                "symptom and history filters alone would scan every patient"
+            )
+
+    def _conditions(self) -> list:
+        f = self.filters
+        today = self.now.date()
+        conditions = []
+
+        if 'village' in f:
+            conditions.append(Patient.village == f['village'])
+        if 'facility' in f:
+            conditions.append(Patient.facility == f['facility'])
+        if 'risk_levels' in f:
+            conditions.append(Patient.last_risk_level.in_(risk_level_values(f['risk_levels'])))
+        # Gestation today = weeks since estimated LMP, so a gestation range is an LMP date range
+        if 'gestation_min' in f:
+            conditions.append(Patient.lmp_date <= today - timedelta(weeks=int(f['gestation_min'])))
+        if 'gestation_max' in f:
+            conditions.append(Patient.lmp_date > today - timedelta(weeks=int(f['gestation_max']) + 1))
+        if 'min_days_since_visit' in f:
+            conditions.append(Patient.last_visit_date <= self.now - timedelta(days=int(f['min_days_since_visit'])))
+        if 'max_days_since_visit' in f:
+            conditions.append(Patient.last_visit_date >= self.now - timedelta(days=int(f['max_days_since_visit'])))
+        for name in f.get('symptoms', []):
+            if name not in SYMPTOM_CODES:
+                raise CohortQueryError(f"Unknown symptom: {name}")
+            conditions.append(has_symptom(name))
+        for name in f.get('history', []):
+            if name not in HISTORY_CODES:
+                raise CohortQueryError(f"Unknown history factor: {name}")
+            conditions.append(has_history(name))
+
+        return conditions
+
+    def compile(self, after_id: int = 0, limit: int = None):
+        query = select(
+            Patient.id, Patient.patient_id, Patient.name, Patient.phone, Patient.village,
+            Patient.facility, Patient.lmp_date, Patient.gestation_weeks, Patient.last_visit_date,
+            Patient.last_risk_level, Patient.last_systolic_bp, Patient.last_diastolic_bp
+        ).select_from(Patient).outerjoin(
+            ANCVisit, ANCVisit.id == Patient.last_visit_id
+        ).where(and_(Patient.id > after_id, *self._conditions())).order_by(Patient.id)
+
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    def explain(self) -> list:
+        """SQLite query plan lines for the compiled query, limited to the user's facility as page() is"""
+        compiled = scoped(self.compile(limit=1)).compile(dialect=db.engine.dialect,
+                                                         compile_kwargs={"render_postcompile": True})
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        return [row[-1] for row in rows]
+
+    def check_plan(self) -> list:
+        """Refuse plans that scan a whole table; warn when patients are walked in id order"""
+        plan = self.explain()
+        # "SCAN t USING [COVERING] INDEX ..." reads an index, not the table
+        scans = [line for line in plan if line.startswith('SCAN ') and ' USING ' not in line]
+        if scans:
+            message = f"Query plan scans a full table: {'; '.join(scans)}"
+            if not self.allow_scan:
+                raise CohortQueryError(message + " - narrow the filters")
+            self.warnings.append(message)
+
+        walks = [line for line in plan if line.startswith('SEARCH patients USING INTEGER PRIMARY KEY (rowid>?)')]
+        if walks:
+            self.warnings.append(
+                "The database chose to walk patients in ID order for these filters; "
+                "adding a village, facility or risk level filter will make this list faster"
+            )
+        return self.warnings
+
+    def _row_dict(self, row, shard=None) -> dict:
+        gestation = (self.now.date() - row.lmp_date).days // 7 if row.lmp_date else row.gestation_weeks
+        return {
+            'id': row.id,
+            'shard': shard,
+            'patient_id': row.patient_id,
+            'name': row.name,
+            'phone': row.phone or '',
+            'village': row.village or '',
+            'facility': row.facility or '',
+            'gestation_weeks': gestation,
+            'last_visit_date': row.last_visit_date.strftime('%Y-%m-%d') if row.last_visit_date else '',
+            'days_since_visit': (self.now - row.last_visit_date).days if row.last_visit_date else '',
+            'risk_level': row.last_risk_level or 'Not assessed',
+            'last_bp': f"{row.last_systolic_bp}/{row.last_diastolic_bp}" if row.last_systolic_bp else ''
+        }
+
+    @staticmethod
+    def databases() -> list:
+        """Shard keys the cohort is read from: all of them for an unpinned county user, else this one"""
+        if shard_map() is not None and current_shard() is None:
+            return shard_keys()
+        return [current_shard()]
+
+    @staticmethod
+    def _parse_cursor(after) -> tuple:
+        try:
+            if isinstance(after, str) and ':' in after:
+                index, after_id = after.split(':', 1)
+                return int(index), int(after_id)
+            return 0, int(after or 0)
+        except ValueError:
+            raise CohortQueryError(f"Invalid cursor: {after}")
+
+    def page(self, after=0, limit: int = 50):
+        """
+        One page of patients and the cursor for the next page (None at the end). Ids
+        repeat across facility databases, so there the cursor is "<database>:<id>".
+        """
+        if limit < 1:
+            raise CohortQueryError("Page size must be at least 1")
+        databases = self.databases()
+        index, after_id = self._parse_cursor(after)
+
+        # One row past the page, from whichever database has it, says whether there is more
+        rows = []
+        while index < len(databases) and len(rows) <= limit:
+            with using_shard(databases[index]):
+                rows += [(index, row) for row in db.session.execute(self.compile(after_id, limit + 1 - len(rows)))]
+            index, after_id = index + 1, 0
+
+        next_cursor = None
+        if len(rows) > limit:
+            last_index, last = rows[limit - 1]
+            next_cursor = last.id if len(databases) == 1 else f"{last_index}:{last.id}"
+        return [self._row_dict(row, databases[i]) for i, row in rows[:limit]], next_cursor
+
+    def stream_csv(self, batch_size: int = 1000):
+        """Yield CSV text in keyset-paged batches so memory stays flat for any cohort size"""
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        yield buffer.getvalue()
+
+        cursor = 0
+        while True:
+            rows, cursor = self.page(cursor, batch_size)
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            if cursor is None:
+                break
\ No newline at end of file
@@ -1,8 +1,14 @@
 # src/database.py - Updated with complete Patient model
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
+import os
 
-db = SQLAlchemy()
+from .clinical_codes import encode_history, encode_symptoms, history_bit, symptom_bit
+from .replicas import init_read_replica
+from .sharding import RoutingSQLAlchemy, SHARDED_TABLES, shard_map, using_shard
+
+# Sessions send clinical tables to a facility's own file when SHARD_DIR is set
+db = RoutingSQLAlchemy()
 
 class Patient(db.Model):
     __tablename__ = 'patients'
@@ -14,34 +20,107 @@ class Patient(db.Model):
     gender = db.Column(db.String(10), default='female')
     gestation_weeks = db.Column(db.Integer, nullable=False)
     phone = db.Column(db.String(15))  # Added phone field
-    village = db.Column(db.String(100))  # Added village field
+    village = db.Column(db.String(100), index=True)  # Added village field
+    facility = db.Column(db.String(100), index=True)  # Home facility; facility users only see their own patients
     registered_date = db.Column(db.DateTime, default=datetime.utcnow)
+    lmp_date = db.Column(db.Date, index=True)  # Estimated LMP, so "weeks pregnant today" is a range filter
+    
+    # Latest-visit snapshot, kept current by record_visit() so list views need no visit queries
+    last_visit_id = db.Column(db.Integer, index=True)
+    last_visit_date = db.Column(db.DateTime, index=True)
+    last_systolic_bp = db.Column(db.Integer)
+    last_diastolic_bp = db.Column(db.Integer)
+    last_urine_protein = db.Column(db.Integer)
+    last_risk_level = db.Column(db.String(50))
+    last_risk_score = db.Column(db.Float, index=True)
     
     # Relationship with visits
     visits = db.relationship('ANCVisit', backref='patient', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (
+        db.Index('ix_patients_last_risk_level_last_visit_date', 'last_risk_level', 'last_visit_date'),
+        # Facility-scoped list views; the single-column facility index serves id order
+        db.Index('ix_patients_facility_last_visit_date', 'facility', 'last_visit_date'),
+        db.Index('ix_patients_facility_last_risk_score', 'facility', 'last_risk_score'),
+        db.Index('ix_patients_facility_last_risk_level_last_visit_date', 'facility', 'last_risk_level', 'last_visit_date'),
+    )
+    
+    def set_gestation(self, gestation_weeks: int, as_of: datetime):
+        self.gestation_weeks = gestation_weeks
+        self.lmp_date = (as_of - timedelta(weeks=gestation_weeks)).date()
+    
+    @property
+    def current_gestation_weeks(self):
+        if not self.lmp_date:
+            return self.gestation_weeks
+        return (datetime.now().date() - self.lmp_date).days // 7
+    
+    def record_visit(self, visit):
+        """Copy a new visit into the snapshot (call after flush so visit.id is set)"""
+        if self.last_visit_date and visit.visit_date < self.last_visit_date:
+            return
+        self.last_visit_id = visit.id
+        self.last_visit_date = visit.visit_date
+        self.last_systolic_bp = visit.systolic_bp
+        self.last_diastolic_bp = visit.diastolic_bp
+        self.last_urine_protein = visit.urine_protein
+        self.last_risk_level = visit.risk_level
+        self.last_risk_score = visit.risk_score
+        self.set_gestation(visit.gestation_weeks, visit.visit_date)
+    
     def __repr__(self):
         return f'<Patient {self.patient_id}: {self.name}>'
 
+@db.event.listens_for(Patient, 'before_insert')
+def _set_initial_lmp(mapper, connection, patient):
+    if patient.lmp_date is None and patient.gestation_weeks is not None:
+        patient.set_gestation(patient.gestation_weeks, patient.registered_date or datetime.utcnow())
+
+def risk_status(risk_level) -> str:
+    """Map a stored risk level ('Moderate Risk', 'HIGH', ...) to normal/warning/critical"""
+    level = (risk_level or '').split(' ')[0].upper()
+    if level == 'LOW':
+        return 'normal'
+    if level == 'MODERATE':
+        return 'warning'
+    return 'critical' if level else 'unknown'
+
 class ANCVisit(db.Model):
     __tablename__ = 'anc_visits'
     
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.String(20), db.ForeignKey('patients.patient_id'), nullable=False)
-    visit_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    patient_id = db.Column(db.String(20), db.ForeignKey('patients.patient_id'), nullable=False, index=True)
+    visit_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    facility = db.Column(db.String(100))  # Facility of the assessing user
+    visit_number = db.Column(db.Integer)  # 1 = ANC first visit, 4 = ANC 4th visit
     gestation_weeks = db.Column(db.Integer, nullable=False)
     systolic_bp = db.Column(db.Integer, nullable=False)
     diastolic_bp = db.Column(db.Integer, nullable=False)
     urine_protein = db.Column(db.Integer, nullable=False)
-    symptoms = db.Column(db.Text)  # JSON string of symptoms
-    medical_history = db.Column(db.Text)  # JSON string of medical history
+    symptoms = db.Column(db.Text)  # Legacy JSON list, superseded by symptom_flags
+    medical_history = db.Column(db.Text)  # Legacy JSON list, superseded by history_flags
+    symptom_flags = db.Column(db.Integer, default=0)  # Bitmask of clinical_codes.SYMPTOM_CODES
+    history_flags = db.Column(db.Integer, default=0)  # Bitmask of clinical_codes.HISTORY_CODES
     risk_score = db.Column(db.Float, nullable=False)
     risk_level = db.Column(db.String(20), nullable=False)
     recommendation = db.Column(db.Text, nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_anc_visits_facility_visit_date', 'facility', 'visit_date'),
+        # Covering index: symptom/history counts over a date range never touch the table
+        db.Index('ix_anc_visits_visit_date_flags', 'visit_date', 'symptom_flags', 'history_flags'),
+    )
+    
     def __repr__(self):
         return f'<ANCVisit {self.patient_id} - {self.visit_date}>'
 
+def has_symptom(name: str):
+    """SQL filter for visits that reported a symptom, e.g. has_symptom('visual_disturbances')"""
+    return ANCVisit.symptom_flags.op('&')(symptom_bit(name)) != 0
+
+def has_history(name: str):
+    return ANCVisit.history_flags.op('&')(history_bit(name)) != 0
+
 class Alert(db.Model):
     __tablename__ = 'alerts'
     
@@ -53,15 +132,383 @@ class Alert(db.Model):
     risk_factors = db.Column(db.Text)  # JSON string of risk factors
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     resolved = db.Column(db.Boolean, default=False)
+    facility = db.Column(db.String(100))
+    acknowledged_at = db.Column(db.DateTime)
+    acknowledged_by = db.Column(db.String(100))
+    resolved_at = db.Column(db.DateTime)
+    resolved_by = db.Column(db.String(100))
+    escalation_level = db.Column(db.Integer, default=0)  # Index into ESCALATION_ROLES
+    next_escalation_at = db.Column(db.DateTime)  # NULL once resolved or at the top of the chain
+    
+    __table_args__ = (
+        # Only open alerts are ever read for escalation, so keep resolved ones out of the index
+        db.Index('ix_alerts_open_next_escalation_at', 'next_escalation_at', sqlite_where=db.text('resolved = 0')),
+        db.Index('ix_alerts_open_facility_priority', 'facility', 'priority', sqlite_where=db.text('resolved = 0')),
+        db.Index('ix_alerts_facility_created_at', 'facility', 'created_at'),
+    )
+    
+    @property
+    def escalated_to(self) -> str:
+        return ESCALATION_ROLES[min(self.escalation_level or 0, len(ESCALATION_ROLES) - 1)]
+    
+    def can_be_resolved_by(self, role: str) -> bool:
+        """Only the role the alert has escalated to, or one above it, may close it"""
+        return role in ESCALATION_ROLES and ESCALATION_ROLES.index(role) >= ESCALATION_ROLES.index(self.escalated_to)
     
     def __repr__(self):
         return f'<Alert {self.patient_id} - {self.priority}>'
 
+# Who is notified at each escalation level
+ESCALATION_ROLES = ['nurse', 'doctor', 'county']
+
+# How long an alert may stay unresolved before the next role is notified.
+# Priorities not listed here never escalate.
+ESCALATION_DEADLINES = {
+    'CRITICAL': timedelta(minutes=15),
+    'HIGH': timedelta(hours=1),
+    'MEDIUM': timedelta(hours=4),
+}
+
+@db.event.listens_for(Alert, 'before_insert')
+def _set_first_escalation(mapper, connection, alert):
+    deadline = ESCALATION_DEADLINES.get(alert.priority)
+    if alert.next_escalation_at is None and deadline and not alert.resolved:
+        alert.next_escalation_at = (alert.created_at or datetime.now()) + deadline
+
+class FollowUp(db.Model):
+    """A follow-up visit owed after an assessment, due by a time set from the risk level"""
+    __tablename__ = 'follow_ups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.String(20), db.ForeignKey('patients.patient_id'), nullable=False)
+    visit_id = db.Column(db.Integer, db.ForeignKey('anc_visits.id'), nullable=False)
+    facility = db.Column(db.String(100))
+    risk_level = db.Column(db.String(50), nullable=False)
+    reason = db.Column(db.Text, nullable=False)  # The visit's recommendation
+    due_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, COMPLETED, MISSED
+    completed_at = db.Column(db.DateTime)
+    completed_visit_id = db.Column(db.Integer)
+    missed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_follow_ups_status_due_at', 'status', 'due_at'),
+        db.Index('ix_follow_ups_facility_status_due_at', 'facility', 'status', 'due_at'),
+        db.Index('ix_follow_ups_patient_id_status', 'patient_id', 'status'),
+    )
+    
+    def __repr__(self):
+        return f'<FollowUp {self.patient_id} due {self.due_at} ({self.status})>'
+
+class NotificationOutbox(db.Model):
+    """A message waiting for (or past) delivery; written in the same transaction as its alert"""
+    __tablename__ = 'notification_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alerts.id'))
+    provider = db.Column(db.String(30), nullable=False)
+    recipient = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='PENDING')  # PENDING, SENDING, SENT, FAILED
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    claimed_at = db.Column(db.DateTime)  # Start of the SENDING lease
+    claimed_by = db.Column(db.String(100))  # Worker holding the lease
+    last_error = db.Column(db.Text)
+    receipt_id = db.Column(db.String(100))  # Provider's message id
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        db.Index('ix_notification_outbox_provider_status_next_attempt_at', 'provider', 'status', 'next_attempt_at'),
+        db.Index('ix_notification_outbox_alert_id', 'alert_id'),
+        db.Index('ix_notification_outbox_status_claimed_at', 'status', 'claimed_at'),
+    )
+    
+    def __repr__(self):
+        return f'<NotificationOutbox {self.id} to {self.recipient} ({self.status})>'
+
+class AlertEvent(db.Model):
+    """A live alert update for Server-Sent Events; every worker reads new rows into its stream buffer"""
+    __tablename__ = 'alert_events'
+
+    id = db.Column(db.Integer, primary_key=True)  # The SSE event id, shared by all workers
+    event_type = db.Column(db.String(50), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    facility = db.Column(db.String(100))  # NULL = every facility
+    roles = db.Column(db.Text)  # JSON list; NULL = every role
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<AlertEvent {self.id} {self.event_type}>'
+
+class DigestRun(db.Model):
+    """One row per daily digest; the unique date stops two workers sending the same digest"""
+    __tablename__ = 'digest_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest_date = db.Column(db.Date, unique=True, nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)
+    period_end = db.Column(db.DateTime, nullable=False)
+    facility_count = db.Column(db.Integer, default=0)
+    message_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    
+    def __repr__(self):
+        return f'<DigestRun {self.digest_date}>'
+
+class IndicatorRollup(db.Model):
+    """Monthly MOH 711 ANC indicator counts for one facility"""
+    __tablename__ = 'indicator_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    facility = db.Column(db.String(100), nullable=False)
+    period = db.Column(db.String(6), nullable=False)  # DHIS2 monthly period, e.g. 202410
+    total_visits = db.Column(db.Integer, nullable=False, default=0)
+    anc_first_visits = db.Column(db.Integer, nullable=False, default=0)
+    anc_fourth_visits = db.Column(db.Integer, nullable=False, default=0)
+    hypertension_cases = db.Column(db.Integer, nullable=False, default=0)
+    referrals = db.Column(db.Integer, nullable=False, default=0)  # Proxy: visits assessed Critical (refer immediately)
+    computed_at = db.Column(db.DateTime, default=datetime.now)  # Local time, like the period bounds
+    
+    __table_args__ = (
+        db.UniqueConstraint('facility', 'period', name='uq_indicator_rollups_facility_period'),
+    )
+    
+    def __repr__(self):
+        return f'<IndicatorRollup {self.facility} - {self.period}>'
+
+class NHIFClaimBatch(db.Model):
+    """One run of the month-end NHIF claims generator"""
+    __tablename__ = 'nhif_claim_batches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(6), nullable=False, index=True)  # YYYYMM
+    shard = db.Column(db.String(100), nullable=False, default='')  # Facility database the visits came from; '' = main
+    last_visit_id = db.Column(db.Integer, nullable=False, default=0)  # Highest visit id claimed so far in that database
+    claim_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    file_path = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NHIFClaimBatch {self.period} #{self.id}>'
+
+class NHIFClaim(db.Model):
+    __tablename__ = 'nhif_claims'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('nhif_claim_batches.id'), nullable=False, index=True)
+    shard = db.Column(db.String(100), nullable=False, default='')  # Visit ids repeat across facility databases
+    visit_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.String(20), nullable=False)
+    service_code = db.Column(db.String(20), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        # A visit can never be billed twice for the same service
+        db.UniqueConstraint('shard', 'visit_id', 'service_code', name='uq_nhif_claims_shard_visit_service'),
+    )
+    
+    def __repr__(self):
+        return f'<NHIFClaim {self.visit_id} - {self.service_code}>'
+
+# Visits recorded before facilities were tracked; patients and alerts inherit their facility
+LEGACY_FACILITY = os.environ.get('LEGACY_FACILITY', "Murang'a County Hospital")
+
+def assign_visit_facilities(facility: str = None) -> int:
+    """Give visits with no facility one, so facility-scoped users can see them"""
+    result = db.session.execute(db.text(
+        "UPDATE anc_visits SET facility = :facility WHERE facility IS NULL"
+    ), {'facility': facility or LEGACY_FACILITY})
+    return result.rowcount
+
+def _backfill_visit_numbers():
+    # Number each patient's visits in date order so ANC1/ANC4 become plain column filters
+    db.session.execute(db.text("""
+        UPDATE anc_visits SET visit_number = (
+            SELECT COUNT(*) FROM anc_visits AS earlier
+            WHERE earlier.patient_id = anc_visits.patient_id
+              AND (earlier.visit_date < anc_visits.visit_date
+                   OR (earlier.visit_date = anc_visits.visit_date AND earlier.id <= anc_visits.id))
+        )
+    """))
+
+def _backfill_latest_visits():
+    db.session.execute(db.text("""
+        UPDATE patients SET last_visit_id = (
+            SELECT id FROM anc_visits
+            WHERE anc_visits.patient_id = patients.patient_id
+            ORDER BY visit_date DESC, id DESC LIMIT 1
+        )
+    """))
+    db.session.execute(db.text("""
+        UPDATE patients SET
+            last_visit_date = (SELECT visit_date FROM anc_visits WHERE id = patients.last_visit_id),
+            last_systolic_bp = (SELECT systolic_bp FROM anc_visits WHERE id = patients.last_visit_id),
+            last_diastolic_bp = (SELECT diastolic_bp FROM anc_visits WHERE id = patients.last_visit_id),
+            last_urine_protein = (SELECT urine_protein FROM anc_visits WHERE id = patients.last_visit_id),
+            last_risk_level = (SELECT risk_level FROM anc_visits WHERE id = patients.last_visit_id),
+            last_risk_score = (SELECT risk_score FROM anc_visits WHERE id = patients.last_visit_id)
+        WHERE last_visit_id IS NOT NULL
+    """))
+
+def _backfill_clinical_flags():
+    # One-off decode of the legacy JSON lists into bitmasks, in chunks
+    last_id = 0
+    while True:
+        rows = db.session.execute(db.text(
+            "SELECT id, symptoms, medical_history FROM anc_visits WHERE id > :last_id ORDER BY id LIMIT 5000"
+        ), {'last_id': last_id}).fetchall()
+        if not rows:
+            break
+        db.session.execute(db.text(
+            "UPDATE anc_visits SET symptom_flags = :symptom_flags, history_flags = :history_flags WHERE id = :id"
+        ), [{
+            'id': row[0],
+            'symptom_flags': encode_symptoms(json.loads(row[1] or '[]')),
+            'history_flags': encode_history(json.loads(row[2] or '[]'))
+        } for row in rows])
+        last_id = rows[-1][0]
+
+def _backfill_lmp_dates():
+    db.session.execute(db.text("""
+        UPDATE patients SET lmp_date = date(
+            COALESCE(last_visit_date, registered_date, CURRENT_TIMESTAMP),
+            '-' || (gestation_weeks * 7) || ' days'
+        )
+    """))
+
+def _backfill_alert_escalations():
+    assign_visit_facilities()  # Alerts copy their facility from the patient's latest visit
+    # Open alerts start at the nurse level with their first deadline counted from creation
+    db.session.execute(db.text("UPDATE alerts SET escalation_level = 0, resolved = COALESCE(resolved, 0)"))
+    for priority, deadline in ESCALATION_DEADLINES.items():
+        db.session.execute(db.text(
+            "UPDATE alerts SET next_escalation_at = datetime(created_at, :offset) "
+            "WHERE priority = :priority AND resolved = 0"
+        ), {'priority': priority, 'offset': f"+{int(deadline.total_seconds())} seconds"})
+    _backfill_alert_facilities()
+
+def _backfill_alert_facilities():
+    db.session.execute(db.text("""
+        UPDATE alerts SET facility = (
+            SELECT anc_visits.facility FROM patients
+            JOIN anc_visits ON anc_visits.id = patients.last_visit_id
+            WHERE patients.patient_id = alerts.patient_id
+        ) WHERE facility IS NULL
+    """))
+
+def _backfill_patient_facilities():
+    # Home facility = where the patient was first seen
+    assign_visit_facilities()
+    db.session.execute(db.text("""
+        UPDATE patients SET facility = (
+            SELECT facility FROM anc_visits
+            WHERE anc_visits.patient_id = patients.patient_id
+            ORDER BY visit_date, id LIMIT 1
+        ) WHERE facility IS NULL
+    """))
+
+def assign_legacy_facility(facility: str) -> int:
+    """Put visits, and the patients and alerts that follow them, with no facility at `facility`"""
+    count = assign_visit_facilities(facility)
+    _backfill_patient_facilities()
+    _backfill_alert_facilities()
+    db.session.commit()
+    return count
+
+def _backfill_claim_batch_shards():
+    db.session.execute(db.text("UPDATE nhif_claim_batches SET shard = '' WHERE shard IS NULL"))
+
+def _rebuild_nhif_claims():
+    # The old (visit_id, service_code) constraint would reject a shard's visit 1 once the
+    # main database's visit 1 is billed; SQLite can only drop it by copying the table
+    connection = db.session.connection()
+    db.session.execute(db.text("DROP INDEX IF EXISTS ix_nhif_claims_batch_id"))
+    db.session.execute(db.text("ALTER TABLE nhif_claims RENAME TO nhif_claims_old"))
+    NHIFClaim.__table__.create(bind=connection)
+    db.session.execute(db.text("""
+        INSERT INTO nhif_claims (id, batch_id, shard, visit_id, patient_id, service_code, amount)
+        SELECT id, batch_id, '', visit_id, patient_id, service_code, amount FROM nhif_claims_old
+    """))
+    db.session.execute(db.text("DROP TABLE nhif_claims_old"))
+
+def _backfill_auth_versions():
+    db.session.execute(db.text("UPDATE users SET auth_version = 1 WHERE auth_version IS NULL"))
+
+# Data fixes to run once when a column is first added to an existing database
+COLUMN_BACKFILLS = {
+    ('anc_visits', 'facility'): assign_visit_facilities,
+    ('anc_visits', 'visit_number'): _backfill_visit_numbers,
+    ('patients', 'last_visit_id'): _backfill_latest_visits,
+    ('anc_visits', 'symptom_flags'): _backfill_clinical_flags,
+    ('patients', 'lmp_date'): _backfill_lmp_dates,
+    ('alerts', 'next_escalation_at'): _backfill_alert_escalations,
+    ('users', 'auth_version'): _backfill_auth_versions,
+    ('patients', 'facility'): _backfill_patient_facilities,
+    ('nhif_claim_batches', 'shard'): _backfill_claim_batch_shards,
+    ('nhif_claims', 'shard'): _rebuild_nhif_claims,
+}
+
+def migrate_schema():
+    """Add columns and indexes that create_all() won't add to existing tables"""
+    connection = db.session.connection()  # The pinned shard's file, if any
+    inspector = db.inspect(connection)
+    added = []
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append((table.name, column.name))
+        
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+    
+    for key, backfill in COLUMN_BACKFILLS.items():
+        if key in added:
+            backfill()
+    
+    db.session.commit()
+    if added:
+        print(f"✅ Schema migrated: {', '.join(f'{t}.{c}' for t, c in added)}")
+
 def init_db(app):
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///muranga_anc.db'
+    """Configure the database; the engine is only opened by the first query"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///muranga_anc.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
-    
-    with app.app_context():
-        db.create_all()
-        print("✅ Database initialized successfully!")
\ No newline at end of file
+    init_read_replica(app)
+
+def use_wal():
+    """
+    Put this database (or the pinned shard) in WAL mode, which sticks to the file.
+    Read-only report connections then read a snapshot instead of blocking writers.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+    db.session.commit()
+
+def create_schema():
+    """Create missing tables, columns and indexes (run by `flask init-db`, inside an app context)"""
+    db.create_all()
+    use_wal()
+    migrate_schema()
+
+    # Each facility's file holds only the clinical tables
+    shards = shard_map()
+    for key in (shards.keys() if shards else []):
+        db.metadata.create_all(bind=shards.engine(key), tables=[db.metadata.tables[name] for name in SHARDED_TABLES])
+        with using_shard(key):
+            use_wal()
+            migrate_schema()
+    print("✅ Database initialized successfully!")
\ No newline at end of file
@@ -0,0 +1,147 @@
+# src/digest.py - Morning digest per facility, queued to the notification outbox
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from .database import db, Alert, ANCVisit, DigestRun, FollowUp
+from .hypertension_ai import PregnancyRiskLevel
+from .notifications import contacts_for, queue_notification, split_sms
+from .scheduling import TimerQueue
+from .replicas import reading
+from .sharding import fan_out
+
+HIGH_RISK_LEVELS = (PregnancyRiskLevel.HIGH.value, PregnancyRiskLevel.CRITICAL.value)
+
+# Patients listed per section; the rest are only counted, so a digest stays a few SMS long
+DIGEST_MAX_LISTED = 10
+
+class DailyDigestJob:
+    """
+    Builds every facility's digest from three range queries over the whole
+    county - new high-risk visits, missed follow-ups and open alert counts - and
+    buckets the rows by facility in one pass, so the cost follows the number of
+    events, not the number of facilities. Digests go out by SMS, so they carry
+    patient ids and counts only - no names or phone numbers - and a long one is
+    split into numbered messages of at most SMS_MAX_LENGTH.
+    """
+    def __init__(self, app, facilities: list, hour: int = 6, roles: list = None,
+                 template_name: str = 'digest.txt', notification_worker=None):
+        self.app = app
+        self.facilities = facilities
+        self.hour = hour
+        self.roles = roles or ['doctor']
+        self.template = app.jinja_env.get_template(template_name)  # Compiled once, rendered per facility
+        self.notification_worker = notification_worker
+        self.timers = TimerQueue(self._on_due, name='daily-digest')
+
+    def next_run(self, now: datetime = None) -> datetime:
+        """Today's digest time, or now if it has passed without a digest, else tomorrow's"""
+        now = now or datetime.now()
+        today_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if now < today_at:
+            return today_at
+        with self.app.app_context():
+            sent_today = DigestRun.query.filter_by(digest_date=now.date()).first() is not None
+        return today_at + timedelta(days=1) if sent_today else now
+
+    def start(self):
+        next_run = self.next_run()
+        self.timers.schedule('daily-digest', next_run)
+        self.timers.start()
+        print(f"✅ Daily digest scheduled for {next_run:%Y-%m-%d %H:%M}")
+        return self
+
+    def _on_due(self, key):
+        with self.app.app_context():
+            self.run()
+        self.timers.schedule(key, self.next_run())
+
+    def _rows(self, start: datetime, end: datetime) -> tuple:
+        """New high-risk visits, missed follow-ups and open alert counts in one database"""
+        high_risk = db.session.query(
+            ANCVisit.facility, ANCVisit.patient_id, ANCVisit.risk_level,
+            ANCVisit.systolic_bp, ANCVisit.diastolic_bp, ANCVisit.visit_date
+        ).filter(
+            ANCVisit.visit_date >= start,
+            ANCVisit.visit_date < end,
+            ANCVisit.risk_level.in_(HIGH_RISK_LEVELS)
+        ).order_by(ANCVisit.visit_date).execution_options(all_facilities=True).all()
+
+        missed = db.session.query(
+            FollowUp.facility, FollowUp.patient_id, FollowUp.risk_level, FollowUp.due_at
+        ).filter(
+            FollowUp.status == 'MISSED',
+            FollowUp.due_at >= start,
+            FollowUp.due_at < end
+        ).order_by(FollowUp.due_at).execution_options(all_facilities=True).all()
+
+        # Counted straight off the partial index on open alerts
+        open_alerts = db.session.query(Alert.facility, Alert.priority, func.count()).filter(
+            Alert.resolved == db.false()
+        ).group_by(Alert.facility, Alert.priority).execution_options(all_facilities=True).all()
+
+        return high_risk, missed, open_alerts
+
+    def collect(self, start: datetime, end: datetime) -> dict:
+        digests = {facility: {'new_high_risk': [], 'missed_follow_ups': [], 'open_alerts': {}}
+                   for facility in self.facilities}
+
+        # With per-facility databases each is read in parallel and the rows merged here
+        seen = set()
+        with reading():
+            parts = fan_out(lambda: self._rows(start, end))
+        for high_risk, missed, open_alerts in parts:
+            for row in high_risk:
+                if row.facility in digests and (row.facility, row.patient_id) not in seen:
+                    seen.add((row.facility, row.patient_id))
+                    digests[row.facility]['new_high_risk'].append(row)
+
+            for row in missed:
+                if row.facility in digests:
+                    digests[row.facility]['missed_follow_ups'].append(row)
+
+            for facility, priority, count in open_alerts:
+                if facility in digests:
+                    counts = digests[facility]['open_alerts']
+                    counts[priority] = counts.get(priority, 0) + count
+
+        return digests
+
+    def render(self, facility: str, digest: dict, start: datetime, end: datetime) -> str:
+        return self.template.render(facility=facility, start=start, end=end, max_listed=DIGEST_MAX_LISTED, **digest)
+
+    def run(self, now: datetime = None) -> dict:
+        """Queue today's digests; returns None if another worker already sent them"""
+        now = now or datetime.now()
+        last_run = DigestRun.query.order_by(DigestRun.period_end.desc()).first()
+        start = last_run.period_end if last_run else now - timedelta(days=1)
+
+        run = DigestRun(digest_date=now.date(), period_start=start, period_end=now)
+        db.session.add(run)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return None
+
+        messages = 0
+        facilities = 0
+        for facility, digest in self.collect(start, now).items():
+            if not (digest['new_high_risk'] or digest['missed_follow_ups'] or digest['open_alerts']):
+                continue
+            facilities += 1
+            parts = split_sms(self.render(facility, digest, start, now))
+            for recipient in contacts_for(facility, self.roles):
+                for part in parts:
+                    queue_notification(recipient, part)
+                messages += len(parts)
+
+        run.facility_count = facilities
+        run.message_count = messages
+        db.session.commit()
+        if self.notification_worker:
+            self.notification_worker.wake()
+
+        print(f"✅ Daily digest for {now:%Y-%m-%d}: {facilities} facilities, {messages} messages queued")
+        return {'digest_date': now.date().isoformat(), 'facilities': facilities, 'messages': messages}
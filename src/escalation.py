@@ -0,0 +1,100 @@
+# src/escalation.py - Escalate unresolved alerts up the nurse -> doctor -> county chain
+import itertools
+from datetime import datetime
+
+from .database import db, Alert, ESCALATION_DEADLINES, ESCALATION_ROLES
+from .scheduling import TimerQueue
+from .sharding import current_shard, fan_out, using_shard
+
+class AlertEscalationEngine:
+    """
+    Every open alert's next deadline sits in a TimerQueue loaded from the partial
+    index on unresolved alerts, so open alerts cost nothing between deadlines.
+    The level and deadline live on the alert row, which is all a restart needs.
+    Timers are keyed by (shard, alert id), since ids repeat across facility databases.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.timers = TimerQueue(self._on_due, name='alert-escalation')
+        self.notifiers = []  # Callbacks receiving (alert, role) on each escalation
+
+    def start(self):
+        with self.app.app_context():
+            pending = list(itertools.chain.from_iterable(fan_out(self._pending, everywhere=True)))
+        for key, due in pending:
+            self.timers.schedule(key, due)
+        self.timers.start()
+        print(f"✅ Alert escalation started with {len(pending)} open alerts")
+        return self
+
+    @staticmethod
+    def _pending() -> list:
+        shard = current_shard()
+        return [((shard, alert_id), due) for alert_id, due in db.session.query(
+            Alert.id, Alert.next_escalation_at
+        ).filter(
+            Alert.resolved == db.false(),
+            Alert.next_escalation_at.isnot(None)
+        ).order_by(Alert.next_escalation_at)]
+
+    def track(self, alert):
+        """Start the clock on a committed alert"""
+        if alert.next_escalation_at and not alert.resolved:
+            self.timers.schedule((current_shard(), alert.id), alert.next_escalation_at)
+
+    def acknowledge(self, alert, user_name: str):
+        """Someone is on it: give them a fresh deadline at the current level"""
+        now = datetime.now()
+        alert.acknowledged_at = now
+        alert.acknowledged_by = user_name
+        deadline = ESCALATION_DEADLINES.get(alert.priority)
+        if deadline and alert.next_escalation_at:
+            alert.next_escalation_at = now + deadline
+        db.session.commit()
+        self.track(alert)
+
+    def resolve(self, alert, user_name: str):
+        alert.resolved = True
+        alert.resolved_at = datetime.now()
+        alert.resolved_by = user_name
+        alert.next_escalation_at = None
+        db.session.commit()
+        self.timers.cancel((current_shard(), alert.id))
+
+    def _on_due(self, key):
+        shard, alert_id = key
+        with self.app.app_context(), using_shard(shard):
+            alert = Alert.query.get(alert_id)
+            if alert is None or alert.resolved or alert.next_escalation_at is None:
+                return
+
+            now = datetime.now()
+            if alert.next_escalation_at > now:
+                # Acknowledged or escalated by another worker since this timer was set
+                self.timers.schedule((shard, alert.id), alert.next_escalation_at)
+                return
+
+            level = (alert.escalation_level or 0) + 1
+            deadline = ESCALATION_DEADLINES.get(alert.priority)
+            next_escalation_at = now + deadline if deadline and level < len(ESCALATION_ROLES) - 1 else None
+
+            # Conditional on the level we read, so only one worker escalates each step
+            updated = Alert.query.filter_by(
+                id=alert.id, resolved=False, escalation_level=alert.escalation_level or 0
+            ).update({'escalation_level': level, 'next_escalation_at': next_escalation_at},
+                     synchronize_session=False)
+            db.session.commit()
+
+            alert = Alert.query.get(alert_id)
+            if not updated:
+                self.track(alert)
+                return
+
+            role = ESCALATION_ROLES[min(level, len(ESCALATION_ROLES) - 1)]
+            print(f"⚠️ Alert {alert.id} ({alert.priority}) for {alert.patient_id} unresolved - escalating to {role}")
+            for notify in self.notifiers:
+                try:
+                    notify(alert, role)
+                except Exception as e:
+                    print(f"❌ Escalation notifier failed for alert {alert.id}: {e}")
+            self.track(alert)
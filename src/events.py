@@ -0,0 +1,196 @@
+# src/events.py - Pub/sub with a replay buffer for Server-Sent Events, shared between workers through the database
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import func, select
+
+from .database import db, AlertEvent
+
+# Sent to a client over the stream cap; browsers reconnect after this many ms
+BUSY_RETRY_MS = 30000
+
+class Event:
+    def __init__(self, event_id: int, event_type: str, data: dict, facility: str = None, roles=None):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.facility = facility  # None = every facility
+        self.roles = roles  # None = every role
+
+    def visible_to(self, facility: str, role: str) -> bool:
+        if self.roles is not None and role not in self.roles:
+            return False
+        # County staff follow every facility
+        return role == 'county' or self.facility is None or self.facility == facility
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+class EventBus:
+    """
+    Subscribers keep only a cursor into a bounded ring buffer of recent events, so
+    an idle connection is a thread parked on a condition.
+
+    Given an app, publish() writes an alert_events row and its id is the event id,
+    so ids are shared by every gunicorn worker. Each worker polls the table into
+    its own buffer: a stream on any worker carries alerts raised on all of them,
+    and a Last-Event-ID from one worker resumes on another. Without an app (a
+    single process, e.g. tests) ids count up from the boot time in ms.
+
+    A client whose id has fallen out of the buffer, or is newer than anything
+    this worker has seen (the database was reset, or it booted before the id's
+    process), is told to reload instead of silently missing events.
+
+    Every open stream holds a server thread for as long as the page is open, so
+    past max_streams per worker a client is told to retry later.
+    """
+    def __init__(self, app=None, buffer_size: int = 1000, heartbeat_seconds: float = 15,
+                 poll_seconds: float = 1, max_streams: int = None, retain: int = 10000):
+        self.app = app
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.max_streams = max_streams
+        self.retain = retain  # alert_events rows kept; well beyond any worker's buffer
+        self._events = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._streams = 0
+        self._poll_lock = threading.Lock()
+        self._poller_pid = None
+        self._stopped = threading.Event()
+        if app is None:
+            first_id = int(time.time() * 1000)
+            self._ids = itertools.count(first_id)
+            self._floor = first_id - 1  # Every event after this id is still in the buffer
+        else:
+            self._floor = None  # Set by the first poll
+
+    def _append(self, event: Event):
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0].id
+            self._events.append(event)
+            self._condition.notify_all()
+
+    def publish(self, event_type: str, data: dict, facility: str = None, roles=None) -> Event:
+        if self.app is None:
+            with self._condition:
+                event = Event(next(self._ids), event_type, data, facility, roles)
+            self._append(event)
+            return event
+
+        with db.get_engine(self.app).begin() as connection:
+            event_id = connection.execute(AlertEvent.__table__.insert().values(
+                event_type=event_type, data=json.dumps(data), facility=facility,
+                roles=json.dumps(list(roles)) if roles is not None else None
+            )).inserted_primary_key[0]
+            if event_id % 1000 == 0:
+                connection.execute(AlertEvent.__table__.delete().where(AlertEvent.id <= event_id - self.retain))
+        self.poll()  # Our own subscribers see it now rather than at the next poll
+        return Event(event_id, event_type, data, facility, roles)
+
+    def poll(self):
+        """Copy events published by any worker into this worker's buffer"""
+        if self.app is None:
+            return
+        table = AlertEvent.__table__
+        with self._poll_lock, db.get_engine(self.app).connect() as connection:
+            if self._floor is None:
+                # Start with the newest buffer's worth, so clients resume across a restart
+                latest = connection.execute(select(func.max(table.c.id))).scalar() or 0
+                self._floor = max(latest - self._events.maxlen, 0)
+            after = self._events[-1].id if self._events else self._floor
+            rows = connection.execute(select(table).where(table.c.id > after).order_by(table.c.id)).fetchall()
+        for row in rows:
+            self._append(Event(row.id, row.event_type, json.loads(row.data), row.facility,
+                               json.loads(row.roles) if row.roles else None))
+
+    def _start_polling(self):
+        # Lazily, in the process that serves streams - threads don't survive gunicorn's fork
+        with self._poll_lock:
+            if self.app is None or self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+        threading.Thread(target=self._poll_loop, name='event-poller', daemon=True).start()
+
+    def _poll_loop(self):
+        while not self._stopped.wait(self.poll_seconds):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Event poller: {e}")
+
+    def stop(self):
+        self._stopped.set()
+
+    def last_id(self) -> int:
+        with self._condition:
+            return self._events[-1].id if self._events else self._floor
+
+    def _after(self, cursor: int):
+        """Events newer than the cursor, or None if some may be missing from the buffer"""
+        if cursor < self._floor or cursor > self.last_id():
+            return None
+        newer = []
+        for event in reversed(self._events):
+            if event.id <= cursor:
+                break
+            newer.append(event)
+        newer.reverse()
+        return newer
+
+    def stream(self, facility: str, role: str, last_event_id=None):
+        """Yield SSE text for a subscriber, forever; the caller's request ends it"""
+        with self._condition:
+            busy = self.max_streams is not None and self._streams >= self.max_streams
+            if not busy:
+                self._streams += 1
+        if busy:
+            yield f"retry: {BUSY_RETRY_MS}\n: too many open streams\n\n"
+            return
+
+        try:
+            self._start_polling()
+            if self._floor is None:
+                self.poll()
+            yield from self._stream(facility, role, last_event_id)
+        finally:
+            with self._condition:
+                self._streams -= 1
+
+    def _stream(self, facility: str, role: str, last_event_id):
+        try:
+            cursor = int(last_event_id) if last_event_id else None
+        except ValueError:
+            cursor = None
+
+        if cursor is None:
+            cursor = self.last_id()
+            yield "retry: 5000\n\n"
+        elif cursor > self.last_id():
+            self.poll()  # Published on another worker since our last poll?
+
+        while True:
+            with self._condition:
+                events = self._after(cursor)
+                if events == []:
+                    self._condition.wait(timeout=self.heartbeat_seconds)
+                    events = self._after(cursor)
+
+            if events is None:
+                # Can't replay from this id - have the page reload its data, then carry on live
+                cursor = self.last_id()
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+                continue
+
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+
+            for event in events:
+                if event.visible_to(facility, role):
+                    yield event.to_sse()
+                cursor = event.id
@@ -12,6 +12,22 @@ class ExternalInterfaces:
         }
     
     @staticmethod
-    def export_public_health_data(patient_data: dict) -> bool:
-        print(f"Exporting anonymized data for public health registry")
-        return True
\ No newline at end of file
+    def generate_nhif_claims_batch(period: str, output_dir: str) -> dict:
+        """Month-end NHIF claims for every unclaimed ANC visit in the period, one batch per facility database (needs an app context)"""
+        from .nhif_claims import NHIFClaimsGenerator
+        
+        return NHIFClaimsGenerator().generate(period, output_dir)
+    
+    @staticmethod
+    def export_public_health_data(period: str, facilities: list = None,
+                                  output_path: str = None, endpoint: str = None) -> bool:
+        """Export monthly MOH 711 ANC indicators as a DHIS2 dataValueSet (needs an app context)"""
+        from .indicators import ANCIndicatorEngine
+        
+        try:
+            engine = ANCIndicatorEngine(facilities)
+            engine.export(period, output_path=output_path, endpoint=endpoint, refresh=True)
+            return True
+        except Exception as e:
+            print(f"❌ Error exporting public health data: {e}")
+            return False
\ No newline at end of file
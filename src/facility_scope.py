@@ -0,0 +1,43 @@
+# src/facility_scope.py - Restrict ORM queries to the logged-in user's facility
+from flask import g, has_app_context
+from flask_login import current_user
+from sqlalchemy.orm import with_loader_criteria
+
+from .database import db, Patient, ANCVisit, Alert
+
+# Patients by home facility, visits by where they happened, alerts by the raising facility
+SCOPED_MODELS = (Patient, ANCVisit, Alert)
+
+# Roles that keep the cross-facility view
+COUNTY_ROLES = ('county',)
+
+def facility_scope():
+    """The facility this request is limited to, or None for county users and background work"""
+    return g.get('facility_scope') if has_app_context() else None
+
+def scoped(statement, facility: str = None):
+    """The statement limited to a facility (default: this request's), as the session would run it"""
+    facility = facility or facility_scope()
+    if facility is None:
+        return statement
+    return statement.options(*[
+        with_loader_criteria(model, model.facility == facility, include_aliases=True)
+        for model in SCOPED_MODELS
+    ])
+
+def _scope_to_facility(execute_state):
+    # Opt out per query with .execution_options(all_facilities=True), e.g. for a
+    # patient's full visit history or county-wide rollups
+    if not execute_state.is_select or execute_state.execution_options.get('all_facilities'):
+        return
+    execute_state.statement = scoped(execute_state.statement)
+
+def init_facility_scope(app):
+    @app.before_request
+    def _set_facility_scope():
+        # Loading current_user here queries users, which is never scoped
+        if current_user.is_authenticated and current_user.role not in COUNTY_ROLES:
+            g.facility_scope = current_user.facility
+
+    db.event.listen(db.session, 'do_orm_execute', _scope_to_facility)
+    return app
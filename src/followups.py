@@ -0,0 +1,121 @@
+# src/followups.py - Follow-up visits derived from risk level, with missed-visit detection
+import itertools
+from datetime import datetime, timedelta
+
+from .database import db, FollowUp
+from .hypertension_ai import PregnancyRiskLevel
+from .scheduling import TimerQueue
+from .sharding import current_shard, fan_out, shards_where, using_shard
+
+# How soon the patient must be seen again, following each level's recommendation
+FOLLOW_UP_INTERVALS = {
+    PregnancyRiskLevel.CRITICAL.value: timedelta(hours=4),   # Immediate referral
+    PregnancyRiskLevel.HIGH.value: timedelta(hours=24),      # Urgent review within 24 hours
+    PregnancyRiskLevel.MODERATE.value: timedelta(weeks=1),   # Repeat tests in 1 week
+    PregnancyRiskLevel.LOW.value: timedelta(weeks=4),        # Routine antenatal care
+}
+
+class FollowUpScheduler:
+    """
+    Keeps every pending follow-up in a TimerQueue and marks it MISSED when its
+    due time passes. The thread only wakes for the next due item; the database
+    is read once at start-up through the (status, due_at) index. Timers are keyed
+    by (shard, follow-up id), since ids repeat across facility databases.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.timers = TimerQueue(self._on_due, name='follow-up-scheduler')
+        self.on_missed = []  # Callbacks receiving each FollowUp as it is marked missed
+
+    def start(self):
+        with self.app.app_context():
+            pending = list(itertools.chain.from_iterable(fan_out(self._pending, everywhere=True)))
+        for key, due_at in pending:
+            self.timers.schedule(key, due_at)
+        self.timers.start()
+        print(f"✅ Follow-up scheduler started with {len(pending)} pending follow-ups")
+        return self
+
+    @staticmethod
+    def _pending() -> list:
+        shard = current_shard()
+        return [((shard, follow_up_id), due_at) for follow_up_id, due_at in db.session.query(
+            FollowUp.id, FollowUp.due_at
+        ).filter(FollowUp.status == 'PENDING').order_by(FollowUp.due_at)]
+
+    @staticmethod
+    def create_for_visit(patient, visit):
+        """
+        Close the patient's open follow-ups with this visit and open the next one.
+        Runs inside the caller's transaction; pass the result to schedule() after commit.
+        Open follow-ups are looked up in every facility database, since a referral
+        leaves the last one wherever she was seen. Returns (new follow-up, timer
+        keys of the follow-ups it completed).
+        """
+        def open_follow_ups():
+            return db.session.query(FollowUp.id).filter_by(patient_id=patient.patient_id, status='PENDING')
+
+        completed = []
+        for shard in shards_where(lambda: open_follow_ups().first()):
+            with using_shard(shard):
+                ids = [follow_up_id for follow_up_id, in open_follow_ups()]
+                # Bulk update: ids repeat across shards, so don't touch objects in the session
+                FollowUp.query.filter(FollowUp.id.in_(ids)).update({
+                    'status': 'COMPLETED',
+                    'completed_at': visit.visit_date,
+                    'completed_visit_id': visit.id
+                }, synchronize_session=False)
+            completed += [(shard, follow_up_id) for follow_up_id in ids]
+
+        follow_up = FollowUp(
+            patient_id=patient.patient_id,
+            visit_id=visit.id,
+            facility=visit.facility,
+            risk_level=visit.risk_level,
+            reason=visit.recommendation,
+            due_at=visit.visit_date + FOLLOW_UP_INTERVALS.get(visit.risk_level, timedelta(weeks=4)),
+            status='PENDING'
+        )
+        db.session.add(follow_up)
+        return follow_up, completed
+
+    def schedule(self, follow_up, completed_keys=()):
+        for key in completed_keys:
+            self.timers.cancel(key)
+        self.timers.schedule((current_shard(), follow_up.id), follow_up.due_at)
+
+    def _on_due(self, key):
+        shard, follow_up_id = key
+        with self.app.app_context(), using_shard(shard):
+            # Conditional update, so another worker's scheduler or a visit recorded
+            # in the meantime wins without any locking
+            updated = FollowUp.query.filter_by(id=follow_up_id, status='PENDING').update(
+                {'status': 'MISSED', 'missed_at': datetime.now()}
+            )
+            db.session.commit()
+            if not updated:
+                return
+
+            follow_up = FollowUp.query.get(follow_up_id)
+            print(f"⚠️ Missed follow-up for {follow_up.patient_id} at {follow_up.facility} (due {follow_up.due_at})")
+            for callback in self.on_missed:
+                callback(follow_up)
+
+def due_list(facility: str, until: datetime, missed_since: datetime = None) -> dict:
+    """
+    Pending follow-ups due by `until` and recent misses for one facility. Both are
+    range reads on the (facility, status, due_at) index, so cost is O(due items).
+    """
+    due = FollowUp.query.filter(
+        FollowUp.facility == facility,
+        FollowUp.status == 'PENDING',
+        FollowUp.due_at <= until
+    ).order_by(FollowUp.due_at).all()
+
+    missed = FollowUp.query.filter(
+        FollowUp.facility == facility,
+        FollowUp.status == 'MISSED',
+        FollowUp.due_at >= (missed_since or datetime.now() - timedelta(days=14))
+    ).order_by(FollowUp.due_at.desc()).all()
+
+    return {'due': due, 'missed': missed}
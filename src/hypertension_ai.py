@@ -2,12 +2,28 @@
 from datetime import datetime
 from enum import Enum
 
+from .clinical_codes import encode_history, encode_symptoms, history_bit, symptom_bit
+
 class PregnancyRiskLevel(Enum):
     LOW = "Low Risk"
     MODERATE = "Moderate Risk"
     HIGH = "High Risk"
     CRITICAL = "Critical Risk - Refer Immediately"
 
+# Symptoms that each add 2 points
+CRITICAL_SYMPTOMS = ['severe_headache', 'visual_disturbances', 'upper_abdominal_pain',
+                     'shortness_of_breath', 'decreased_urine']
+CRITICAL_SYMPTOM_BITS = [(symptom_bit(name), name.replace('_', ' ').title()) for name in CRITICAL_SYMPTOMS]
+
+# History code -> (points, risk factor)
+HISTORY_WEIGHTS = [
+    (history_bit('previous_preeclampsia'), 3, "History of preeclampsia"),
+    (history_bit('chronic_hypertension'), 2, "Chronic hypertension"),
+    (history_bit('diabetes'), 1, "Diabetes"),
+    (history_bit('first_pregnancy'), 1, "Primigravida"),
+    (history_bit('multiple_pregnancy'), 1, "Multiple pregnancy"),
+]
+
 class HypertensionAIAnalyzer:
     def __init__(self):
         self.hypertension_alerts = []
@@ -29,7 +45,13 @@ class HypertensionAIAnalyzer:
         diastolic = patient_data.get('diastolic_bp', 0)
         gestational_age = patient_data.get('gestational_age_weeks', 0)
         protein_uria = patient_data.get('urine_protein', 0)  # +1, +2, +3 or mg/dL
-        symptoms = patient_data.get('symptoms', [])
+        # Symptoms and history arrive as bitmasks; plain lists are encoded once here
+        symptom_flags = patient_data.get('symptom_flags')
+        if symptom_flags is None:
+            symptom_flags = encode_symptoms(patient_data.get('symptoms', []))
+        history_flags = patient_data.get('history_flags')
+        if history_flags is None:
+            history_flags = encode_history(patient_data.get('medical_history', []))
         
         # BP Risk Scoring
         if systolic >= 140 or diastolic >= 90:
@@ -58,31 +80,16 @@ class HypertensionAIAnalyzer:
             risk_factors.append(f"Late gestation ({gestational_age} weeks)")
         
         # Symptom Risk Scoring
-        critical_symptoms = ['severe headache', 'visual disturbances', 'epigastric pain', 
-                           'shortness of breath', 'decreased urine output']
-        
-        for symptom in symptoms:
-            if symptom.lower() in critical_symptoms:
+        for bit, symptom in CRITICAL_SYMPTOM_BITS:
+            if symptom_flags & bit:
                 score += 2
                 risk_factors.append(f"Symptom: {symptom}")
         
         # Medical History Risk
-        history = patient_data.get('medical_history', [])
-        if 'previous_preeclampsia' in history:
-            score += 3
-            risk_factors.append("History of preeclampsia")
-        if 'chronic_hypertension' in history:
-            score += 2
-            risk_factors.append("Chronic hypertension")
-        if 'diabetes' in history:
-            score += 1
-            risk_factors.append("Diabetes")
-        if 'first_pregnancy' in history:
-            score += 1
-            risk_factors.append("Primigravida")
-        if 'multiple_pregnancy' in history:
-            score += 1
-            risk_factors.append("Multiple pregnancy")
+        for bit, points, factor in HISTORY_WEIGHTS:
+            if history_flags & bit:
+                score += points
+                risk_factors.append(factor)
         
         # Determine Risk Level
         if score >= 6:
@@ -0,0 +1,173 @@
+# src/indicators.py - MOH 711 / DHIS2 monthly ANC indicators
+import json
+import os
+import urllib.request
+from datetime import datetime
+
+from sqlalchemy import case, distinct, func, or_
+
+from .database import db, ANCVisit, IndicatorRollup
+from .hypertension_ai import PregnancyRiskLevel
+from .sharding import fan_out
+
+# DHIS2 identifiers. These are placeholders - point DHIS2_MAPPING_FILE at a JSON file
+# with the county's real {"data_set": ..., "data_elements": {...}, "org_units": {...}}.
+DHIS2_DATA_SET = 'MOH711_ANC'
+# 'referrals' counts visits assessed Critical, whose recommendation is immediate
+# referral. Referrals actually made are not recorded, so it is a proxy and each
+# value carries REFERRAL_PROXY_COMMENT in the dataValueSet.
+DHIS2_DATA_ELEMENTS = {
+    'anc_first_visits': 'MOH711_ANC_1ST_VISIT',
+    'anc_fourth_visits': 'MOH711_ANC_4TH_VISIT',
+    'hypertension_cases': 'MOH711_ANC_HYPERTENSION',
+    'referrals': 'MOH711_ANC_REFERRALS',
+}
+
+ANC_INDICATORS = tuple(DHIS2_DATA_ELEMENTS)
+
+REFERRAL_PROXY_COMMENT = 'Visits assessed Critical Risk - Refer Immediately; referrals made are not recorded'
+
+def _load_dhis2_mapping():
+    mapping = {'data_set': DHIS2_DATA_SET, 'data_elements': dict(DHIS2_DATA_ELEMENTS), 'org_units': {}}
+    mapping_file = os.environ.get('DHIS2_MAPPING_FILE')
+    if mapping_file:
+        with open(mapping_file) as f:
+            custom = json.load(f)
+        mapping['data_set'] = custom.get('data_set', mapping['data_set'])
+        mapping['data_elements'].update(custom.get('data_elements', {}))
+        mapping['org_units'].update(custom.get('org_units', {}))
+    return mapping
+
+def period_bounds(period: str):
+    """Return [start, end) datetimes for a DHIS2 monthly period such as '202410'"""
+    start = datetime.strptime(period, '%Y%m')
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+class ANCIndicatorEngine:
+    def __init__(self, facilities: list = None):
+        self.facilities = list(facilities or [])
+        self.mapping = _load_dhis2_mapping()
+
+    def compute_period(self, period: str, refresh: bool = False, store: bool = True) -> dict:
+        """
+        Compute monthly indicators for every facility in one grouped query over
+        the month's visits (visit_date index) and store them as rollups.
+        Closed months are served from rollups computed after the month ended,
+        unless refresh=True. A month still open is only ever counted, never
+        stored, so a partial month can't be served once it closes. With
+        store=False nothing is written: the rollups returned are unsaved.
+        Period bounds, visit dates and computed_at are all local time.
+        """
+        start, end = period_bounds(period)
+        now = datetime.now()
+        is_closed = end <= now
+        store = store and is_closed
+
+        if is_closed and not refresh:
+            cached = IndicatorRollup.query.filter(
+                IndicatorRollup.period == period,
+                IndicatorRollup.computed_at >= end
+            ).all()
+            if cached:
+                return {rollup.facility: rollup for rollup in cached}
+
+        hypertensive = or_(ANCVisit.systolic_bp >= 140, ANCVisit.diastolic_bp >= 90)
+
+        def grouped():
+            return db.session.query(
+                ANCVisit.facility,
+                func.count(ANCVisit.id),
+                func.sum(case((ANCVisit.visit_number == 1, 1), else_=0)),
+                func.sum(case((ANCVisit.visit_number == 4, 1), else_=0)),
+                func.count(distinct(case((hypertensive, ANCVisit.patient_id)))),
+                func.sum(case((ANCVisit.risk_level == PregnancyRiskLevel.CRITICAL.value, 1), else_=0)),
+            ).filter(
+                ANCVisit.visit_date >= start,
+                ANCVisit.visit_date < end
+            ).group_by(ANCVisit.facility).execution_options(
+                all_facilities=True  # Rollups are stored for every facility at once
+            ).all()
+
+        # Each facility database's partial counts, read in parallel when sharded, are summed
+        counts = {}
+        for rows in fan_out(grouped, everywhere=True):
+            for facility, total, first, fourth, hypertension, referrals in rows:
+                if not facility:
+                    print(f"⚠️ {total} visits in {period} have no facility and were not reported")
+                    continue
+                values = counts.setdefault(facility, dict.fromkeys(('total_visits',) + ANC_INDICATORS, 0))
+                values['total_visits'] += total
+                values['anc_first_visits'] += first or 0
+                values['anc_fourth_visits'] += fourth or 0
+                values['hypertension_cases'] += hypertension or 0
+                values['referrals'] += referrals or 0
+
+        # Facilities with no visits still report zeros
+        for facility in self.facilities:
+            counts.setdefault(facility, dict.fromkeys(('total_visits',) + ANC_INDICATORS, 0))
+
+        rollups = {facility: IndicatorRollup(facility=facility, period=period, computed_at=now, **values)
+                   for facility, values in counts.items()}
+        if not store:
+            return rollups
+
+        try:
+            IndicatorRollup.query.filter_by(period=period).delete()
+            db.session.add_all(rollups.values())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return rollups
+
+    def build_data_value_set(self, period: str, refresh: bool = False, store: bool = True) -> dict:
+        """Build a DHIS2 dataValueSet payload for the period"""
+        rollups = self.compute_period(period, refresh=refresh, store=store)
+        data_values = []
+
+        for facility in sorted(rollups):
+            org_unit = self.mapping['org_units'].get(facility, facility)
+            for indicator in ANC_INDICATORS:
+                data_value = {
+                    'dataElement': self.mapping['data_elements'][indicator],
+                    'period': period,
+                    'orgUnit': org_unit,
+                    'value': str(getattr(rollups[facility], indicator))
+                }
+                if indicator == 'referrals':
+                    data_value['comment'] = REFERRAL_PROXY_COMMENT
+                data_values.append(data_value)
+
+        return {
+            'dataSet': self.mapping['data_set'],
+            'period': period,
+            'completeDate': datetime.now().strftime('%Y-%m-%d'),
+            'dataValues': data_values
+        }
+
+    def export(self, period: str, output_path: str = None, endpoint: str = None, refresh: bool = False) -> dict:
+        """Write the dataValueSet to a JSON file and/or POST it to a (stub) DHIS2 endpoint"""
+        payload = self.build_data_value_set(period, refresh=refresh)
+
+        if output_path:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            with open(output_path, 'w') as f:
+                json.dump(payload, f, indent=2)
+            print(f"✅ DHIS2 dataValueSet for {period} written to {output_path}")
+
+        if endpoint:
+            request = urllib.request.Request(
+                endpoint,
+                data=json.dumps(payload).encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                method='POST'
+            )
+            with urllib.request.urlopen(request, timeout=30) as response:
+                print(f"✅ DHIS2 dataValueSet for {period} posted to {endpoint} ({response.status})")
+
+        return payload
\ No newline at end of file
@@ -7,6 +7,8 @@ current_dir = os.path.dirname(__file__)
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir)
 
+from flask import Flask
+
 # Now import using absolute paths
 try:
     from src.models import DataSource
@@ -14,6 +16,8 @@ try:
     from src.storage import CentralizedDataStore
     from src.ai_engine import AIEngine
     from src.services import AlertingService, ClinicalUIService, AnalyticsService
+    from src.database import init_db, create_schema
+    from src.notifications import OutboxNotifier
 except ImportError:
     # If absolute imports fail, try relative imports
     from .models import DataSource
@@ -21,13 +25,23 @@ except ImportError:
     from .storage import CentralizedDataStore
     from .ai_engine import AIEngine
     from .services import AlertingService, ClinicalUIService, AnalyticsService
+    from .database import init_db, create_schema
+    from .notifications import OutboxNotifier
+
+def outbox_app() -> Flask:
+    """An app bound to the dashboard database, whose notification worker sends what we queue"""
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        create_schema()
+    return app
 
 class HealthcareIntegrationSystem:
     def __init__(self):
         self.ingestion = DataIngestion()
         self.data_store = CentralizedDataStore()
         self.ai_engine = AIEngine()
-        self.alerting = AlertingService()
+        self.alerting = AlertingService(notify=OutboxNotifier(outbox_app()))
         self.clinical_ui = ClinicalUIService(self.data_store)
         self.analytics = AnalyticsService(self.data_store)
     
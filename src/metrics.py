@@ -0,0 +1,324 @@
+# src/metrics.py - Per-endpoint latency, SQL and template timings in Prometheus text format
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from flask import before_render_template, g, has_app_context, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .sharding import FAN_OUT_CONTEXT
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def state(self) -> dict:
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    def add(self, state: dict):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, state['counts'])]
+        self.sum += state['sum']
+        self.count += state['count']
+
+    def lines(self, name: str, labels: dict) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {self.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+# Tables of labelled histograms, and their Histogram buckets
+HISTOGRAM_TABLES = {
+    'latency': LATENCY_BUCKETS,
+    'sql_queries': QUERY_COUNT_BUCKETS,
+    'sql_seconds': LATENCY_BUCKETS,
+    'template_seconds': LATENCY_BUCKETS,
+}
+
+def _key(key):
+    # JSON turns tuple keys into lists
+    return tuple(key) if isinstance(key, list) else key
+
+def clear_metrics_dir(directory: str):
+    """Drop every worker's snapshot; gunicorn's master does this at start-up, a counter reset"""
+    for path in glob.glob(os.path.join(directory, 'worker-*.json')):
+        os.remove(path)
+
+class RequestStats:
+    """SQL counts for one request, added to by its own thread and by fan_out() pool threads"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+
+    def add_query(self, elapsed: float):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_seconds += elapsed
+
+class RequestMetrics:
+    """
+    Flask hooks plus SQLAlchemy engine events. SQL time is attributed to the
+    request running on the thread, or that fan_out() runs on its behalf;
+    queries from background threads (schedulers, notification worker) are
+    counted separately.
+
+    Counts live in each worker process. With metrics_dir set (gunicorn runs
+    several workers) each worker also writes a snapshot there from a thread,
+    every flush_seconds, and /metrics sums every worker's latest snapshot, so a scrape
+    answered by either worker sees the same totals. Snapshots of workers that
+    have exited are kept, so counters never go backwards.
+    """
+    def __init__(self, slow_request_ms: float = 500, metrics_dir: str = None, flush_seconds: float = 1.0):
+        self.slow_request_ms = slow_request_ms
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        self.latency = {}  # (endpoint, method) -> Histogram of seconds
+        self.responses = {}  # (endpoint, method, status) -> count
+        self.sql_queries = {}  # endpoint -> Histogram of queries per request
+        self.sql_seconds = {}  # endpoint -> Histogram of SQL seconds per request
+        self.template_seconds = {}  # template -> Histogram
+        self.background_sql_queries = 0
+        self.background_sql_seconds = 0.0
+
+    def init_app(self, app):
+        if self.metrics_dir:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+        if 'request_stats' not in FAN_OUT_CONTEXT:
+            FAN_OUT_CONTEXT.append('request_stats')
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+        return self
+
+    def _before_request(self):
+        incoming = request.headers.get('X-Request-ID', '')
+        g.request_id = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.request_stats = RequestStats()
+        g.template_seconds = 0.0
+        g.template_starts = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = g.get('request_stats') if has_app_context() else None
+        if stats is not None:
+            stats.add_query(elapsed)
+        else:
+            with self._lock:
+                self.background_sql_queries += 1
+                self.background_sql_seconds += elapsed
+
+    def _handle_error(self, exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        # so the pooled connection's next query is not timed from this one
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_started'):
+            conn.info['query_started'].pop()
+
+    def _before_render(self, sender, template, context, **extra):
+        if has_request_context() and 'template_starts' in g:
+            g.template_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        if not (has_request_context() and g.get('template_starts')):
+            return
+        elapsed = time.perf_counter() - g.template_starts.pop()
+        g.template_seconds += elapsed
+        with self._lock:
+            self.template_seconds.setdefault(template.name, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+
+    def _after_request(self, response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unmatched'
+        stats = g.request_stats
+
+        with self._lock:
+            self.latency.setdefault((endpoint, request.method), Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            key = (endpoint, request.method, response.status_code)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.sql_queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.sql_queries)
+            self.sql_seconds.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(stats.sql_seconds)
+        self._start_flusher()
+
+        response.headers['X-Request-ID'] = g.request_id
+        if elapsed * 1000 >= self.slow_request_ms:
+            print(json.dumps({
+                'event': 'slow_request',
+                'request_id': g.request_id,
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'sql_queries': stats.sql_queries,
+                'sql_ms': round(stats.sql_seconds * 1000, 1),
+                'template_ms': round(g.template_seconds * 1000, 1)
+            }), flush=True)
+        return response
+
+    def snapshot(self) -> dict:
+        """This process's metrics as JSON-ready lists of [key, value]"""
+        with self._lock:
+            snapshot = {name: [[key, histogram.state()] for key, histogram in getattr(self, name).items()]
+                        for name in HISTOGRAM_TABLES}
+            snapshot['responses'] = [[key, count] for key, count in self.responses.items()]
+            snapshot['background_sql_queries'] = self.background_sql_queries
+            snapshot['background_sql_seconds'] = self.background_sql_seconds
+        return json.loads(json.dumps(snapshot))
+
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.metrics_dir, f"worker-{os.getpid()}.json")
+
+    def flush(self):
+        """Write this worker's snapshot to metrics_dir"""
+        if not self.metrics_dir:
+            return
+        with self._flush_lock:
+            path = self._snapshot_path()
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f"{path}.tmp", path)  # Readers never see half a file
+
+    def _start_flusher(self):
+        # Lazily, in the worker serving requests - threads don't survive gunicorn's fork
+        if not self.metrics_dir or self._flusher_pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while True:
+            time.sleep(self.flush_seconds)
+            if self._flusher_pid != pid:
+                return  # reset() stopped us
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Metrics flush: {e}")
+
+    def reset(self):
+        """Forget this process's counts and snapshot; wsgi.py's warm-up request is not traffic"""
+        with self._lock:
+            for name in HISTOGRAM_TABLES:
+                getattr(self, name).clear()
+            self.responses.clear()
+            self.background_sql_queries = 0
+            self.background_sql_seconds = 0.0
+        with self._flush_lock:
+            self._flusher_pid = None
+            if self.metrics_dir and os.path.exists(self._snapshot_path()):
+                os.remove(self._snapshot_path())
+
+    def _totals(self) -> 'RequestMetrics':
+        """Every worker's latest snapshot summed, as a RequestMetrics to render"""
+        self.flush()
+        totals = RequestMetrics()
+        for path in sorted(glob.glob(os.path.join(self.metrics_dir, 'worker-*.json'))):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # Removed by a restarting master
+            for name, buckets in HISTOGRAM_TABLES.items():
+                table = getattr(totals, name)
+                for key, state in snapshot[name]:
+                    table.setdefault(_key(key), Histogram(buckets)).add(state)
+            for key, count in snapshot['responses']:
+                totals.responses[_key(key)] = totals.responses.get(_key(key), 0) + count
+            totals.background_sql_queries += snapshot['background_sql_queries']
+            totals.background_sql_seconds += snapshot['background_sql_seconds']
+        return totals
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format, summed over workers when metrics_dir is set"""
+        if self.metrics_dir:
+            return self._totals()._render()
+        return self._render()
+
+    def _render(self) -> str:
+        with self._lock:
+            lines = ['# HELP http_request_duration_seconds Request latency by endpoint',
+                     '# TYPE http_request_duration_seconds histogram']
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                lines += histogram.lines('http_request_duration_seconds', {'endpoint': endpoint, 'method': method})
+
+            lines += ['# HELP http_responses_total Responses by endpoint and status',
+                      '# TYPE http_responses_total counter']
+            for (endpoint, method, status), count in sorted(self.responses.items()):
+                lines.append(f"http_responses_total{_labels({'endpoint': endpoint, 'method': method, 'status': status})} {count}")
+
+            lines += ['# HELP db_queries_per_request SQL statements executed per request',
+                      '# TYPE db_queries_per_request histogram']
+            for endpoint, histogram in sorted(self.sql_queries.items()):
+                lines += histogram.lines('db_queries_per_request', {'endpoint': endpoint})
+
+            lines += ['# HELP db_query_seconds_per_request Time spent in SQL per request',
+                      '# TYPE db_query_seconds_per_request histogram']
+            for endpoint, histogram in sorted(self.sql_seconds.items()):
+                lines += histogram.lines('db_query_seconds_per_request', {'endpoint': endpoint})
+
+            lines += ['# HELP template_render_seconds Template render time',
+                      '# TYPE template_render_seconds histogram']
+            for template, histogram in sorted(self.template_seconds.items()):
+                lines += histogram.lines('template_render_seconds', {'template': template})
+
+            lines += ['# HELP db_background_queries_total SQL statements run outside requests',
+                      '# TYPE db_background_queries_total counter',
+                      f"db_background_queries_total {self.background_sql_queries}",
+                      '# HELP db_background_query_seconds_total Time in SQL outside requests',
+                      '# TYPE db_background_query_seconds_total counter',
+                      f"db_background_query_seconds_total {self.background_sql_seconds}"]
+        return '\n'.join(lines) + '\n'
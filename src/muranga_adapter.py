@@ -39,7 +39,9 @@ class MurangaANCAdapter:
                 'gestational_age_weeks': visit.gestation_weeks,
                 'urine_protein': visit.urine_protein,
                 'symptoms': visit.symptoms,
-                'medical_history': data.get('medical_history', [])
+                'medical_history': data.get('medical_history', []),
+                'symptom_flags': data.get('symptom_flags'),
+                'history_flags': data.get('history_flags')
             }
             
             risk_assessment = self.ai_analyzer.analyze_pregnancy_hypertension_risk(risk_data)
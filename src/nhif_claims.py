@@ -0,0 +1,187 @@
+# src/nhif_claims.py - Month-end batch NHIF (Linda Mama) claims for ANC visits
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .database import db, ANCVisit, NHIFClaim, NHIFClaimBatch
+from .hypertension_ai import PregnancyRiskLevel
+from .indicators import period_bounds
+from .sharding import current_shard, shard_keys, using_shard
+
+# Default tariff table. Amounts are placeholders - point NHIF_TARIFF_FILE at a JSON
+# file with the current schedule in the same shape to override them.
+NHIF_TARIFFS = {
+    'ANC_FIRST_VISIT': {'code': 'LM-ANC-01', 'description': 'ANC first visit', 'amount': 500.0},
+    'ANC_FOLLOW_UP': {'code': 'LM-ANC-02', 'description': 'ANC follow-up visit', 'amount': 300.0},
+    'HIGH_RISK_REVIEW': {'code': 'LM-ANC-HR', 'description': 'High-risk pregnancy review', 'amount': 1000.0},
+}
+
+HIGH_RISK_LEVELS = (PregnancyRiskLevel.HIGH.value, PregnancyRiskLevel.CRITICAL.value)
+
+CLAIM_COLUMNS = ['batch_id', 'visit_id', 'patient_id', 'facility', 'visit_date', 'service_code', 'description', 'amount']
+
+def load_tariffs() -> dict:
+    tariffs = {name: dict(entry) for name, entry in NHIF_TARIFFS.items()}
+    tariff_file = os.environ.get('NHIF_TARIFF_FILE')
+    if tariff_file:
+        with open(tariff_file) as f:
+            tariffs.update(json.load(f))
+    return tariffs
+
+class NHIFClaimsGenerator:
+    def __init__(self, tariffs: dict = None, chunk_size: int = 5000):
+        self.tariffs = tariffs or load_tariffs()
+        self.chunk_size = chunk_size
+
+    def services_for(self, visit_number, risk_level) -> list:
+        """Map a visit to its billable tariff entries"""
+        services = [self.tariffs['ANC_FIRST_VISIT'] if visit_number == 1 else self.tariffs['ANC_FOLLOW_UP']]
+        if risk_level in HIGH_RISK_LEVELS:
+            services.append(self.tariffs['HIGH_RISK_REVIEW'])
+        return services
+
+    def generate(self, period: str, output_dir: str) -> dict:
+        """
+        Claim every unclaimed visit in the period, with one batch per facility
+        database when sharded. The databases are billed one after another rather
+        than fanned out, since every batch writes its claims to the main database.
+        """
+        batches = []
+        for key in shard_keys():
+            with using_shard(key):
+                batches.append(self._generate_batch(period, output_dir))
+        return {
+            'period': period,
+            'batches': [batch for batch in batches if batch['batch_id']],
+            'visits': sum(batch['visits'] for batch in batches),
+            'claims': sum(batch['claims'] for batch in batches),
+            'total_amount': round(sum(batch['total_amount'] for batch in batches), 2)
+        }
+
+    def _generate_batch(self, period: str, output_dir: str) -> dict:
+        """
+        Claim the pinned database's unclaimed visits. Each batch records the highest
+        visit id it claimed there, so a re-run only reads visits added since then and
+        the (shard, visit_id, service_code) constraint guards against double billing.
+        """
+        shard = current_shard() or ''
+        start, end = period_bounds(period)
+        watermark = db.session.query(func.max(NHIFClaimBatch.last_visit_id)).filter(
+            NHIFClaimBatch.period == period,
+            NHIFClaimBatch.shard == shard
+        ).scalar() or 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        batch = NHIFClaimBatch(period=period, shard=shard, last_visit_id=watermark)
+        db.session.add(batch)
+        db.session.flush()
+
+        filename = f"nhif_claims_{period}_batch{batch.id}.csv"
+        path = os.path.join(output_dir, filename)
+        tmp_path = path + '.tmp'
+
+        visits = db.session.query(
+            ANCVisit.id, ANCVisit.patient_id, ANCVisit.facility, ANCVisit.visit_date,
+            ANCVisit.visit_number, ANCVisit.risk_level
+        ).filter(
+            ANCVisit.visit_date >= start,
+            ANCVisit.visit_date < end,
+            ANCVisit.id > watermark
+        ).order_by(ANCVisit.id).yield_per(self.chunk_size)
+
+        totals = {}
+        visit_count = 0
+        claim_count = 0
+        total_amount = 0.0
+        pending = []
+
+        try:
+            with open(tmp_path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=CLAIM_COLUMNS)
+                writer.writeheader()
+
+                for visit_id, patient_id, facility, visit_date, visit_number, risk_level in visits:
+                    visit_count += 1
+                    batch.last_visit_id = visit_id
+
+                    for service in self.services_for(visit_number, risk_level):
+                        pending.append({
+                            'batch_id': batch.id,
+                            'shard': shard,
+                            'visit_id': visit_id,
+                            'patient_id': patient_id,
+                            'service_code': service['code'],
+                            'amount': service['amount']
+                        })
+                        writer.writerow({
+                            'batch_id': batch.id,
+                            'visit_id': visit_id,
+                            'patient_id': patient_id,
+                            'facility': facility or '',
+                            'visit_date': visit_date.strftime('%Y-%m-%d'),
+                            'service_code': service['code'],
+                            'description': service['description'],
+                            'amount': f"{service['amount']:.2f}"
+                        })
+                        code_totals = totals.setdefault(service['code'], {'claims': 0, 'amount': 0.0})
+                        code_totals['claims'] += 1
+                        code_totals['amount'] += service['amount']
+                        claim_count += 1
+                        total_amount += service['amount']
+
+                    if len(pending) >= self.chunk_size:
+                        db.session.execute(NHIFClaim.__table__.insert(), pending)
+                        pending = []
+
+                if pending:
+                    db.session.execute(NHIFClaim.__table__.insert(), pending)
+
+            if visit_count == 0:
+                # Nothing new to bill - leave no empty batch behind
+                db.session.rollback()
+                os.remove(tmp_path)
+                print(f"✅ No unclaimed visits for {period}{f' in {shard}' if shard else ''}")
+                return {'period': period, 'shard': shard, 'batch_id': None, 'visits': 0, 'claims': 0, 'total_amount': 0.0}
+
+            digest = hashlib.sha256()
+            with open(tmp_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            checksum = digest.hexdigest()
+            os.replace(tmp_path, path)
+
+            batch.claim_count = claim_count
+            batch.total_amount = total_amount
+            batch.file_path = path
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for leftover in (tmp_path, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+
+        manifest = {
+            'period': period,
+            'shard': shard,
+            'batch_id': batch.id,
+            'generated_at': datetime.now().isoformat(),
+            'file': filename,
+            'sha256': checksum,
+            'visits': visit_count,
+            'claims': claim_count,
+            'total_amount': round(total_amount, 2),
+            'by_service_code': totals,
+            'after_visit_id': watermark,
+            'last_visit_id': batch.last_visit_id
+        }
+        with open(os.path.join(output_dir, f"nhif_claims_{period}_batch{batch.id}.manifest.json"), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        print(f"✅ NHIF batch {batch.id} for {period}{f' ({shard})' if shard else ''}: "
+              f"{claim_count} claims, KES {total_amount:,.2f}")
+        return manifest
\ No newline at end of file
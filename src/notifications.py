@@ -0,0 +1,378 @@
+# src/notifications.py - Notification outbox and the asyncio worker that delivers it
+import abc
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+from .database import db, NotificationOutbox
+from .sharding import shard_keys, using_shard
+
+# Who is texted about alerts: {facility: {role: [phone numbers]}}, with '*' for
+# contacts that cover every facility. Empty by default - point ALERT_CONTACTS_FILE
+# at a JSON file in this shape. With no contacts nothing is texted, which the
+# worker reports at start-up and queue_alert_notifications() for every alert.
+ALERT_CONTACTS = {}
+
+SMS_MAX_LENGTH = 320  # Two SMS segments
+
+def load_alert_contacts() -> dict:
+    contacts = dict(ALERT_CONTACTS)
+    contacts_file = os.environ.get('ALERT_CONTACTS_FILE')
+    if contacts_file:
+        with open(contacts_file) as f:
+            contacts.update(json.load(f))
+    return contacts
+
+def contacts_for(facility: str, roles, contacts: dict = None) -> list:
+    contacts = load_alert_contacts() if contacts is None else contacts
+    numbers = []
+    for scope in (facility, '*'):
+        for role in roles:
+            for number in contacts.get(scope, {}).get(role, []):
+                if number not in numbers:
+                    numbers.append(number)
+    return numbers
+
+def queue_notification(recipient: str, message: str, provider: str = None, alert_id: int = None):
+    """Add one outbox row in the caller's transaction; wake the worker after commit"""
+    db.session.add(NotificationOutbox(
+        alert_id=alert_id,
+        provider=provider or os.environ.get('NOTIFICATION_PROVIDER', 'file'),
+        recipient=recipient,
+        message=message,
+        next_attempt_at=datetime.now()
+    ))
+
+def split_sms(text: str, limit: int = SMS_MAX_LENGTH) -> list:
+    """Split text at line breaks into messages of at most limit characters, numbered (1/3) when there are several"""
+    text = text.strip()
+    if len(text) <= limit:
+        return [text]
+    room = limit - len('(99/99) ')
+    parts, current = [], ''
+    for line in text.splitlines():
+        while len(line) > room:  # A line too long for one message is cut
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:room])
+            line = line[room:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > room:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return [f"({n}/{len(parts)}) {part}" for n, part in enumerate(parts, 1)]
+
+def queue_alert_notifications(alert, roles, provider: str = None, contacts: dict = None) -> int:
+    """
+    Add outbox rows for an alert in the caller's transaction. Nothing is sent here;
+    wake the worker after commit.
+    """
+    message = f"[{alert.priority}] {alert.patient_id}"
+    if alert.facility:
+        message += f" at {alert.facility}"
+    message = f"{message}: {alert.message}"[:SMS_MAX_LENGTH]
+
+    recipients = contacts_for(alert.facility, roles, contacts)
+    if not recipients:
+        print(f"⚠️ No contacts for {', '.join(roles)} at {alert.facility or 'any facility'} - "
+              f"alert for {alert.patient_id} not texted (set ALERT_CONTACTS_FILE)")
+    for recipient in recipients:
+        queue_notification(recipient, message, provider, alert.id)
+    return len(recipients)
+
+class OutboxNotifier:
+    """
+    Queues AlertingService alerts (lab and clinical-note alerts, kept in memory)
+    in the notification outbox, so the same worker delivers them. Called for new
+    alerts and raised priorities, not for repeats; only the listed priorities are
+    texted. Rows go to the main database, which the worker always drains.
+    """
+    def __init__(self, app, facility: str = None, roles=('nurse', 'doctor'),
+                 priorities=('critical', 'high'), worker=None):
+        self.app = app
+        self.facility = facility
+        self.roles = list(roles)
+        self.priorities = priorities
+        self.worker = worker  # Woken after commit; without one, a running worker's poll picks rows up
+
+    def __call__(self, alert: dict) -> int:
+        if alert['priority'] not in self.priorities:
+            return 0
+        message = f"[{alert['priority'].upper()}] {alert['patient_id']}: {alert['message']}"[:SMS_MAX_LENGTH]
+        with self.app.app_context():
+            recipients = contacts_for(self.facility, self.roles)
+            if not recipients:
+                print(f"⚠️ No contacts for {', '.join(self.roles)} - alert for {alert['patient_id']} "
+                      f"not texted (set ALERT_CONTACTS_FILE)")
+                return 0
+            for recipient in recipients:
+                queue_notification(recipient, message)
+            db.session.commit()
+        if self.worker:
+            self.worker.wake()
+        return len(recipients)
+
+class NotificationProvider(abc.ABC):
+    """
+    Delivers batches of {'id', 'recipient', 'message'} and returns one receipt per
+    message: {'id', 'ok', 'receipt_id', 'error'}.
+    """
+    name = 'base'
+
+    def __init__(self, batch_size: int = 50, rate_per_second: float = 5.0):
+        self.batch_size = batch_size
+        self.rate_per_second = rate_per_second
+
+    @abc.abstractmethod
+    async def send_batch(self, messages: list) -> list:
+        """Send the messages; report failures in the receipts rather than raising"""
+
+class FileProvider(NotificationProvider):
+    """Appends messages to a JSON-lines file - for development and testing"""
+    name = 'file'
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    def _append(self, lines):
+        with open(self.path, 'a') as f:
+            f.writelines(lines)
+
+    async def send_batch(self, messages: list) -> list:
+        receipts = [{'id': m['id'], 'ok': True, 'receipt_id': f"file-{uuid.uuid4().hex[:12]}"} for m in messages]
+        lines = [json.dumps({**m, 'receipt_id': r['receipt_id'], 'sent_at': datetime.now().isoformat()}) + '\n'
+                 for m, r in zip(messages, receipts)]
+        await asyncio.to_thread(self._append, lines)
+        return receipts
+
+class HTTPProvider(NotificationProvider):
+    """
+    POSTs {"messages": [...]} to an SMS gateway and expects
+    {"results": [{"id": ..., "status": "accepted", "message_id": ...}]} back.
+    """
+    name = 'http'
+
+    def __init__(self, url: str, token: str = None, timeout: float = 10, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def _post(self, messages: list) -> dict:
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        request = urllib.request.Request(self.url, data=json.dumps({'messages': messages}).encode('utf-8'),
+                                         headers=headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    async def send_batch(self, messages: list) -> list:
+        try:
+            response = await asyncio.to_thread(self._post, messages)
+        except Exception as e:
+            return [{'id': m['id'], 'ok': False, 'error': str(e)} for m in messages]
+
+        results = {result.get('id'): result for result in response.get('results', [])}
+        receipts = []
+        for m in messages:
+            result = results.get(m['id'], {})
+            receipts.append({
+                'id': m['id'],
+                'ok': result.get('status') == 'accepted',
+                'receipt_id': result.get('message_id'),
+                'error': result.get('error') or (None if result else 'No result from gateway')
+            })
+        return receipts
+
+def providers_from_env() -> list:
+    rate = float(os.environ.get('NOTIFICATION_RATE_PER_SECOND', 5))
+    providers = [FileProvider(os.environ.get('NOTIFICATION_FILE', 'notifications_sent.jsonl'), rate_per_second=rate)]
+    if os.environ.get('NOTIFICATION_HTTP_URL'):
+        providers.append(HTTPProvider(os.environ['NOTIFICATION_HTTP_URL'], os.environ.get('NOTIFICATION_HTTP_TOKEN'),
+                                      rate_per_second=rate))
+    return providers
+
+class RateLimiter:
+    """Token bucket; acquire(n) waits until n messages may go out"""
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self, count: int):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= count:
+                self.tokens -= count
+                return
+            await asyncio.sleep((count - self.tokens) / self.rate)
+
+class NotificationWorker:
+    """
+    Runs an asyncio loop in a daemon thread. Each provider drains its own due
+    messages in batches, under its own rate limit, so a slow gateway never holds
+    up another. Failures are retried with exponential backoff until max_attempts.
+    Request handlers only write outbox rows and call wake(). Claimed rows carry a
+    lease; a row still SENDING after lease_seconds belongs to a worker that died
+    mid-batch and goes out again. Database calls run in a thread off the loop.
+    When sharded, an alert's rows sit in its facility database, and every
+    database's outbox is drained in turn.
+    """
+    def __init__(self, app, providers: list, max_attempts: int = 5, backoff_seconds: float = 30,
+                 max_backoff_seconds: float = 3600, poll_seconds: float = 30, lease_seconds: float = 300):
+        self.app = app
+        self.providers = {provider.name: provider for provider in providers}
+        self.limiters = {provider.name: RateLimiter(provider.rate_per_second, provider.batch_size)
+                         for provider in providers}
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.poll_seconds = poll_seconds  # Picks up rows written by other workers
+        self.lease_seconds = lease_seconds  # Longer than any batch takes to send
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+        self._stopped = False
+
+    def start(self):
+        if self._thread is None:
+            # A contacts file that can't be read fails here rather than at the first alert
+            if not load_alert_contacts():
+                print("⚠️ No alert contacts configured (set ALERT_CONTACTS_FILE) - alerts will not be texted")
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()),
+                                            name='notification-worker', daemon=True)
+            self._thread.start()
+            print(f"✅ Notification worker started ({', '.join(self.providers)})")
+        return self
+
+    def wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop(self):
+        self._stopped = True
+        self.wake()
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        while not self._stopped:
+            self._wakeup.clear()
+            await asyncio.to_thread(self._requeue_expired)
+            await asyncio.gather(*(self._drain(provider) for provider in self.providers.values()))
+            try:
+                timeout = await asyncio.to_thread(self._seconds_until_next)
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _shards(self) -> list:
+        with self.app.app_context():
+            return shard_keys()
+
+    async def _drain(self, provider):
+        # Message ids are only unique within one database, so each batch comes from one
+        for shard in await asyncio.to_thread(self._shards):
+            while not self._stopped:
+                batch = await asyncio.to_thread(self._claim, provider, shard)
+                if not batch:
+                    break
+                await self.limiters[provider.name].acquire(len(batch))
+                try:
+                    receipts = await provider.send_batch(batch)
+                except Exception as e:
+                    receipts = [{'id': m['id'], 'ok': False, 'error': str(e)} for m in batch]
+                await asyncio.to_thread(self._record, receipts, shard)
+
+    def _requeue_expired(self):
+        # Rows left SENDING by a worker that crashed mid-batch go out again once
+        # its lease runs out; rows another live worker is sending are left alone
+        cutoff = datetime.now() - timedelta(seconds=self.lease_seconds)
+        requeued = 0
+        for shard in self._shards():
+            with self.app.app_context(), using_shard(shard):
+                requeued += NotificationOutbox.query.filter(
+                    NotificationOutbox.status == 'SENDING',
+                    db.or_(NotificationOutbox.claimed_at.is_(None), NotificationOutbox.claimed_at < cutoff)
+                ).update({'status': 'PENDING', 'claimed_at': None, 'claimed_by': None}, synchronize_session=False)
+                db.session.commit()
+        if requeued:
+            print(f"⚠️ Requeued {requeued} notifications whose sending worker stopped")
+
+    def _claim(self, provider, shard=None) -> list:
+        with self.app.app_context(), using_shard(shard):
+            rows = NotificationOutbox.query.filter(
+                NotificationOutbox.provider == provider.name,
+                NotificationOutbox.status == 'PENDING',
+                NotificationOutbox.next_attempt_at <= datetime.now()
+            ).order_by(NotificationOutbox.next_attempt_at).limit(provider.batch_size).all()
+
+            batch = []
+            now = datetime.now()
+            for row in rows:
+                # Per-row conditional update, so two workers never send the same message
+                claimed = NotificationOutbox.query.filter_by(id=row.id, status='PENDING').update(
+                    {'status': 'SENDING', 'claimed_at': now, 'claimed_by': self.worker_id},
+                    synchronize_session=False
+                )
+                if claimed:
+                    batch.append({'id': row.id, 'recipient': row.recipient, 'message': row.message})
+            db.session.commit()
+            return batch
+
+    def _record(self, receipts: list, shard=None):
+        now = datetime.now()
+        with self.app.app_context(), using_shard(shard):
+            for receipt in receipts:
+                row = NotificationOutbox.query.get(receipt['id'])
+                if row.status != 'SENDING' or row.claimed_by != self.worker_id:
+                    continue  # Our lease ran out and the row was requeued; its new claimant records it
+                row.attempts += 1
+                row.claimed_at = None
+                row.claimed_by = None
+                if receipt['ok']:
+                    row.status = 'SENT'
+                    row.receipt_id = receipt.get('receipt_id')
+                    row.sent_at = now
+                    row.last_error = None
+                elif row.attempts >= self.max_attempts:
+                    row.status = 'FAILED'
+                    row.last_error = receipt.get('error')
+                    print(f"❌ Notification {row.id} to {row.recipient} failed after {row.attempts} attempts: {row.last_error}")
+                else:
+                    delay = min(self.backoff_seconds * 2 ** (row.attempts - 1), self.max_backoff_seconds)
+                    row.status = 'PENDING'
+                    row.next_attempt_at = now + timedelta(seconds=delay)
+                    row.last_error = receipt.get('error')
+            db.session.commit()
+
+    def _seconds_until_next(self) -> float:
+        next_attempts = []
+        for shard in self._shards():
+            with self.app.app_context(), using_shard(shard):
+                next_attempts.append(db.session.query(db.func.min(NotificationOutbox.next_attempt_at)).filter(
+                    NotificationOutbox.status == 'PENDING',
+                    NotificationOutbox.provider.in_(list(self.providers))
+                ).scalar())
+        next_attempt = min((when for when in next_attempts if when is not None), default=None)
+        if next_attempt is None:
+            return self.poll_seconds
+        return max(0.0, min((next_attempt - datetime.now()).total_seconds(), self.poll_seconds))
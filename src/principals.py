@@ -0,0 +1,60 @@
+# src/principals.py - TTL cache of logged-in user principals, so page views skip the users table
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+class UserPrincipal(UserMixin):
+    """The fields requests read from current_user, detached from any database session"""
+    def __init__(self, id: int, username: str, role: str, full_name: str, facility: str, auth_version: int):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.full_name = full_name
+        self.facility = facility
+        self.auth_version = auth_version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role, user.full_name, user.facility, user.auth_version)
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username} v{self.auth_version}>'
+
+class PrincipalCache:
+    """
+    Principals by user id, each kept for at most ttl_seconds. A hit also needs the
+    auth version stamped in the session at login to match, so a worker with an old
+    entry reloads as soon as a session carrying a newer version reaches it; other
+    workers' stale entries age out within the TTL.
+    """
+    def __init__(self, ttl_seconds: float = 60, max_size: int = 1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user id -> (expires_at, principal), least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, auth_version: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic() or entry[1].auth_version != auth_version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, principal: UserPrincipal) -> UserPrincipal:
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl_seconds, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,149 @@
+# src/query_inspector.py - Development-mode N+1 and slow-query detector
+import json
+import os
+import re
+import time
+import traceback
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+def query_budget(max_queries: int):
+    """Declare the most SQL statements a view may run; put it between @app.route and @login_required"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+def fingerprint(statement: str) -> str:
+    """SQL with literals and IN-lists collapsed, so the same query with other values matches"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    sql = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+def _call_site() -> list:
+    """Stack frames from this project's own code, innermost last"""
+    frames = []
+    for frame in traceback.extract_stack()[:-3]:
+        if frame.filename.startswith(SRC_ROOT) and 'site-packages' not in frame.filename \
+                and not frame.filename.endswith('query_inspector.py'):
+            frames.append(f"{os.path.relpath(frame.filename, SRC_ROOT)}:{frame.lineno} in {frame.name}")
+    return frames
+
+class QueryInspector:
+    """
+    Records every statement a request runs. After the request it reports
+    fingerprints that repeat more than repeat_threshold times (the N+1 shape),
+    with the call site, and statements slower than slow_query_ms with their
+    EXPLAIN QUERY PLAN. Reports go to the log and the last few are kept for
+    /admin/queries. In strict mode a repeat or a broken @query_budget raises
+    QueryBudgetExceeded, failing the request under the test client.
+    """
+    def __init__(self, repeat_threshold: int = 5, slow_query_ms: float = 100, strict: bool = False, keep: int = 50):
+        self.repeat_threshold = repeat_threshold
+        self.slow_query_ms = slow_query_ms
+        self.strict = strict
+        self.reports = deque(maxlen=keep)
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        print(f"⚠️ Query inspector enabled{' (strict)' if self.strict else ''} - development use only")
+        return self
+
+    def _before_request(self):
+        g.inspected_queries = []
+        g.inspecting_plan = False
+
+    def _recording(self) -> bool:
+        return has_request_context() and 'inspected_queries' in g and not g.inspecting_plan
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self._recording():
+            conn.info.setdefault('inspector_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self._recording() or not conn.info.get('inspector_started'):
+            return
+        g.inspected_queries.append({
+            'statement': statement,
+            'parameters': None if executemany else parameters,
+            'ms': (time.perf_counter() - conn.info['inspector_started'].pop()) * 1000,
+            'stack': _call_site()
+        })
+
+    def _explain(self, statement: str, parameters) -> list:
+        from .database import db
+
+        g.inspecting_plan = True
+        try:
+            rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+            return [row[-1] for row in rows]
+        except Exception as e:
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            g.inspecting_plan = False
+
+    def build_report(self, queries: list) -> dict:
+        by_fingerprint = {}
+        for query in queries:
+            by_fingerprint.setdefault(fingerprint(query['statement']), []).append(query)
+
+        repeated = [{
+            'fingerprint': key,
+            'count': len(group),
+            'ms': round(sum(q['ms'] for q in group), 2),
+            'stack': group[-1]['stack']
+        } for key, group in by_fingerprint.items() if len(group) > self.repeat_threshold]
+
+        slow = [{
+            'statement': query['statement'],
+            'ms': round(query['ms'], 2),
+            'plan': self._explain(query['statement'], query['parameters'])
+                    if query['statement'].lstrip().upper().startswith('SELECT') else [],
+            'stack': query['stack']
+        } for query in queries if query['ms'] >= self.slow_query_ms]
+
+        return {
+            'request_id': g.get('request_id'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'queries': len(queries),
+            'ms': round(sum(q['ms'] for q in queries), 2),
+            'repeated': sorted(repeated, key=lambda r: -r['count']),
+            'slow': slow
+        }
+
+    def _after_request(self, response):
+        queries = g.pop('inspected_queries', None)
+        if queries is None:
+            return response
+
+        report = self.build_report(queries)
+        view = self.app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        report['budget'] = budget
+        over_budget = budget is not None and report['queries'] > budget
+
+        if report['repeated'] or report['slow'] or over_budget:
+            self.reports.appendleft(report)
+            print(json.dumps({'event': 'query_report', **report}), flush=True)
+
+        if self.strict and (report['repeated'] or over_budget):
+            problems = [f"{r['count']}x {r['fingerprint'][:120]}" for r in report['repeated']]
+            if over_budget:
+                problems.insert(0, f"{report['queries']} queries, budget {budget}")
+            raise QueryBudgetExceeded(f"{request.method} {request.path}: " + '; '.join(problems))
+        return response
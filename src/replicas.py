@@ -0,0 +1,77 @@
+# src/replicas.py - Read-only connections for reports, exports and analytics
+import os
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+class ReadEngines:
+    """
+    The read-only twin of each engine the app writes through. SQLite files are
+    reopened with mode=ro, so a report can never take a write lock, and in WAL
+    mode it reads a snapshot without blocking the writer either. Elsewhere
+    READ_DATABASE_URL (e.g. a PostgreSQL replica) stands in for the main database.
+    """
+    def __init__(self, primary_url: str, replica_url: str = None):
+        self.primary_url = make_url(primary_url)
+        self.replica_url = replica_url
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def read_url(self, url):
+        if self.replica_url and url == self.primary_url:
+            return self.replica_url
+        if url.drivername.startswith('sqlite') and url.database and url.database != ':memory:':
+            return f"sqlite:///file:{os.path.abspath(url.database)}?mode=ro&uri=true"
+        return None
+
+    def for_engine(self, engine):
+        """The read-only engine for a writable one, or the engine itself if there is none"""
+        key = str(engine.url)
+        with self._lock:
+            if key not in self._engines:
+                url = self.read_url(engine.url)
+                self._engines[key] = create_engine(url) if url else engine
+            return self._engines[key]
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+
+def read_engine(engine):
+    """Read-only twin of an engine, for code that runs Core queries on an engine directly"""
+    return current_app.extensions['read_engines'].for_engine(engine)
+
+def is_reading() -> bool:
+    return has_app_context() and g.get('read_only', False)
+
+def read_only(view):
+    """
+    Send the rest of this request's SELECTs to the read-only engine. Writes (e.g.
+    indicator rollups) still go to the primary, but reads no longer see the
+    request's own uncommitted changes, so only use it on views that report.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True  # Left set so streamed responses keep reading from the replica
+        return view(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def reading():
+    """The with-block equivalent of @read_only, for background jobs"""
+    previous = g.get('read_only', False)
+    g.read_only = True
+    try:
+        yield
+    finally:
+        g.read_only = previous
+
+def init_read_replica(app):
+    app.extensions['read_engines'] = ReadEngines(app.config['SQLALCHEMY_DATABASE_URI'],
+                                                 os.environ.get('READ_DATABASE_URL'))
+    return app
@@ -0,0 +1,249 @@
+# src/research_export.py - De-identified visit-level export for the public health registry
+import csv
+import glob
+import hashlib
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import Integer, String, and_, case, cast, distinct, func, select, true
+
+from .clinical_codes import HISTORY_CODES, SYMPTOM_CODES, decode_flags
+from .database import ANCVisit, Patient
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Villages recorded at registration, coarsened to their sub-county
+VILLAGE_SUB_COUNTIES = {
+    "murang'a town": 'Kiharu',
+    'kiharu': 'Kiharu',
+    'kahuro': 'Kahuro',
+    'kangema': 'Kangema',
+    'kiriaini': 'Mathioya',
+    'mathioya': 'Mathioya',
+    'kigumo': 'Kigumo',
+    'kandara': 'Kandara',
+    'maragua': 'Maragwa',
+    'maragwa': 'Maragwa',
+    'kenol': 'Maragwa',
+    'gatanga': 'Gatanga',
+}
+
+# (lower bound inclusive, upper bound exclusive, label)
+AGE_BANDS = [
+    (0, 20, '<20'),
+    (20, 25, '20-24'),
+    (25, 30, '25-29'),
+    (30, 35, '30-34'),
+    (35, 200, '35+'),
+]
+
+# Gestation at the visit, coarsened to trimesters with term split off
+GESTATION_BANDS = [
+    (0, 14, '<14'),
+    (14, 28, '14-27'),
+    (28, 37, '28-36'),
+    (37, 100, '37+'),
+]
+
+# ANC contacts past the fourth (the MOH 711 'ANC 4th visit') are reported together
+MAX_VISIT_NUMBER = 4
+
+# A visit row is only exported if at least k patients share all of these
+QUASI_IDENTIFIERS = ['visit_month', 'age_band', 'sub_county', 'gestation_band', 'visit_number']
+
+EXPORT_COLUMNS = [
+    'patient_key', 'visit_month', 'age_band', 'sub_county', 'visit_number', 'gestation_band',
+    'systolic_bp', 'diastolic_bp', 'urine_protein', 'symptoms', 'medical_history',
+    'risk_score', 'risk_level'
+]
+
+def _band_expression(value, bands):
+    return case(*[(and_(value >= low, value < high), label) for low, high, label in bands], else_='Unknown')
+
+def _age_band_expression():
+    # Age in whole years at the visit, banded in SQL so rows never carry the dob
+    age = cast((func.julianday(ANCVisit.visit_date) - func.julianday(Patient.dob)) / 365.25, Integer)
+    return _band_expression(age, AGE_BANDS)
+
+def _visit_number_expression():
+    return case(
+        (ANCVisit.visit_number >= MAX_VISIT_NUMBER, f'{MAX_VISIT_NUMBER}+'),
+        (ANCVisit.visit_number >= 1, cast(ANCVisit.visit_number, String)),
+        else_='Unknown'
+    )
+
+def _sub_county_expression():
+    village = func.lower(func.trim(func.coalesce(Patient.village, '')))
+    return case(VILLAGE_SUB_COUNTIES, value=village, else_='Other')
+
+class ResearchExporter:
+    def __init__(self, engines, key: str = None, k: int = 5, chunk_size: int = 50000, workers: int = 4):
+        """`engines` is one engine, or one per facility database when sharded"""
+        key = key or os.environ.get('RESEARCH_EXPORT_KEY')
+        if not key:
+            raise ValueError("A hashing key is required (set RESEARCH_EXPORT_KEY)")
+
+        self.engines = list(engines) if isinstance(engines, (list, tuple)) else [engines]
+        self.key = key.encode('utf-8')
+        self.k = k
+        self.chunk_size = chunk_size
+        self.workers = workers
+        # In QUASI_IDENTIFIERS order, all computed in SQL
+        self.quasi_identifiers = [
+            func.strftime('%Y-%m', ANCVisit.visit_date),
+            _age_band_expression(),
+            _sub_county_expression(),
+            _band_expression(ANCVisit.gestation_weeks, GESTATION_BANDS),
+            _visit_number_expression(),
+        ]
+
+    def patient_key(self, patient_id: str) -> str:
+        """Keyed hash so records link across exports without exposing the patient ID"""
+        return hmac.new(self.key, patient_id.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def _period_filter(self, start, end):
+        conditions = []
+        if start:
+            conditions.append(ANCVisit.visit_date >= start)
+        if end:
+            conditions.append(ANCVisit.visit_date < end)
+        return and_(true(), *conditions)
+
+    def _class_query(self, period, small: bool):
+        patients = func.count(distinct(ANCVisit.patient_id))
+        columns = list(self.quasi_identifiers)
+        if small:
+            columns.append(func.group_concat(distinct(ANCVisit.patient_id)))
+        return select(*columns).select_from(
+            ANCVisit.__table__.join(Patient.__table__, ANCVisit.patient_id == Patient.patient_id)
+        ).where(period).group_by(*self.quasi_identifiers).having(patients < self.k if small else patients >= self.k)
+
+    def _suppressed_classes(self, period) -> set:
+        """
+        Quasi-identifier classes covering fewer than k distinct patients, counted
+        in SQL. With several facility databases a patient can be in more than one,
+        so a class below k in every database is judged on its patients' IDs
+        combined (fewer than k per database), unless it reaches k in one of them.
+        """
+        small = {}
+        for engine in self.engines:
+            with engine.connect() as conn:
+                for row in conn.execute(self._class_query(period, small=True)):
+                    small.setdefault(tuple(row[:-1]), set()).update(row[-1].split(','))
+        if len(self.engines) == 1:
+            return set(small)
+
+        large = set()
+        for engine in self.engines:
+            with engine.connect() as conn:
+                large.update(tuple(row) for row in conn.execute(self._class_query(period, small=False)))
+        return {group for group, patients in small.items() if group not in large and len(patients) < self.k}
+
+    def _chunk_ranges(self, period) -> list:
+        """(engine, id range) for every chunk; visit ids repeat across facility databases"""
+        query = select(func.min(ANCVisit.id), func.max(ANCVisit.id)).where(period)
+        ranges = []
+        for engine in self.engines:
+            with engine.connect() as conn:
+                low, high = conn.execute(query).one()
+            if low is not None:
+                ranges += [(engine, (start, min(start + self.chunk_size, high + 1)))
+                           for start in range(low, high + 1, self.chunk_size)]
+        return ranges
+
+    def _export_chunk(self, number, engine, id_range, period, suppressed, output_dir, fmt):
+        query = select(
+            ANCVisit.patient_id, *self.quasi_identifiers, ANCVisit.systolic_bp, ANCVisit.diastolic_bp,
+            ANCVisit.urine_protein, ANCVisit.symptom_flags, ANCVisit.history_flags,
+            ANCVisit.risk_score, ANCVisit.risk_level
+        ).select_from(ANCVisit.__table__.join(Patient.__table__, ANCVisit.patient_id == Patient.patient_id)
+        ).where(period, ANCVisit.id >= id_range[0], ANCVisit.id < id_range[1]).order_by(ANCVisit.id)
+
+        rows = []
+        dropped = 0
+        with engine.connect() as conn:
+            for row in conn.execute(query):
+                if tuple(row[1:6]) in suppressed:
+                    dropped += 1
+                    continue
+                rows.append({
+                    'patient_key': self.patient_key(row[0]),
+                    **dict(zip(QUASI_IDENTIFIERS, row[1:6])),
+                    'systolic_bp': row[6],
+                    'diastolic_bp': row[7],
+                    'urine_protein': row[8],
+                    'symptoms': ';'.join(decode_flags(row[9], SYMPTOM_CODES)),
+                    'medical_history': ';'.join(decode_flags(row[10], HISTORY_CODES)),
+                    'risk_score': row[11],
+                    'risk_level': row[12],
+                })
+
+        if not rows:
+            return {'file': None, 'rows': 0, 'suppressed': dropped}
+
+        filename = f"part-{number:05d}.{fmt}"
+        path = os.path.join(output_dir, filename)
+        if fmt == 'parquet':
+            table = pyarrow.Table.from_pylist(rows)
+            pyarrow.parquet.write_table(table, path, compression='snappy')
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+
+        return {'file': filename, 'rows': len(rows), 'suppressed': dropped}
+
+    def export(self, output_dir: str, start: datetime = None, end: datetime = None, fmt: str = None) -> dict:
+        """
+        Stream visits joined with patients into chunked files, one worker per chunk.
+        Memory stays bounded at roughly workers x chunk_size rows. Part files
+        from an earlier export to the same directory are removed first.
+        """
+        fmt = fmt or ('parquet' if pyarrow else 'csv')
+        if fmt == 'parquet' and not pyarrow:
+            raise ValueError("Parquet output needs pyarrow installed")
+
+        os.makedirs(output_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(output_dir, 'part-*.*')) + glob.glob(os.path.join(output_dir, 'manifest.json')):
+            os.remove(stale)
+        period = self._period_filter(start, end)
+        suppressed = self._suppressed_classes(period)
+        ranges = self._chunk_ranges(period)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(
+                lambda args: self._export_chunk(args[0], *args[1], period, suppressed, output_dir, fmt),
+                enumerate(ranges, start=1)
+            ))
+
+        manifest = {
+            'generated_at': datetime.now().isoformat(),
+            'format': fmt,
+            'k_anonymity': self.k,
+            'quasi_identifiers': QUASI_IDENTIFIERS,
+            'period': {
+                'start': start.isoformat() if start else None,
+                'end': end.isoformat() if end else None
+            },
+            'columns': EXPORT_COLUMNS,
+            'databases': len(self.engines),
+            'files': [result['file'] for result in results if result['file']],
+            'rows': sum(result['rows'] for result in results),
+            'rows_suppressed': sum(result['suppressed'] for result in results),
+            'suppressed_classes': sorted(list(group) for group in suppressed)
+        }
+
+        with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        print(f"✅ Research export: {manifest['rows']} rows in {len(manifest['files'])} files "
+              f"({manifest['rows_suppressed']} suppressed below k={self.k})")
+        return manifest
\ No newline at end of file
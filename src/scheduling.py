@@ -0,0 +1,80 @@
+# src/scheduling.py - Timer queue that sleeps until the next deadline
+import heapq
+import itertools
+import threading
+from datetime import datetime
+
+class TimerQueue:
+    """
+    Min-heap of (due time, key). A single daemon thread waits on a condition
+    until the earliest deadline, so thousands of pending timers cost nothing
+    between deadlines. Rescheduling or cancelling a key is O(log n) via lazy
+    deletion: stale heap entries are skipped when they surface.
+    """
+    def __init__(self, callback, name: str = 'timer-queue'):
+        self.callback = callback  # Called as callback(key) from the timer thread
+        self.name = name
+        self._heap = []
+        self._entries = {}  # key -> live (due, seq, key) entry
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, due: datetime):
+        """Add a timer or move an existing one"""
+        with self._condition:
+            entry = (due, next(self._counter), key)
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def cancel(self, key):
+        with self._condition:
+            self._entries.pop(key, None)
+
+    def next_due(self):
+        with self._condition:
+            self._discard_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _discard_stale(self):
+        while self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    self._discard_stale()
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = (self._heap[0][0] - datetime.now()).total_seconds()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(timeout=delay)
+                if self._stopped:
+                    return
+                due, seq, key = heapq.heappop(self._heap)
+                del self._entries[key]
+
+            try:
+                self.callback(key)
+            except Exception as e:
+                print(f"❌ {self.name}: error handling timer {key}: {e}")
\ No newline at end of file
@@ -1,20 +1,186 @@
 from datetime import datetime
+import heapq
+import itertools
+import re
+import sqlite3
 # No changes needed here unless there are other imports
 
+PRIORITY_RANK = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+
+def alert_kind(message: str) -> str:
+    """'High glucose alert: 215.0 mg/dL' -> 'high glucose alert: # mg/dl', so repeats share a kind"""
+    return re.sub(r'\d+(\.\d+)?', '#', message.lower())
+
+class AlertOverflowStore:
+    """SQLite table for alerts pushed out of memory by AlertingService's cap"""
+    def __init__(self, path: str = 'alert_overflow.db'):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS alert_overflow (
+                id INTEGER PRIMARY KEY,
+                patient_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                message TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL
+            )
+        """)
+        self.connection.commit()
+    
+    def save(self, alert: dict):
+        self.connection.execute(
+            "INSERT INTO alert_overflow (patient_id, kind, message, priority, count, first_seen, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (alert['patient_id'], alert['kind'], alert['message'], alert['priority'], alert['count'],
+             alert['timestamp'].isoformat(), alert['last_seen'].isoformat())
+        )
+        self.connection.commit()
+    
+    def count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM alert_overflow").fetchone()[0]
+
 class AlertingService:
-    def __init__(self):
-        self.active_alerts = []
+    """
+    Active alerts in a heap keyed by (priority, first seen), most urgent first.
+    A repeat of the same kind of alert for a patient within coalesce_seconds
+    bumps the existing alert's count instead of adding another. Acknowledged or
+    popped alerts are dropped lazily when they reach the top of the heap. Past
+    max_active, the least urgent alert moves to the overflow store. New alerts
+    and raised priorities are passed to notify(alert), e.g. an OutboxNotifier.
+    """
+    def __init__(self, coalesce_seconds: int = 3600, max_active: int = 1000, overflow: AlertOverflowStore = None,
+                 notify=None):
+        self.coalesce_seconds = coalesce_seconds
+        self.max_active = max_active
+        self.overflow = overflow
+        self.notify = notify
+        self.overflow_count = 0
+        self._alerts = {}  # alert id -> alert, live alerts only
+        self._latest = {}  # (patient_id, kind) -> alert id still open for coalescing
+        self._heap = []  # (rank, first seen, alert id) - most urgent on top
+        self._evict_heap = []  # (-rank, -first seen timestamp, alert id) - least urgent on top
+        self._ids = itertools.count(1)
     
-    def send_alert(self, patient_id: str, message: str, priority: str = "medium"):
+    def __len__(self):
+        return len(self._alerts)
+    
+    def count(self) -> int:
+        return len(self._alerts)
+    
+    @property
+    def active_alerts(self) -> list:
+        """Live alerts, most urgent first"""
+        return self.top(len(self._alerts))
+    
+    def send_alert(self, patient_id: str, message: str, priority: str = "medium", kind: str = None) -> dict:
+        now = datetime.now()
+        priority = priority.lower()
+        kind = kind or alert_kind(message)
+        
+        existing = self._alerts.get(self._latest.get((patient_id, kind)))
+        if existing and (now - existing['timestamp']).total_seconds() <= self.coalesce_seconds:
+            existing['count'] += 1
+            existing['last_seen'] = now
+            existing['message'] = message
+            if PRIORITY_RANK.get(priority, 3) < PRIORITY_RANK.get(existing['priority'], 3):
+                # Raised priority: push the new key; the old heap entry goes stale
+                existing['priority'] = priority
+                self._push(existing)
+                self._notify(existing)
+            print(f"ALERT [{existing['priority'].upper()}] x{existing['count']}: Patient {patient_id} - {message}")
+            return existing
+        
         alert = {
+            'id': next(self._ids),
             'patient_id': patient_id,
+            'kind': kind,
             'message': message,
             'priority': priority,
-            'timestamp': datetime.now(),
+            'timestamp': now,
+            'last_seen': now,
+            'count': 1,
             'acknowledged': False
         }
-        self.active_alerts.append(alert)
+        self._alerts[alert['id']] = alert
+        self._latest[(patient_id, kind)] = alert['id']
+        self._push(alert)
         print(f"ALERT [{priority.upper()}]: Patient {patient_id} - {message}")
+        self._notify(alert)
+        
+        while len(self._alerts) > self.max_active:
+            self._evict()
+        return alert
+    
+    def _notify(self, alert: dict):
+        if self.notify is None:
+            return
+        try:
+            self.notify(alert)
+        except Exception as e:
+            # The alert stays active here even if it couldn't be queued for delivery
+            print(f"❌ Could not queue notification for alert {alert['id']}: {e}")
+    
+    def _push(self, alert: dict):
+        rank = PRIORITY_RANK.get(alert['priority'], 3)
+        alert['_rank'] = rank
+        heapq.heappush(self._heap, (rank, alert['timestamp'], alert['id']))
+        heapq.heappush(self._evict_heap, (-rank, -alert['timestamp'].timestamp(), alert['id']))
+        if max(len(self._heap), len(self._evict_heap)) > 2 * len(self._alerts) + 64:
+            self._compact()
+    
+    def _compact(self):
+        # Rebuild both heaps from live alerts once stale entries outnumber them
+        self._heap = [(a['_rank'], a['timestamp'], a['id']) for a in self._alerts.values()]
+        self._evict_heap = [(-a['_rank'], -a['timestamp'].timestamp(), a['id']) for a in self._alerts.values()]
+        heapq.heapify(self._heap)
+        heapq.heapify(self._evict_heap)
+    
+    def _is_live(self, entry, rank) -> bool:
+        alert = self._alerts.get(entry[2])
+        return alert is not None and alert['_rank'] == rank
+    
+    def _remove(self, alert_id):
+        alert = self._alerts.pop(alert_id, None)
+        if alert and self._latest.get((alert['patient_id'], alert['kind'])) == alert_id:
+            del self._latest[(alert['patient_id'], alert['kind'])]
+        return alert
+    
+    def _evict(self):
+        while self._evict_heap:
+            entry = heapq.heappop(self._evict_heap)
+            if self._is_live(entry, -entry[0]):
+                alert = self._remove(entry[2])
+                self.overflow_count += 1
+                if self.overflow:
+                    self.overflow.save(alert)
+                return
+    
+    def acknowledge(self, alert_id) -> bool:
+        alert = self._remove(alert_id)
+        if alert:
+            alert['acknowledged'] = True
+        return alert is not None
+    
+    def pop(self):
+        """Remove and return the most urgent alert, or None"""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry, entry[0]):
+                return self._remove(entry[2])
+        return None
+    
+    def top(self, n: int = 10) -> list:
+        """The n most urgent alerts, without removing them - O(n log size)"""
+        taken = []
+        while self._heap and len(taken) < n:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry, entry[0]):
+                taken.append(entry)
+        for entry in taken:
+            heapq.heappush(self._heap, entry)
+        return [self._alerts[entry[2]] for entry in taken]
 
 class ClinicalUIService:
     def __init__(self, data_store):
@@ -0,0 +1,184 @@
+# src/sharding.py - Optional per-facility database files, with county-wide reads fanned out over all of them
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_login import current_user
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, orm
+
+from .replicas import is_reading
+
+# Clinical records live in their facility's file, with the outbox rows for their
+# alerts so both commit together; users, rollups, digests, claims and the digest
+# messages' outbox rows stay in the main database
+SHARDED_TABLES = ('patients', 'anc_visits', 'alerts', 'follow_ups', 'notification_outbox')
+
+# Names of g values fan_out() hands its pool threads, so work done there still
+# belongs to the request that fanned out (e.g. its SQL counts in /metrics)
+FAN_OUT_CONTEXT = []
+
+def shard_key(facility: str) -> str:
+    """File name stem for a facility, e.g. "Murang'a County Hospital" -> murang_a_county_hospital"""
+    return re.sub(r'[^a-z0-9]+', '_', facility.lower()).strip('_')
+
+class ShardMap:
+    """
+    One SQLite file per facility under SHARD_DIR, named by shard_key(). Configured
+    facilities get their file from init-db; a file copied into the directory is
+    picked up without touching the main database. Facilities without a file
+    (e.g. the county health office) keep using the main database.
+    """
+    def __init__(self, directory: str, facilities=(), max_workers: int = 8):
+        self.directory = directory
+        self.facilities = list(facilities)
+        self.max_workers = max_workers
+        self._engines = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.db")
+
+    def keys(self) -> list:
+        """Configured facilities, then any other shard files in the directory"""
+        keys = [shard_key(facility) for facility in self.facilities]
+        if os.path.isdir(self.directory):
+            keys += sorted(name[:-3] for name in os.listdir(self.directory)
+                           if name.endswith('.db') and name[:-3] not in keys)
+        return keys
+
+    def shard_for(self, facility: str):
+        key = shard_key(facility)
+        if facility in self.facilities or os.path.exists(self.path(key)):
+            return key
+        return None
+
+    def engine(self, key: str):
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                os.makedirs(self.directory, exist_ok=True)
+                engine = self._engines[key] = create_engine(f"sqlite:///{os.path.abspath(self.path(key))}")
+            return engine
+
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='shard-fan-out')
+            return self._executor
+
+    def dispose(self):
+        """Drop connections and pool threads; gunicorn workers call this after fork"""
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._executor = None
+
+def shard_map(app=None):
+    """The app's ShardMap, or None when sharding is off"""
+    app = app or (current_app if has_app_context() else None)
+    return app.extensions.get('shards') if app is not None else None
+
+def current_shard():
+    """Shard key clinical queries go to in this context; None means the main database"""
+    return g.get('shard') if has_app_context() else None
+
+@contextmanager
+def using_shard(key):
+    """Send clinical queries in this app context to one shard (None = main database)"""
+    previous = g.get('shard')
+    g.shard = key
+    try:
+        yield key
+    finally:
+        g.shard = previous
+
+class RoutingSession(SignallingSession):
+    """
+    Routes clinical tables, and plain SQL, to the pinned shard; everything else as
+    usual. SELECTs in @read_only views go to that database's read-only engine.
+    """
+    def get_bind(self, mapper=None, clause=None):
+        bind = self._write_bind(mapper, clause)
+        if is_reading() and getattr(clause, 'is_select', False):
+            return self.app.extensions['read_engines'].for_engine(bind)
+        return bind
+
+    def _write_bind(self, mapper, clause):
+        key = current_shard()
+        if key is not None:
+            # Core inserts/updates name their table; text and bare connections follow the pin
+            table = mapper.persist_selectable if mapper is not None else getattr(clause, 'table', None)
+            if table is None or table.name in SHARDED_TABLES:
+                return shard_map(self.app).engine(key)
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+def shard_keys() -> list:
+    """Every database clinical rows live in: None (the main database), then each shard"""
+    shards = shard_map()
+    return [None] + (shards.keys() if shards else [])
+
+def fan_out(fn, everywhere: bool = False) -> list:
+    """
+    fn()'s results for every shard plus the main database, each run in a pool
+    thread with its own app context and session, so shards are read in parallel.
+    Inside a request pinned to one shard (a facility user), or with sharding off,
+    fn just runs here once; everywhere=True reads all shards regardless, for
+    county-wide state such as the cohort index or patient IDs.
+    """
+    shards = shard_map()
+    if shards is None or (current_shard() is not None and not everywhere):
+        return [fn()]
+
+    app = current_app._get_current_object()
+    read_only = is_reading()
+    context = {name: g.get(name) for name in FAN_OUT_CONTEXT if name in g}
+
+    def run(key):
+        with app.app_context(), using_shard(key):
+            g.read_only = read_only
+            for name, value in context.items():
+                setattr(g, name, value)
+            return fn()
+
+    return list(shards.executor().map(run, shard_keys()))
+
+def shards_where(test) -> list:
+    """Keys of the databases (None = main) where test() is true, checking every shard like fan_out(everywhere=True)"""
+    return [key for key, found in fan_out(lambda: (current_shard(), bool(test())), everywhere=True) if found]
+
+def init_sharding(app, facilities):
+    """Turn on per-facility databases when SHARD_DIR is set"""
+    directory = os.environ.get('SHARD_DIR')
+    if not directory:
+        return app
+
+    from .facility_scope import facility_scope
+
+    shards = app.extensions['shards'] = ShardMap(directory, facilities,
+                                                 max_workers=int(os.environ.get('SHARD_FAN_OUT_WORKERS', 8)))
+
+    @app.before_request
+    def _pin_shard():
+        # Facility users work in their own file; county users pick one with ?facility=,
+        # or ?shard= on links to a row in it, and otherwise see the main database plus
+        # fanned-out county totals
+        if not current_user.is_authenticated:
+            return
+        facility = facility_scope()
+        if facility is None and request.args.get('shard') in shards.keys():
+            g.shard = request.args['shard']
+            return
+        facility = facility or request.args.get('facility')
+        g.shard = shards.shard_for(facility) if facility else None
+
+    print(f"✅ Sharding on: {len(shards.keys())} facility databases in {directory}")
+    return app
@@ -0,0 +1,348 @@
+# src/synthetic_data.py - Seeded county-scale ANC population for load and query testing
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, func, select
+
+from .clinical_codes import HISTORY_CODES, SYMPTOM_CODES
+from .database import Alert, ANCVisit, FollowUp, Patient, ESCALATION_DEADLINES, ESCALATION_ROLES
+from .followups import FOLLOW_UP_INTERVALS
+from .hypertension_ai import HypertensionAIAnalyzer
+
+FIRST_NAMES = ['Mary', 'Grace', 'Esther', 'Jane', 'Ann', 'Lucy', 'Faith', 'Mercy', 'Joyce', 'Nancy',
+               'Wanjiru', 'Njoki', 'Wangui', 'Nyokabi', 'Wairimu', 'Beatrice', 'Catherine', 'Purity']
+LAST_NAMES = ['Wanjiku', 'Nyambura', 'Wairimu', 'Njeri', 'Wambui', 'Muthoni', 'Wangari', 'Waithera',
+              'Kamau', 'Mwangi', 'Njoroge', 'Kariuki', 'Maina', 'Gitau', 'Ndungu', 'Kinyua']
+
+# Share of the county's ANC clients booking at each clinic; other facilities split what is left
+FACILITY_WEIGHTS = {
+    "Murang'a County Hospital": 0.34,
+    "Kangema Sub-County Hospital": 0.19,
+    "Maragua Hospital": 0.20,
+    "Kiharu Health Centre": 0.14,
+    "Gatanga Health Centre": 0.13,
+}
+
+# Villages in each clinic's catchment
+FACILITY_VILLAGES = {
+    "Murang'a County Hospital": ["Murang'a Town", 'Kiharu', 'Kahuro'],
+    "Kangema Sub-County Hospital": ['Kangema', 'Kiriaini', 'Mathioya'],
+    "Maragua Hospital": ['Maragua', 'Kenol', 'Kigumo'],
+    "Kiharu Health Centre": ['Kiharu', "Murang'a Town"],
+    "Gatanga Health Centre": ['Gatanga', 'Kandara'],
+}
+OTHER_VILLAGES = sorted({village for villages in FACILITY_VILLAGES.values() for village in villages})
+
+# WHO 8-contact schedule (weeks of gestation); visits before booking are not attended
+CONTACT_WEEKS = [12, 20, 26, 30, 34, 36, 38, 40]
+CONTACT_ATTENDANCE = 0.8
+REFERRAL_SHARE = 0.08  # Visits seen at the county hospital instead of the home clinic
+
+class SyntheticDataGenerator:
+    """
+    Generates patients, their ANC visits, the alerts the real analyzer raises for
+    them and the follow-ups each visit opened, and bulk-inserts them with Core
+    executemany one chunk of patients at a time. The same seed always produces
+    the same population. Given a ShardMap, each patient's rows go to her home
+    facility's database, as the app would have written them; ids follow
+    generate_patient_id()'s MUR001 scheme, county-wide.
+    """
+    def __init__(self, engine, facilities: list, seed: int = 42, chunk_size: int = 5000,
+                 now: datetime = None, id_prefix: str = 'MUR', shards=None):
+        self.engine = engine
+        self.shards = shards
+        self.facilities = list(facilities)
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.now = now or datetime.now()
+        self.id_prefix = id_prefix
+        self.analyzer = HypertensionAIAnalyzer()
+
+        remaining = max(0.0, 1 - sum(FACILITY_WEIGHTS.get(f, 0) for f in self.facilities))
+        unknown = [f for f in self.facilities if f not in FACILITY_WEIGHTS]
+        self.weights = [FACILITY_WEIGHTS.get(f, remaining / len(unknown) if unknown else 0) for f in self.facilities]
+        self.referral_facility = self.facilities[0]
+
+    def _engine_for(self, facility: str):
+        key = self.shards.shard_for(facility) if self.shards else None
+        return self.shards.engine(key) if key else self.engine
+
+    def _engines(self) -> list:
+        """Every database rows may go to, main first"""
+        engines = [self.engine]
+        for facility in self.facilities:
+            engine = self._engine_for(facility)
+            if engine not in engines:
+                engines.append(engine)
+        return engines
+
+    def _history_flags(self, age: int) -> int:
+        rng = self.rng
+        names = []
+        first_pregnancy = rng.random() < (0.6 if age < 20 else 0.35 if age < 25 else 0.15)
+        if first_pregnancy:
+            names.append('first_pregnancy')
+        elif rng.random() < 0.05:
+            names.append('previous_preeclampsia')
+        if age < 20:
+            names.append('age_under_20')
+        if age > 35:
+            names.append('age_over_35')
+        for name, probability in (('chronic_hypertension', 0.05 if age > 35 else 0.025), ('diabetes', 0.02),
+                                  ('obesity', 0.08), ('multiple_pregnancy', 0.015), ('family_history', 0.06),
+                                  ('kidney_disease', 0.005)):
+            if rng.random() < probability:
+                names.append(name)
+        return sum(1 << HISTORY_CODES[name] for name in names)
+
+    def _preeclampsia_risk(self, history_flags: int) -> float:
+        risk = 0.03
+        for name, extra in (('previous_preeclampsia', 0.12), ('chronic_hypertension', 0.08),
+                            ('first_pregnancy', 0.03), ('multiple_pregnancy', 0.05), ('diabetes', 0.03)):
+            if history_flags & (1 << HISTORY_CODES[name]):
+                risk += extra
+        return risk
+
+    def _symptom_flags(self, gestation: int, severity: float) -> int:
+        rng = self.rng
+        names = []
+        if gestation < 14 and rng.random() < 0.15:
+            names.append('nausea_vomiting')
+        if rng.random() < 0.1:
+            names.append('fatigue')
+        if gestation >= 28 and rng.random() < 0.08:
+            names.append('swelling_face_hands')
+        if severity:
+            for name, probability in (('severe_headache', 0.4), ('visual_disturbances', 0.2),
+                                      ('upper_abdominal_pain', 0.15), ('swelling_face_hands', 0.4),
+                                      ('decreased_urine', 0.08), ('shortness_of_breath', 0.05)):
+                if rng.random() < probability * severity:
+                    names.append(name)
+        return sum(1 << SYMPTOM_CODES[name] for name in set(names))
+
+    def _patient(self, number: int) -> tuple:
+        """One pregnancy: (patient row, [visit rows])"""
+        rng = self.rng
+        age = min(45, max(15, int(rng.gauss(26, 6))))
+        history_flags = self._history_flags(age)
+        home = rng.choices(self.facilities, self.weights)[0]
+        village = rng.choice(FACILITY_VILLAGES.get(home, OTHER_VILLAGES))
+
+        # Late booking is common; pregnancies started up to ~14 months ago so some have delivered
+        booking_week = min(36, max(6, int(rng.gauss(18, 6))))
+        delivery_week = min(42, max(30, int(rng.gauss(39, 1.5))))
+        lmp = self.now - timedelta(days=rng.randint(booking_week * 7, 60 * 7))
+
+        # Patient-level BP baseline plus a hypertensive tail
+        base_systolic = rng.gauss(110, 9)
+        base_diastolic = rng.gauss(70, 7)
+        if history_flags & (1 << HISTORY_CODES['chronic_hypertension']):
+            base_systolic += 25
+            base_diastolic += 15
+        onset_week, severity = None, 0.0
+        if rng.random() < self._preeclampsia_risk(history_flags):
+            onset_week, severity = rng.randint(24, 38), rng.uniform(0.3, 1.0)
+        elif rng.random() < 0.06:
+            onset_week, severity = rng.randint(22, 38), 0.0  # Gestational hypertension without proteinuria
+
+        weeks = [booking_week] + [week for week in CONTACT_WEEKS
+                                  if week > booking_week + 1 and rng.random() < CONTACT_ATTENDANCE]
+        visits = []
+        for week in weeks:
+            week = min(week + rng.randint(-1, 1), delivery_week) if week != booking_week else week
+            visit_date = lmp + timedelta(weeks=week, days=rng.randint(0, 6), hours=rng.randint(7, 16),
+                                         minutes=rng.randint(0, 59))
+            if week >= delivery_week or visit_date > self.now:
+                break
+            if visits and visit_date <= visits[-1]['visit_date']:
+                continue
+
+            systolic = base_systolic + rng.gauss(0, 6)
+            diastolic = base_diastolic + rng.gauss(0, 5)
+            protein = 1 if rng.random() < 0.03 else 0
+            visit_severity = 0.0
+            if onset_week is not None and week >= onset_week:
+                progress = min(1.0, (week - onset_week + 1) / 4)
+                systolic += (20 + 35 * severity) * progress
+                diastolic += (14 + 22 * severity) * progress
+                if severity:
+                    visit_severity = severity * progress
+                    protein = max(protein, min(3, 1 + int(visit_severity * 2.5)))
+
+            visits.append({
+                'visit_date': visit_date,
+                'gestation_weeks': week,
+                'facility': self.referral_facility if rng.random() < REFERRAL_SHARE else home,
+                'systolic_bp': int(systolic),
+                'diastolic_bp': int(diastolic),
+                'urine_protein': protein,
+                'symptom_flags': self._symptom_flags(week, visit_severity),
+                'history_flags': history_flags,
+            })
+
+        patient = {
+            'patient_id': f"{self.id_prefix}{number:03d}",
+            'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'dob': (lmp - timedelta(days=age * 365 + rng.randint(0, 364))).date(),
+            'gender': 'female',
+            'gestation_weeks': visits[-1]['gestation_weeks'] if visits else booking_week,
+            'phone': f"07{rng.randint(10000000, 99999999)}",
+            'village': village,
+            'facility': home,
+            'registered_date': visits[0]['visit_date'] if visits else lmp + timedelta(weeks=booking_week),
+        }
+        return patient, visits
+
+    def _alert(self, visit: dict, result: dict, alert: dict) -> dict:
+        """Alert row for a visit; older alerts have been worked, recent ones are mid-escalation"""
+        rng = self.rng
+        created_at = visit['visit_date']
+        row = {
+            'patient_id': visit['patient_id'],
+            'message': alert['message'],
+            'priority': alert['priority'],
+            'risk_score': result['risk_score'],
+            'risk_factors': json.dumps(result['risk_factors']),
+            'created_at': created_at,
+            'facility': visit['facility'],
+            'resolved': False,
+            'acknowledged_at': None,
+            'acknowledged_by': None,
+            'resolved_at': None,
+            'resolved_by': None,
+            'escalation_level': 0,
+            'next_escalation_at': None,
+        }
+
+        if self.now - created_at > timedelta(days=2) and rng.random() < 0.97:
+            handled_at = created_at + timedelta(minutes=rng.randint(5, 36 * 60))
+            row.update(resolved=True, acknowledged_at=handled_at, acknowledged_by='Nurse Mary Wanjiku',
+                       resolved_at=handled_at + timedelta(minutes=rng.randint(5, 240)), resolved_by='Dr. John Kamau')
+            return row
+
+        deadline = ESCALATION_DEADLINES.get(alert['priority'])
+        if deadline:
+            # Escalations that would already have happened, so startup is not a burst
+            level = min(int((self.now - created_at) / deadline), len(ESCALATION_ROLES) - 1)
+            row['escalation_level'] = level
+            if level < len(ESCALATION_ROLES) - 1:
+                row['next_escalation_at'] = created_at + deadline * (level + 1)
+        return row
+
+    def _follow_ups(self, visits: list) -> list:
+        """The follow-up each visit opened, completed by the next visit or missed, as FollowUpScheduler leaves them"""
+        rows = []
+        for visit, next_visit in zip(visits, visits[1:] + [None]):
+            due_at = visit['visit_date'] + FOLLOW_UP_INTERVALS.get(visit['risk_level'], timedelta(weeks=4))
+            row = {
+                'patient_id': visit['patient_id'],
+                'visit_id': visit['id'],
+                'facility': visit['facility'],
+                'risk_level': visit['risk_level'],
+                'reason': visit['recommendation'],
+                'due_at': due_at,
+                'status': 'PENDING',
+                'completed_at': None,
+                'completed_visit_id': None,
+                'missed_at': None,
+                'created_at': visit['visit_date'],
+            }
+            if next_visit and next_visit['visit_date'] <= due_at:
+                row.update(status='COMPLETED', completed_at=next_visit['visit_date'], completed_visit_id=next_visit['id'])
+            elif due_at <= self.now:
+                row.update(status='MISSED', missed_at=due_at)
+            rows.append(row)
+        return rows
+
+    def _chunk(self, first_number: int, count: int, next_visit_ids: dict) -> dict:
+        """{engine: {'patients', 'visits', 'alerts', 'follow_ups'}} for count patients; advances next_visit_ids"""
+        chunk = {}
+        for number in range(first_number, first_number + count):
+            patient, patient_visits = self._patient(number)
+            # Visit ids are per database, like every other id when sharded
+            engine = self._engine_for(patient['facility'])
+            rows = chunk.setdefault(engine, {'patients': [], 'visits': [], 'alerts': [], 'follow_ups': []})
+            for visit_number, visit in enumerate(patient_visits, start=1):
+                result = self.analyzer.analyze_pregnancy_hypertension_risk({
+                    'systolic_bp': visit['systolic_bp'],
+                    'diastolic_bp': visit['diastolic_bp'],
+                    'gestational_age_weeks': visit['gestation_weeks'],
+                    'urine_protein': visit['urine_protein'],
+                    'symptom_flags': visit['symptom_flags'],
+                    'history_flags': visit['history_flags'],
+                })
+                visit.update(id=next_visit_ids[engine], patient_id=patient['patient_id'], visit_number=visit_number,
+                             risk_score=result['risk_score'], risk_level=result['risk_level'].value,
+                             recommendation=result['recommendation'])
+                rows['visits'].append(visit)
+                next_visit_ids[engine] += 1
+
+                alert = self.analyzer.generate_hypertension_alert(patient['patient_id'], result)
+                if alert:
+                    rows['alerts'].append(self._alert(visit, result, alert))
+            self.analyzer.hypertension_alerts.clear()
+            rows['follow_ups'] += self._follow_ups(patient_visits)
+
+            # Latest-visit snapshot, as Patient.record_visit() would have left it
+            last = patient_visits[-1] if patient_visits else None
+            patient.update(
+                lmp_date=((last['visit_date'] if last else patient['registered_date'])
+                          - timedelta(weeks=patient['gestation_weeks'])).date(),
+                last_visit_id=last['id'] if last else None,
+                last_visit_date=last['visit_date'] if last else None,
+                last_systolic_bp=last['systolic_bp'] if last else None,
+                last_diastolic_bp=last['diastolic_bp'] if last else None,
+                last_urine_protein=last['urine_protein'] if last else None,
+                last_risk_level=last['risk_level'] if last else None,
+                last_risk_score=last['risk_score'] if last else None,
+            )
+            rows['patients'].append(patient)
+        return chunk
+
+    def _last_number(self, connection) -> int:
+        """Highest MUR number already used in one database"""
+        number = cast(func.substr(Patient.patient_id, len(self.id_prefix) + 1), Integer)
+        return connection.execute(
+            select(func.max(number)).where(Patient.patient_id.like(f"{self.id_prefix}%"))
+        ).scalar() or 0
+
+    def generate(self, patients: int = None, visits: int = None) -> dict:
+        """
+        Insert patients until either target is reached (the visit target is checked
+        per chunk, so it may be overshot by up to one chunk). Returns the row counts.
+        """
+        if not patients and not visits:
+            raise ValueError("Give a number of patients, visits or both")
+
+        # Patient numbers are county-wide; visit ids continue in each database
+        first_number = 1
+        next_visit_ids = {}
+        for engine in self._engines():
+            with engine.connect() as connection:
+                first_number = max(first_number, 1 + self._last_number(connection))
+                next_visit_ids[engine] = 1 + (connection.execute(select(func.max(ANCVisit.id))).scalar() or 0)
+
+        totals = {'patients': 0, 'visits': 0, 'alerts': 0, 'follow_ups': 0}
+        tables = {'patients': Patient.__table__, 'visits': ANCVisit.__table__, 'alerts': Alert.__table__,
+                  'follow_ups': FollowUp.__table__}
+        started = time.perf_counter()
+        while (not patients or totals['patients'] < patients) and (not visits or totals['visits'] < visits):
+            count = self.chunk_size if not patients else min(self.chunk_size, patients - totals['patients'])
+            chunk = self._chunk(first_number + totals['patients'], count, next_visit_ids)
+
+            for engine, rows in chunk.items():
+                with engine.begin() as connection:
+                    for name, table in tables.items():
+                        if rows[name]:
+                            connection.execute(table.insert(), rows[name])
+                for name in tables:
+                    totals[name] += len(rows[name])
+            print(f"  {totals['patients']} patients, {totals['visits']} visits, {totals['alerts']} alerts "
+                  f"({time.perf_counter() - started:.0f}s)")
+
+        print(f"✅ Synthetic data generated in {time.perf_counter() - started:.1f}s: "
+              f"{totals['patients']} patients, {totals['visits']} visits, {totals['alerts']} alerts, "
+              f"{totals['follow_ups']} follow-ups")
+        return totals
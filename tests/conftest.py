@@ -0,0 +1,88 @@
+# tests/conftest.py - Shared fixtures: the dashboard app on a throwaway SQLite file
+import os
+import sys
+import tempfile
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# muranga_dashboard reads these when it is imported
+TMP_DIR = tempfile.mkdtemp(prefix='muranga-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP_DIR, 'test.db')}"
+os.environ['ENABLE_SCHEDULERS'] = '0'
+os.environ['NOTIFICATION_FILE'] = os.path.join(TMP_DIR, 'notifications_sent.jsonl')
+# Each clinic gets its own database file, so county-wide reads fan out as in production;
+# rows written outside a request (or a using_shard block) land in the main database
+os.environ['SHARD_DIR'] = os.path.join(TMP_DIR, 'shards')
+os.environ.pop('READ_DATABASE_URL', None)
+
+FACILITY = "Murang'a County Hospital"
+
+@pytest.fixture
+def app():
+    """The app inside an app context, with every table (and shard) emptied and recreated"""
+    from muranga_dashboard import app
+    from src.database import db, create_schema
+    from src.sharding import SHARDED_TABLES, shard_map
+
+    with app.app_context():
+        db.drop_all()
+        shards = shard_map()
+        for key in shards.keys():
+            db.metadata.drop_all(bind=shards.engine(key), tables=[db.metadata.tables[name] for name in SHARDED_TABLES])
+        create_schema()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def add_visit(app):
+    """add_visit(patient_id, visit_date, ...) - a visit, registering the patient on first use"""
+    from src.database import db, Patient, ANCVisit
+
+    def add(patient_id, visit_date, visit_number=1, risk_level='Low Risk', facility=FACILITY, **patient):
+        if Patient.query.filter_by(patient_id=patient_id).first() is None:
+            db.session.add(Patient(patient_id=patient_id, name=patient.pop('name', patient_id),
+                                   dob=date(1995, 1, 1), gestation_weeks=patient.pop('gestation_weeks', 20),
+                                   facility=facility, **patient))
+        visit = ANCVisit(patient_id=patient_id, visit_date=visit_date, facility=facility,
+                         visit_number=visit_number, gestation_weeks=20, systolic_bp=120, diastolic_bp=80,
+                         urine_protein=0, risk_score=0.1, risk_level=risk_level, recommendation='Routine ANC')
+        db.session.add(visit)
+        db.session.commit()
+        return visit
+
+    return add
+
+PASSWORDS = {'nurse1': 'nurse123', 'doctor1': 'doctor123', 'county1': 'county123'}
+
+@pytest.fixture
+def login(app):
+    """login('county1') - a test client signed in as one of the default users"""
+    from flask import g
+    from flask.testing import FlaskClient
+    from muranga_dashboard import create_default_users
+    from src.database import db
+
+    class Client(FlaskClient):
+        def open(self, *args, **kwargs):
+            # Requests share the test's app context, so clear what one request pins
+            # (facility scope, shard, read-only, request metrics, the loaded user) before the next one runs
+            try:
+                return super().open(*args, **kwargs)
+            finally:
+                for name in ('facility_scope', 'shard', 'read_only', 'request_stats', '_login_user'):
+                    g.pop(name, None)
+                db.session.remove()
+
+    create_default_users()
+    app.test_client_class = Client
+
+    def client_for(username):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORDS[username]})
+        assert response.status_code == 302
+        return client
+
+    return client_for
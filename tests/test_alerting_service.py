@@ -0,0 +1,82 @@
+# tests/test_alerting_service.py - AlertingService priority heap, coalescing and eviction
+from src.services import AlertOverflowStore, AlertingService
+
+def test_top_is_most_urgent_then_oldest():
+    service = AlertingService()
+    low = service.send_alert('MRG001', 'Missed visit', 'low')
+    first_high = service.send_alert('MRG002', 'BP 150/100', 'high')
+    critical = service.send_alert('MRG003', 'BP 170/115', 'critical')
+    second_high = service.send_alert('MRG004', 'BP 155/102', 'high')
+
+    assert [alert['id'] for alert in service.top(3)] == [critical['id'], first_high['id'], second_high['id']]
+    assert service.active_alerts[-1] is low
+    assert len(service) == 4  # top() leaves alerts in place
+
+def test_repeats_coalesce_and_raise_priority():
+    service = AlertingService()
+    first = service.send_alert('MRG001', 'BP 150/100', 'medium')
+    other = service.send_alert('MRG002', 'BP 152/101', 'high')
+    repeat = service.send_alert('MRG001', 'BP 168/112', 'critical')
+
+    assert repeat is first
+    assert (first['count'], first['priority'], first['message']) == (2, 'critical', 'BP 168/112')
+    assert len(service) == 2
+    assert service.top(2) == [first, other]  # The stale medium entry is skipped
+
+def test_repeats_outside_the_window_are_new_alerts():
+    service = AlertingService(coalesce_seconds=0)
+    first = service.send_alert('MRG001', 'BP 150/100', 'high')
+    second = service.send_alert('MRG001', 'BP 150/100', 'high')
+    assert second is not first
+    assert len(service) == 2
+
+def test_acknowledged_alerts_drop_out_lazily():
+    service = AlertingService()
+    critical = service.send_alert('MRG001', 'BP 170/115', 'critical')
+    high = service.send_alert('MRG002', 'BP 150/100', 'high')
+
+    assert service.acknowledge(critical['id'])
+    assert not service.acknowledge(critical['id'])
+    assert critical['acknowledged']
+
+    assert service.pop() is high
+    assert service.pop() is None
+    assert len(service) == 0
+
+def test_acknowledged_kind_starts_a_new_alert():
+    service = AlertingService()
+    first = service.send_alert('MRG001', 'BP 150/100', 'high')
+    service.acknowledge(first['id'])
+    assert service.send_alert('MRG001', 'BP 152/100', 'high') is not first
+
+def test_least_urgent_newest_alert_is_evicted(tmp_path):
+    overflow = AlertOverflowStore(str(tmp_path / 'alert_overflow.db'))
+    service = AlertingService(max_active=3, overflow=overflow)
+    older_low = service.send_alert('MRG001', 'Missed visit', 'low')
+    critical = service.send_alert('MRG002', 'BP 170/115', 'critical')
+    high = service.send_alert('MRG003', 'BP 150/100', 'high')
+    service.send_alert('MRG004', 'Missed visit', 'low')
+
+    assert service.active_alerts == [critical, high, older_low]
+    assert service.overflow_count == 1
+    assert overflow.count() == 1
+
+def test_raised_priority_protects_from_eviction():
+    service = AlertingService(max_active=2)
+    raised = service.send_alert('MRG001', 'BP 140/90', 'low')
+    high = service.send_alert('MRG002', 'BP 150/100', 'high')
+    service.send_alert('MRG001', 'BP 170/115', 'critical')
+    service.send_alert('MRG003', 'BP 145/95', 'medium')
+
+    assert service.active_alerts == [raised, high]
+
+def test_stale_entries_are_compacted():
+    service = AlertingService()
+    priorities = ['low', 'medium', 'high', 'critical']
+    for n in range(200):
+        alert = service.send_alert(f"MRG{n % 5:03d}", 'BP 150/100', priorities[n % 4])
+        if n % 2:
+            service.acknowledge(alert['id'])
+
+    assert len(service._heap) <= 2 * len(service) + 64
+    assert len(service._evict_heap) <= 2 * len(service) + 64
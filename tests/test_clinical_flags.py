@@ -0,0 +1,112 @@
+# tests/test_clinical_flags.py - Symptom/history bitmasks: encoding, legacy JSON backfill, SQL filters, scoring
+import json
+from datetime import datetime
+
+import pytest
+
+from src.clinical_codes import (HISTORY_CODES, SYMPTOM_CODES, decode_flags, encode_history, encode_symptoms,
+                                history_bit, symptom_bit)
+from src.database import db, ANCVisit, has_history, has_symptom, migrate_schema
+from src.hypertension_ai import HypertensionAIAnalyzer, PregnancyRiskLevel
+
+VISIT_DATE = datetime(2024, 3, 4)
+
+def test_encoding_round_trips_in_code_order():
+    flags = encode_symptoms(['Visual Disturbances', 'severe_headache', 'not_a_symptom'])
+
+    assert flags == symptom_bit('severe_headache') | symptom_bit('visual_disturbances')
+    assert decode_flags(flags, SYMPTOM_CODES) == ['severe_headache', 'visual_disturbances']
+    assert decode_flags(None, HISTORY_CODES) == []
+
+def test_legacy_spellings_are_aliased():
+    assert encode_symptoms(['epigastric_pain', 'decreased urine output']) == (
+        symptom_bit('upper_abdominal_pain') | symptom_bit('decreased_urine'))
+
+@pytest.fixture
+def legacy_visits(add_visit):
+    """A visit table from before the bitmask columns, its symptoms and history still JSON lists"""
+    def add(symptoms, history, count=1):
+        visit = add_visit('MUR001', VISIT_DATE)
+        db.session.execute(db.text(
+            "INSERT INTO anc_visits (patient_id, visit_date, gestation_weeks, systolic_bp, diastolic_bp, "
+            "urine_protein, risk_score, risk_level, recommendation, symptoms, medical_history) "
+            "SELECT patient_id, visit_date, gestation_weeks, systolic_bp, diastolic_bp, urine_protein, risk_score, "
+            "risk_level, recommendation, :symptoms, :history FROM anc_visits WHERE id = :id"
+        ), [{'id': visit.id, 'symptoms': json.dumps(symptoms) if symptoms is not None else None,
+             'history': json.dumps(history) if history is not None else None}] * count)
+        db.session.execute(db.text("DELETE FROM anc_visits WHERE id = :id"), {'id': visit.id})
+
+    return add
+
+def drop_flag_columns():
+    db.session.execute(db.text("DROP INDEX ix_anc_visits_visit_date_flags"))
+    db.session.execute(db.text("ALTER TABLE anc_visits DROP COLUMN symptom_flags"))
+    db.session.execute(db.text("ALTER TABLE anc_visits DROP COLUMN history_flags"))
+    db.session.commit()
+
+def test_migration_backfills_flags_from_json(legacy_visits):
+    legacy_visits(['severe_headache', 'epigastric_pain'], ['previous_preeclampsia', 'diabetes'])
+    legacy_visits(None, None)
+    drop_flag_columns()
+
+    migrate_schema()
+
+    rows = db.session.execute(db.text(
+        "SELECT symptom_flags, history_flags FROM anc_visits ORDER BY id"
+    )).fetchall()
+    assert [tuple(row) for row in rows] == [
+        (symptom_bit('severe_headache') | symptom_bit('upper_abdominal_pain'),
+         history_bit('previous_preeclampsia') | history_bit('diabetes')),
+        (0, 0),
+    ]
+
+def test_backfill_covers_every_chunk(legacy_visits):
+    legacy_visits(['fever'], [], count=5001)  # One past the 5000-row chunk
+    drop_flag_columns()
+
+    migrate_schema()
+
+    assert ANCVisit.query.filter(has_symptom('fever')).count() == 5001
+
+def test_sql_filters_match_single_codes(add_visit):
+    visit = add_visit('MUR001', VISIT_DATE)
+    visit.symptom_flags = encode_symptoms(['visual_disturbances', 'fever'])
+    visit.history_flags = encode_history(['chronic_hypertension'])
+    add_visit('MUR002', VISIT_DATE)
+    db.session.commit()
+
+    assert [v.patient_id for v in ANCVisit.query.filter(has_symptom('visual_disturbances'))] == ['MUR001']
+    assert ANCVisit.query.filter(has_symptom('severe_headache')).count() == 0
+    assert [v.patient_id for v in ANCVisit.query.filter(has_history('chronic_hypertension'))] == ['MUR001']
+
+READING = {'systolic_bp': 120, 'diastolic_bp': 80, 'urine_protein': 0, 'gestational_age_weeks': 12}
+
+def test_flags_and_lists_score_the_same():
+    analyzer = HypertensionAIAnalyzer()
+    symptoms, history = ['severe_headache', 'fever'], ['previous_preeclampsia', 'obesity']
+
+    from_lists = analyzer.analyze_pregnancy_hypertension_risk({**READING, 'symptoms': symptoms,
+                                                                'medical_history': history})
+    from_flags = analyzer.analyze_pregnancy_hypertension_risk({**READING, 'symptom_flags': encode_symptoms(symptoms),
+                                                                'history_flags': encode_history(history)})
+
+    assert from_lists['risk_score'] == from_flags['risk_score'] == 5  # Headache 2, preeclampsia 3
+    assert from_lists['risk_factors'] == from_flags['risk_factors'] == [
+        'Symptom: Severe Headache', 'History of preeclampsia']
+    assert from_flags['risk_level'] == PregnancyRiskLevel.HIGH
+
+def test_flags_take_precedence_over_lists():
+    result = HypertensionAIAnalyzer().analyze_pregnancy_hypertension_risk(
+        {**READING, 'symptoms': ['severe_headache'], 'symptom_flags': 0})
+    assert result['risk_score'] == 0 and result['risk_level'] == PregnancyRiskLevel.LOW
+
+def test_every_critical_symptom_and_history_weight_counts():
+    result = HypertensionAIAnalyzer().analyze_pregnancy_hypertension_risk({
+        **READING,
+        'symptoms': ['severe_headache', 'visual_disturbances', 'upper_abdominal_pain', 'shortness_of_breath',
+                     'decreased_urine'],
+        'medical_history': ['previous_preeclampsia', 'chronic_hypertension', 'diabetes', 'first_pregnancy',
+                            'multiple_pregnancy'],
+    })
+    assert result['risk_score'] == 5 * 2 + 3 + 2 + 1 + 1 + 1
+    assert result['risk_level'] == PregnancyRiskLevel.CRITICAL
@@ -0,0 +1,59 @@
+# tests/test_cohort_index.py - Bitmap set algebra matches plain set filtering
+from src.clinical_codes import HISTORY_CODES, SYMPTOM_CODES
+from src.cohort_index import CohortBitmapIndex, Q
+
+FIRST_PREGNANCY = 1 << HISTORY_CODES['first_pregnancy']
+HEADACHE = 1 << SYMPTOM_CODES['severe_headache']
+
+# (patient_id, risk_level, gestation_weeks, village, facility, symptom_flags, history_flags)
+ROWS = [
+    ('MRG001', 'Low Risk', 10, 'Kiharu', 'Hospital A', 0, FIRST_PREGNANCY),
+    ('MRG002', 'Moderate Risk', 30, 'kiharu ', 'Hospital A', HEADACHE, 0),
+    ('MRG003', 'High Risk', 32, 'Kangema', 'Hospital B', HEADACHE, FIRST_PREGNANCY),
+    ('MRG004', 'Critical Risk', 20, 'Kangema', 'Hospital B', 0, 0),
+    ('MRG005', None, None, None, None, None, None),
+]
+
+def build() -> CohortBitmapIndex:
+    index = CohortBitmapIndex()
+    index.build(ROWS)
+    return index
+
+def test_values_within_one_q_are_ored():
+    index = build()
+    assert index.patient_ids(Q('risk_level', 'HIGH', 'CRITICAL')) == ['MRG003', 'MRG004']
+    assert index.count(Q('village', 'KIHARU')) == 2
+    assert index.count(Q('risk_level', 'UNASSESSED')) == 1
+
+def test_and_or_not():
+    index = build()
+    third_trimester = Q('trimester', 3)
+    first_pregnancy = Q('history', 'first_pregnancy')
+
+    assert index.patient_ids(third_trimester & first_pregnancy) == ['MRG003']
+    assert index.patient_ids(Q('village', 'Kiharu') | Q('symptom', 'severe_headache')) == ['MRG001', 'MRG002', 'MRG003']
+    assert index.patient_ids(~Q('facility', 'Hospital B')) == ['MRG001', 'MRG002', 'MRG005']
+    assert index.count(~(third_trimester | first_pregnancy)) == 2
+
+def test_from_json_at_least():
+    index = build()
+    query = Q.from_json({'and': [
+        {'field': 'risk_level', 'at_least': 'MODERATE'},
+        {'not': {'field': 'village', 'in': ['Kangema']}}
+    ]})
+    assert index.patient_ids(query) == ['MRG002']
+
+def test_update_patient_moves_bits():
+    index = build()
+    index.update_patient('MRG001', risk_level='High Risk', gestation_weeks=30, village='Kiharu',
+                         facility='Hospital A')
+    index.update_patient('MRG006', risk_level='Low Risk', gestation_weeks=8, village='Kandara', facility='Hospital C')
+
+    assert index.patient_ids(Q('risk_level', 'HIGH')) == ['MRG001', 'MRG003']
+    assert index.count(Q('risk_level', 'LOW')) == 1
+    assert index.count(Q('history', 'first_pregnancy')) == 1  # MRG001's flags were cleared
+    assert index.patient_ids(~Q('trimester', 2, 3)) == ['MRG005', 'MRG006']
+    assert index.values('village') == {'kiharu': 2, 'kangema': 2, '': 1, 'kandara': 1}
+
+def test_patient_ids_limit():
+    assert build().patient_ids(~Q('risk_level', 'LOW'), limit=2) == ['MRG002', 'MRG003']
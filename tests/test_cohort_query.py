@@ -0,0 +1,89 @@
+# tests/test_cohort_query.py - Outreach cohorts are keyset-paged and refuse table scans
+from datetime import date, datetime
+
+import pytest
+
+from src.cohort_query import CohortQueryBuilder, CohortQueryError
+from src.database import db, Patient
+from src.sharding import shard_key, using_shard
+
+NOW = datetime(2024, 3, 15, 12, 0)
+FACILITY = "Murang'a County Hospital"
+
+@pytest.fixture
+def patients(app):
+    """25 patients in Kiharu and 5 in Kangema, registered in id order"""
+    for number in range(1, 31):
+        db.session.add(Patient(patient_id=f"MRG{number:03d}", name=f"Patient {number}", dob=date(1995, 1, 1),
+                               gestation_weeks=20, village='Kiharu' if number <= 25 else 'Kangema',
+                               facility=FACILITY))
+    db.session.commit()
+    return [patient.patient_id for patient in Patient.query.filter_by(village='Kiharu').order_by(Patient.id)]
+
+def test_pages_follow_the_cursor(patients):
+    query = CohortQueryBuilder({'village': 'Kiharu'}, now=NOW)
+
+    seen = []
+    after_id = 0
+    pages = 0
+    while after_id is not None:
+        rows, after_id = query.page(after_id, limit=10)
+        seen += [row['patient_id'] for row in rows]
+        pages += 1
+
+    assert pages == 3
+    assert seen == patients
+
+def test_last_full_page_has_no_cursor(patients):
+    query = CohortQueryBuilder({'village': 'Kiharu'}, now=NOW)
+    rows, after_id = query.page(0, limit=25)
+    assert len(rows) == 25
+    assert after_id is None
+
+def test_cursor_names_the_database_and_last_row_id(patients):
+    # Unpinned reads span every facility database; the main one comes first
+    query = CohortQueryBuilder({'village': 'Kiharu'}, now=NOW)
+    rows, cursor = query.page(0, limit=4)
+    assert cursor == f"0:{rows[-1]['id']}"
+    next_rows, _ = query.page(cursor, limit=4)
+    assert next_rows[0]['id'] > rows[-1]['id']
+
+def test_one_database_cursor_is_the_last_row_id(app):
+    with using_shard(shard_key(FACILITY)):
+        for number in range(1, 6):
+            db.session.add(Patient(patient_id=f"MRG{number:03d}", name=f"Patient {number}", dob=date(1995, 1, 1),
+                                   gestation_weeks=20, village='Kiharu', facility=FACILITY))
+        db.session.commit()
+        rows, cursor = CohortQueryBuilder({'village': 'Kiharu'}, now=NOW).page(0, limit=4)
+
+    assert cursor == rows[-1]['id']
+    assert {row['shard'] for row in rows} == {shard_key(FACILITY)}
+
+def test_rejects_bad_cursor(patients):
+    with pytest.raises(CohortQueryError):
+        CohortQueryBuilder({'village': 'Kiharu'}, now=NOW).page('x:1')
+
+def test_stream_csv_covers_every_page(patients):
+    lines = ''.join(CohortQueryBuilder({'village': 'Kiharu'}, now=NOW).stream_csv(batch_size=7)).splitlines()
+    assert lines[0].startswith('patient_id,')
+    assert [line.split(',')[0] for line in lines[1:]] == patients
+
+def test_rejects_bad_page_size(patients):
+    with pytest.raises(CohortQueryError):
+        CohortQueryBuilder({'village': 'Kiharu'}, now=NOW).page(0, limit=0)
+
+def test_requires_an_indexed_filter(app):
+    with pytest.raises(CohortQueryError):
+        CohortQueryBuilder({'symptoms': ['severe_headache']})
+    with pytest.raises(CohortQueryError):
+        CohortQueryBuilder({'ward': 'Kiharu'})
+
+def test_plan_uses_an_index(patients):
+    query = CohortQueryBuilder({'village': 'Kiharu'}, now=NOW)
+    assert query.check_plan() == []
+
+def test_unindexed_filters_warn_when_allowed(patients):
+    query = CohortQueryBuilder({'history': ['first_pregnancy']}, allow_scan=True, now=NOW)
+    warnings = query.check_plan()
+    assert len(warnings) == 1
+    assert 'ID order' in warnings[0]
@@ -0,0 +1,85 @@
+# tests/test_digest.py - Morning digest: SMS-sized parts, no direct identifiers, county previews
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import db, FollowUp, NotificationOutbox
+from src.digest import DIGEST_MAX_LISTED
+from src.notifications import SMS_MAX_LENGTH, split_sms
+from src.sharding import shard_key, using_shard
+
+HOSPITAL = "Murang'a County Hospital"
+HIGH_RISK = 'High Risk'
+
+@pytest.fixture
+def digest_job(app, tmp_path, monkeypatch):
+    from muranga_dashboard import digest_job
+
+    contacts = tmp_path / 'contacts.json'
+    contacts.write_text(json.dumps({HOSPITAL: {'doctor': ['+254700000002']}}))
+    monkeypatch.setenv('ALERT_CONTACTS_FILE', str(contacts))
+    return digest_job
+
+def test_short_text_is_one_message():
+    assert split_sms('BP 170/115\n') == ['BP 170/115']
+
+def test_long_text_splits_at_lines_into_numbered_parts():
+    text = '\n'.join(f"- MUR{n:03d}: High Risk, BP 150/100" for n in range(40))
+
+    parts = split_sms(text)
+
+    assert len(parts) > 1
+    assert all(len(part) <= SMS_MAX_LENGTH for part in parts)
+    assert parts[0].startswith(f"(1/{len(parts)}) - MUR000")
+    assert '\n'.join(part.split(' ', 1)[1] for part in parts) == text
+
+def test_overlong_line_is_cut():
+    parts = split_sms('x' * (SMS_MAX_LENGTH * 2))
+    assert len(parts) == 3
+    assert all(len(part) <= SMS_MAX_LENGTH for part in parts)
+
+def test_digest_carries_ids_not_names_or_phones(digest_job, add_visit):
+    now = datetime.now()
+    visit = add_visit('MUR001', now - timedelta(hours=2), risk_level=HIGH_RISK,
+                      name='Jane Wanjiru', phone='+254711111111')
+    db.session.add(FollowUp(patient_id='MUR001', visit_id=visit.id, facility=HOSPITAL, risk_level=HIGH_RISK,
+                            reason='Review BP', due_at=now - timedelta(hours=1), status='MISSED'))
+    db.session.commit()
+
+    assert digest_job.run(now)['messages'] == 1
+
+    message = NotificationOutbox.query.one().message
+    assert 'MUR001: High Risk, BP 120/80' in message
+    assert 'Missed follow-ups (1)' in message
+    assert 'Jane' not in message and '+254711111111' not in message
+
+def test_long_digest_is_queued_as_several_sms(digest_job, add_visit):
+    now = datetime.now()
+    for n in range(DIGEST_MAX_LISTED + 5):
+        add_visit(f"MUR{n:03d}", now - timedelta(hours=2), risk_level=HIGH_RISK)
+
+    result = digest_job.run(now)
+
+    messages = [row.message for row in NotificationOutbox.query.order_by(NotificationOutbox.id)]
+    assert result['messages'] == len(messages) > 1
+    assert all(len(message) <= SMS_MAX_LENGTH for message in messages)
+    assert '+ 5 more on the dashboard' in messages[-1]
+
+def test_county_preview_covers_every_facility(login, add_visit):
+    with using_shard(shard_key(HOSPITAL)):  # ?facility= pins a county user to that database
+        add_visit('MUR001', datetime.now() - timedelta(hours=2), risk_level=HIGH_RISK)
+    client = login('county1')
+
+    everything = client.get('/reports/digest')
+    assert everything.status_code == 200
+    assert 'Kangema Sub-County Hospital - ANC digest' in everything.get_data(as_text=True)
+
+    one = client.get(f'/reports/digest?facility={HOSPITAL}').get_data(as_text=True)
+    assert one.startswith(f'{HOSPITAL} - ANC digest') and 'MUR001' in one
+
+    assert client.get('/reports/digest?facility=Nowhere').status_code == 404
+
+def test_facility_preview_is_their_own(login):
+    page = login('nurse1').get('/reports/digest?facility=Kangema Sub-County Hospital').get_data(as_text=True)
+    assert page.startswith(f'{HOSPITAL} - ANC digest')
@@ -0,0 +1,72 @@
+# tests/test_escalation.py - Escalation timers move, cancel and climb the role chain
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import db, Alert, ESCALATION_DEADLINES
+from src.escalation import AlertEscalationEngine
+
+@pytest.fixture
+def engine(app):
+    engine = AlertEscalationEngine(app)
+    engine.escalated = []
+    engine.notifiers.append(lambda alert, role: engine.escalated.append((alert.id, role)))
+    return engine
+
+def raise_alert(priority='HIGH', **fields) -> Alert:
+    alert = Alert(patient_id='MRG001', message='BP 165/112', priority=priority, risk_score=0.9,
+                  facility="Murang'a County Hospital", **fields)
+    db.session.add(alert)
+    db.session.commit()
+    return alert
+
+def test_acknowledge_moves_the_timer(engine):
+    alert = raise_alert()
+    engine.track(alert)
+    first_due = engine.timers.next_due()
+
+    engine.acknowledge(alert, 'Nurse One')
+
+    assert len(engine.timers) == 1
+    assert engine.timers.next_due() == alert.next_escalation_at
+    assert engine.timers.next_due() > first_due
+
+def test_resolve_cancels_the_timer(engine):
+    alert = raise_alert()
+    engine.track(alert)
+
+    engine.resolve(alert, 'Dr One')
+
+    assert len(engine.timers) == 0
+    assert engine.timers.next_due() is None
+
+def test_due_alert_escalates_one_level(engine):
+    alert = raise_alert(next_escalation_at=datetime.now() - timedelta(seconds=1))
+
+    engine._on_due((None, alert.id))
+
+    alert = Alert.query.get(alert.id)
+    assert alert.escalation_level == 1
+    assert alert.escalated_to == 'doctor'
+    assert engine.escalated == [(alert.id, 'doctor')]
+    assert engine.timers.next_due() == alert.next_escalation_at
+
+def test_top_of_the_chain_stops_escalating(engine):
+    alert = raise_alert(escalation_level=1, next_escalation_at=datetime.now() - timedelta(seconds=1))
+
+    engine._on_due((None, alert.id))
+
+    alert = Alert.query.get(alert.id)
+    assert alert.escalated_to == 'county'
+    assert alert.next_escalation_at is None
+    assert len(engine.timers) == 0
+
+def test_deadline_moved_elsewhere_is_rescheduled(engine):
+    later = datetime.now() + ESCALATION_DEADLINES['HIGH']
+    alert = raise_alert(next_escalation_at=later)
+
+    engine._on_due((None, alert.id))
+
+    assert Alert.query.get(alert.id).escalation_level == 0
+    assert engine.escalated == []
+    assert engine.timers.next_due() == later
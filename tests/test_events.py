@@ -0,0 +1,113 @@
+# tests/test_events.py - EventBus replay from Last-Event-ID, across workers and restarts
+import itertools
+import json
+
+from src.events import BUSY_RETRY_MS, EventBus
+
+HOSPITAL = "Murang'a County Hospital"
+
+def take(stream, count: int) -> list:
+    return list(itertools.islice(stream, count))
+
+def ids(chunks) -> list:
+    return [int(chunk.split('\n')[0][len('id: '):]) for chunk in chunks if chunk.startswith('id: ')]
+
+def test_resume_replays_events_after_the_last_id():
+    bus = EventBus(heartbeat_seconds=0.01)
+    first = bus.publish('alert.created', {'n': 1})
+    second = bus.publish('alert.created', {'n': 2})
+    third = bus.publish('alert.escalated', {'n': 3})
+
+    chunks = take(bus.stream(HOSPITAL, 'nurse', last_event_id=str(first.id)), 2)
+
+    assert ids(chunks) == [second.id, third.id]
+    assert chunks[1].startswith(f"id: {third.id}\nevent: alert.escalated\n")
+
+def test_new_subscriber_starts_live():
+    bus = EventBus(heartbeat_seconds=0.01)
+    bus.publish('alert.created', {'n': 1})
+    stream = bus.stream(HOSPITAL, 'nurse')
+
+    assert next(stream) == "retry: 5000\n\n"
+    assert next(stream) == ": keepalive\n\n"
+    latest = bus.publish('alert.created', {'n': 2})
+    assert ids([next(stream)]) == [latest.id]
+
+def test_replay_skips_other_facilities_and_roles():
+    bus = EventBus(heartbeat_seconds=0.01)
+    start = bus.last_id()
+    bus.publish('alert.created', {'n': 1}, facility='Kangema Sub-County Hospital')
+    bus.publish('alert.escalated', {'n': 2}, roles=['county'])
+    visible = bus.publish('alert.created', {'n': 3}, facility=HOSPITAL)
+
+    chunks = take(bus.stream(HOSPITAL, 'nurse', last_event_id=str(start)), 2)
+
+    assert ids(chunks) == [visible.id]
+    assert chunks[1] == ": keepalive\n\n"
+
+def test_county_sees_every_facility():
+    bus = EventBus(heartbeat_seconds=0.01)
+    start = bus.last_id()
+    bus.publish('alert.created', {'n': 1}, facility='Kangema Sub-County Hospital')
+
+    assert len(ids(take(bus.stream(None, 'county', last_event_id=str(start)), 1))) == 1
+
+def test_ids_that_fell_out_of_the_buffer_reset():
+    bus = EventBus(buffer_size=2, heartbeat_seconds=0.01)
+    first = bus.publish('alert.created', {'n': 1})
+    for n in range(2, 5):
+        latest = bus.publish('alert.created', {'n': n})
+
+    reset = next(bus.stream(HOSPITAL, 'nurse', last_event_id=str(first.id - 1)))
+
+    assert reset == f"id: {latest.id}\nevent: reset\ndata: {{}}\n\n"
+
+def test_ids_from_before_a_restart_reset():
+    bus = EventBus(heartbeat_seconds=0.01)
+    bus.publish('alert.created', {'n': 1})
+
+    assert '\nevent: reset\n' in next(bus.stream(HOSPITAL, 'nurse', last_event_id='12345'))
+
+def test_unreadable_id_starts_live():
+    bus = EventBus(heartbeat_seconds=0.01)
+    assert next(bus.stream(HOSPITAL, 'nurse', last_event_id='not-a-number')) == "retry: 5000\n\n"
+
+def test_ids_from_a_newer_process_reset():
+    bus = EventBus(heartbeat_seconds=0.01)
+    bus.publish('alert.created', {'n': 1})
+
+    reset = next(bus.stream(HOSPITAL, 'nurse', last_event_id=str(bus.last_id() + 10 ** 6)))
+
+    assert reset == f"id: {bus.last_id()}\nevent: reset\ndata: {{}}\n\n"
+
+def test_streams_past_the_cap_are_asked_to_retry():
+    bus = EventBus(heartbeat_seconds=0.01, max_streams=1)
+    first = bus.stream(HOSPITAL, 'nurse')
+    next(first)
+
+    assert next(bus.stream(HOSPITAL, 'nurse')).startswith(f"retry: {BUSY_RETRY_MS}\n")
+
+    first.close()
+    assert next(bus.stream(HOSPITAL, 'nurse')) == "retry: 5000\n\n"
+
+def test_workers_share_events_through_the_database(app):
+    worker_a = EventBus(app, heartbeat_seconds=0.01, poll_seconds=60)
+    worker_b = EventBus(app, heartbeat_seconds=0.01, poll_seconds=60)
+    try:
+        seen = worker_a.publish('alert.created', {'n': 1}, facility=HOSPITAL)
+        missed = worker_a.publish('alert.created', {'n': 2}, facility=HOSPITAL)
+
+        # Resuming on the other worker with an id it has not polled yet replays, not resets
+        chunks = take(worker_b.stream(HOSPITAL, 'nurse', last_event_id=str(seen.id)), 1)
+        assert ids(chunks) == [missed.id]
+
+        live = worker_b.stream(HOSPITAL, 'nurse')
+        next(live)
+        raised = worker_a.publish('alert.escalated', {'n': 3}, roles=['nurse', 'doctor', 'county'])
+        worker_b.poll()
+        assert ids([next(live)]) == [raised.id]
+        assert json.loads(next(worker_b.stream(HOSPITAL, 'county', last_event_id=str(missed.id)))
+                          .split('data: ')[1]) == {'n': 3}
+    finally:
+        worker_a.stop()
+        worker_b.stop()
@@ -0,0 +1,89 @@
+# tests/test_facility_scope.py - ORM reads limited to the user's facility, the all_facilities opt-out, joins
+from datetime import datetime
+
+import pytest
+from flask import g
+from sqlalchemy import select
+
+from src.database import db, Alert, ANCVisit, Patient
+from src.facility_scope import facility_scope, scoped
+from src.sharding import shard_key, using_shard
+
+HOSPITAL = "Murang'a County Hospital"
+KANGEMA = 'Kangema Sub-County Hospital'
+VISIT_DATE = datetime(2024, 3, 4)
+
+@pytest.fixture
+def two_facilities(add_visit):
+    """MUR001 at the hospital, MUR002 at Kangema, each with a visit and an alert"""
+    for patient_id, facility in (('MUR001', HOSPITAL), ('MUR002', KANGEMA)):
+        add_visit(patient_id, VISIT_DATE, facility=facility)
+        db.session.add(Alert(patient_id=patient_id, message='BP', priority='HIGH', risk_score=0.8,
+                             facility=facility))
+    db.session.commit()
+
+@pytest.fixture
+def scope(app):
+    """scope(facility) - limit this test's queries as a facility user's request would be"""
+    def set_scope(facility):
+        g.facility_scope = facility
+    yield set_scope
+    g.pop('facility_scope', None)
+
+def test_no_scope_reads_every_facility(two_facilities):
+    assert facility_scope() is None
+    assert (Patient.query.count(), ANCVisit.query.count(), Alert.query.count()) == (2, 2, 2)
+
+def test_scope_limits_every_scoped_model(two_facilities, scope):
+    scope(HOSPITAL)
+
+    assert [p.patient_id for p in Patient.query.all()] == ['MUR001']
+    assert [v.patient_id for v in ANCVisit.query.all()] == ['MUR001']
+    assert [a.patient_id for a in Alert.query.all()] == ['MUR001']
+    assert db.session.query(db.func.count(ANCVisit.id)).scalar() == 1
+
+def test_all_facilities_opts_out(two_facilities, scope):
+    scope(HOSPITAL)
+
+    assert Patient.query.execution_options(all_facilities=True).count() == 2
+    assert ANCVisit.query.execution_options(all_facilities=True).filter_by(patient_id='MUR002').count() == 1
+
+def test_outer_joined_patient_from_another_facility_comes_along(add_visit, scope):
+    # Seen here on referral: the visit and alert are the hospital's, the patient is Kangema's
+    add_visit('MUR002', VISIT_DATE, facility=KANGEMA)
+    add_visit('MUR002', VISIT_DATE, visit_number=2, facility=HOSPITAL)
+    db.session.add(Alert(patient_id='MUR002', message='BP', priority='HIGH', risk_score=0.8, facility=HOSPITAL))
+    db.session.commit()
+    scope(HOSPITAL)
+
+    # Only the query's own entity is filtered, so the alerts page still names the referred patient
+    rows = db.session.query(Alert, Patient).outerjoin(Patient, Alert.patient_id == Patient.patient_id).all()
+    assert [(alert.facility, patient.facility) for alert, patient in rows] == [(HOSPITAL, KANGEMA)]
+
+    assert Patient.query.filter_by(patient_id='MUR002').first() is None
+
+def test_scoped_takes_an_explicit_facility(two_facilities):
+    statement = scoped(select(Patient.patient_id), KANGEMA)
+    assert db.session.execute(statement).scalars().all() == ['MUR002']
+
+def test_writes_are_not_scoped(two_facilities, scope):
+    scope(HOSPITAL)
+
+    db.session.execute(db.update(Alert).values(resolved=True))
+    db.session.commit()
+
+    assert Alert.query.execution_options(all_facilities=True).filter_by(resolved=True).count() == 2
+
+def test_facility_user_only_sees_their_patients(login):
+    with using_shard(shard_key(HOSPITAL)):  # Both in the nurse's database, so only the scope tells them apart
+        for patient_id, facility in (('MUR001', HOSPITAL), ('MUR002', KANGEMA)):
+            db.session.add(Patient(patient_id=patient_id, name=f'Patient {patient_id}', dob=VISIT_DATE.date(),
+                                   gestation_weeks=20, facility=facility))
+        db.session.commit()
+    client = login('nurse1')
+
+    page = client.get('/patients').get_data(as_text=True)
+    assert 'MUR001' in page and 'MUR002' not in page
+
+    response = client.get('/patient/MUR002')
+    assert response.status_code == 302 and '/patients' in response.headers['Location']
@@ -0,0 +1,86 @@
+# tests/test_indicators.py - MOH 711 ANC rollups: counts, closed-month caching, DHIS2 payload
+import json
+from datetime import datetime, timedelta
+
+from src.database import db, IndicatorRollup
+from src.external import ExternalInterfaces
+from src.hypertension_ai import PregnancyRiskLevel
+from src.indicators import ANCIndicatorEngine, REFERRAL_PROXY_COMMENT, period_bounds
+from src.sharding import shard_key, using_shard
+
+HOSPITAL = "Murang'a County Hospital"
+KANGEMA = 'Kangema Sub-County Hospital'
+CLOSED = '202403'
+
+def test_counts_are_summed_per_facility(add_visit):
+    add_visit('MUR001', datetime(2024, 3, 4), visit_number=1)
+    add_visit('MUR001', datetime(2024, 3, 25), visit_number=4, risk_level=PregnancyRiskLevel.CRITICAL.value)
+    raised = add_visit('MUR002', datetime(2024, 3, 5), visit_number=1)
+    raised.systolic_bp = 150
+    db.session.commit()
+    add_visit('MUR003', datetime(2024, 4, 1), visit_number=1)  # Next month
+    with using_shard(shard_key(KANGEMA)):
+        add_visit('MUR101', datetime(2024, 3, 9), visit_number=1, facility=KANGEMA)
+
+    rollups = ANCIndicatorEngine([HOSPITAL, KANGEMA, 'Maragua Hospital']).compute_period(CLOSED, store=False)
+
+    hospital = rollups[HOSPITAL]
+    assert (hospital.total_visits, hospital.anc_first_visits, hospital.anc_fourth_visits,
+            hospital.hypertension_cases, hospital.referrals) == (3, 2, 1, 1, 1)
+    assert rollups[KANGEMA].anc_first_visits == 1
+    assert rollups['Maragua Hospital'].total_visits == 0
+
+def test_closed_month_is_stored_and_served(add_visit):
+    add_visit('MUR001', datetime(2024, 3, 4))
+    engine = ANCIndicatorEngine([HOSPITAL])
+    engine.compute_period(CLOSED)
+
+    add_visit('MUR002', datetime(2024, 3, 5))  # Entered late
+
+    assert engine.compute_period(CLOSED)[HOSPITAL].total_visits == 1
+    assert engine.compute_period(CLOSED, refresh=True)[HOSPITAL].total_visits == 2
+    assert IndicatorRollup.query.filter_by(period=CLOSED).one().total_visits == 2
+
+def test_open_month_is_never_stored(add_visit):
+    period = datetime.now().strftime('%Y%m')
+    add_visit('MUR001', datetime.now())
+
+    rollups = ANCIndicatorEngine([HOSPITAL]).compute_period(period, refresh=True)
+
+    assert rollups[HOSPITAL].total_visits == 1
+    assert IndicatorRollup.query.filter_by(period=period).count() == 0
+
+def test_rollup_from_before_the_month_closed_is_recomputed(add_visit):
+    _, end = period_bounds(CLOSED)
+    add_visit('MUR001', datetime(2024, 3, 4))
+    add_visit('MUR002', datetime(2024, 3, 30))
+    # Stored mid-month, when only the first visit existed
+    db.session.add(IndicatorRollup(facility=HOSPITAL, period=CLOSED, total_visits=1, anc_first_visits=1,
+                                   computed_at=end - timedelta(days=10)))
+    db.session.commit()
+
+    rollups = ANCIndicatorEngine([HOSPITAL]).compute_period(CLOSED)
+
+    assert rollups[HOSPITAL].total_visits == 2
+    assert IndicatorRollup.query.filter_by(period=CLOSED).one().computed_at >= end
+
+def test_data_value_set_labels_the_referral_proxy(add_visit):
+    add_visit('MUR001', datetime(2024, 3, 4), risk_level=PregnancyRiskLevel.CRITICAL.value)
+
+    payload = ANCIndicatorEngine([HOSPITAL]).build_data_value_set(CLOSED, store=False)
+
+    assert payload['period'] == CLOSED
+    values = {value['dataElement']: value for value in payload['dataValues']}
+    assert values['MOH711_ANC_1ST_VISIT']['value'] == '1'
+    assert values['MOH711_ANC_REFERRALS']['comment'] == REFERRAL_PROXY_COMMENT
+    assert 'comment' not in values['MOH711_ANC_4TH_VISIT']
+
+def test_public_health_export_writes_the_data_value_set(add_visit, tmp_path):
+    add_visit('MUR001', datetime(2024, 3, 4))
+    output = tmp_path / 'moh711.json'
+
+    assert ExternalInterfaces.export_public_health_data(CLOSED, [HOSPITAL], output_path=str(output))
+
+    payload = json.loads(output.read_text())
+    assert payload['dataSet'] == 'MOH711_ANC'
+    assert {value['orgUnit'] for value in payload['dataValues']} == {HOSPITAL}
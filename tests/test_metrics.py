@@ -0,0 +1,81 @@
+# tests/test_metrics.py - Fanned-out queries count against their request; workers' metrics are summed
+import os
+
+from flask import g
+from sqlalchemy import text
+
+from src.database import db
+from src.metrics import LATENCY_BUCKETS, Histogram, RequestMetrics, clear_metrics_dir
+from src.sharding import fan_out, shard_keys
+
+class Worker:
+    """One gunicorn worker's metrics, flushing and rendering as process `pid`"""
+    def __init__(self, metrics_dir, pid: int, monkeypatch):
+        self.metrics = RequestMetrics(metrics_dir=str(metrics_dir))
+        self.pid = pid
+        self.monkeypatch = monkeypatch
+
+    def served(self, responses: int, latency: float) -> 'Worker':
+        self.metrics.responses[('dashboard', 'GET', 200)] = responses
+        histogram = self.metrics.latency.setdefault(('dashboard', 'GET'), Histogram(LATENCY_BUCKETS))
+        for _ in range(responses):
+            histogram.observe(latency)
+        self.render()
+        return self
+
+    def render(self) -> str:
+        with self.monkeypatch.context() as patch:
+            patch.setattr(os, 'getpid', lambda: self.pid)
+            return self.metrics.render()
+
+def test_fanned_out_queries_count_against_the_request(app):
+    from muranga_dashboard import metrics
+
+    background = metrics.background_sql_queries
+    with app.test_request_context('/patients'):
+        metrics._before_request()
+        fan_out(lambda: db.session.execute(text('SELECT 1')).scalar(), everywhere=True)
+
+        assert g.request_stats.sql_queries == len(shard_keys()) > 1
+    assert metrics.background_sql_queries == background
+
+def test_queries_outside_requests_are_background(app):
+    from muranga_dashboard import metrics
+
+    background = metrics.background_sql_queries
+    db.session.execute(text('SELECT 1'))
+    assert metrics.background_sql_queries == background + 1
+
+def test_every_worker_answers_with_the_summed_totals(tmp_path, monkeypatch):
+    first = Worker(tmp_path, 1111, monkeypatch).served(3, latency=0.05)
+    second = Worker(tmp_path, 2222, monkeypatch).served(2, latency=0.5)
+
+    for worker in (first, second):
+        page = worker.render()
+        assert 'http_responses_total{endpoint="dashboard",method="GET",status="200"} 5' in page
+        assert 'http_request_duration_seconds_bucket{endpoint="dashboard",method="GET",le="0.1"} 3' in page
+        assert 'http_request_duration_seconds_count{endpoint="dashboard",method="GET"} 5' in page
+
+def test_exited_workers_still_count_until_the_master_restarts(tmp_path, monkeypatch):
+    Worker(tmp_path, 1111, monkeypatch).served(3, latency=0.05)
+    survivor = Worker(tmp_path, 2222, monkeypatch).served(1, latency=0.05)
+
+    assert 'status="200"} 4' in survivor.render()
+
+    clear_metrics_dir(str(tmp_path))
+    assert 'http_responses_total{' not in RequestMetrics(metrics_dir=str(tmp_path)).render()
+
+def test_without_a_directory_metrics_are_this_process_only():
+    metrics = RequestMetrics()
+    metrics.responses[('dashboard', 'GET', 200)] = 1
+    assert 'status="200"} 1' in metrics.render()
+
+def test_reset_forgets_counts_inherited_by_workers(tmp_path, monkeypatch):
+    master = Worker(tmp_path, 1111, monkeypatch).served(1, latency=0.05)  # wsgi.py's warm-up request
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'getpid', lambda: 1111)
+        master.metrics.reset()
+
+    assert os.listdir(tmp_path) == []
+    assert 'http_responses_total{' not in Worker(tmp_path, 2222, monkeypatch).render()
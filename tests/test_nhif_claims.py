@@ -0,0 +1,60 @@
+# tests/test_nhif_claims.py - Month-end NHIF batches: no visit is billed twice
+import csv
+import json
+import os
+from datetime import datetime
+
+from src.database import NHIFClaim, NHIFClaimBatch
+from src.nhif_claims import HIGH_RISK_LEVELS, NHIF_TARIFFS, NHIFClaimsGenerator
+
+PERIOD = '202403'
+
+def march(day: int) -> datetime:
+    return datetime(2024, 3, day, 10, 0)
+
+def test_bills_each_service_once(add_visit, tmp_path):
+    add_visit('MRG001', march(2), visit_number=1)
+    add_visit('MRG001', march(20), visit_number=2, risk_level=HIGH_RISK_LEVELS[0])
+    add_visit('MRG002', datetime(2024, 4, 1, 9, 0))  # Next period
+
+    result = NHIFClaimsGenerator().generate(PERIOD, str(tmp_path))
+
+    assert result['visits'] == 2
+    assert result['claims'] == 3
+    codes = sorted(claim.service_code for claim in NHIFClaim.query.all())
+    assert codes == sorted([NHIF_TARIFFS['ANC_FIRST_VISIT']['code'], NHIF_TARIFFS['ANC_FOLLOW_UP']['code'],
+                            NHIF_TARIFFS['HIGH_RISK_REVIEW']['code']])
+    assert result['total_amount'] == sum(tariff['amount'] for tariff in NHIF_TARIFFS.values())
+
+    batch = result['batches'][0]
+    with open(tmp_path / batch['file']) as f:
+        assert len(list(csv.DictReader(f))) == 3
+    with open(tmp_path / f"nhif_claims_{PERIOD}_batch{batch['batch_id']}.manifest.json") as f:
+        assert json.load(f)['sha256'] == batch['sha256']
+
+def test_rerun_without_new_visits_adds_nothing(add_visit, tmp_path):
+    add_visit('MRG001', march(2))
+    generator = NHIFClaimsGenerator()
+    generator.generate(PERIOD, str(tmp_path))
+
+    result = generator.generate(PERIOD, str(tmp_path))
+
+    assert result['batches'] == []
+    assert result['claims'] == 0
+    assert NHIFClaimBatch.query.count() == 1
+    assert NHIFClaim.query.count() == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_rerun_only_reads_visits_after_the_watermark(add_visit, tmp_path):
+    first = add_visit('MRG001', march(2))
+    generator = NHIFClaimsGenerator()
+    generator.generate(PERIOD, str(tmp_path))
+    second = add_visit('MRG002', march(25))
+
+    result = generator.generate(PERIOD, str(tmp_path))
+
+    batch = result['batches'][0]
+    assert batch['after_visit_id'] == first.id
+    assert batch['last_visit_id'] == second.id
+    assert [claim.visit_id for claim in NHIFClaim.query.filter_by(batch_id=batch['batch_id'])] == [second.id]
+    assert NHIFClaim.query.count() == 2
@@ -0,0 +1,130 @@
+# tests/test_notifications.py - Outbox retries back off exponentially, leases expire, in-memory alerts are queued
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import db, NotificationOutbox
+from src.notifications import NotificationProvider, NotificationWorker, OutboxNotifier, queue_notification
+from src.services import AlertingService
+
+class FailingProvider(NotificationProvider):
+    name = 'failing'
+
+    async def send_batch(self, messages: list) -> list:
+        return [{'id': m['id'], 'ok': False, 'error': 'Gateway down'} for m in messages]
+
+@pytest.fixture
+def worker(app):
+    return NotificationWorker(app, [FailingProvider()], max_attempts=4, backoff_seconds=30, max_backoff_seconds=90)
+
+def send_once(worker) -> list:
+    """One claim/send/record round, as the worker's loop runs it"""
+    provider = worker.providers['failing']
+    batch = worker._claim(provider)
+    if batch:
+        worker._record(asyncio.run(provider.send_batch(batch)))
+    return batch
+
+def reload(row_id) -> NotificationOutbox:
+    # The worker's own app contexts close the session, so read rows afresh
+    return NotificationOutbox.query.get(row_id)
+
+def make_due(row_id):
+    reload(row_id).next_attempt_at = datetime.now() - timedelta(seconds=1)
+    db.session.commit()
+
+def test_failures_back_off_exponentially_up_to_the_cap(worker):
+    queue_notification('+254700000001', 'BP 165/112', provider='failing')
+    db.session.commit()
+    row_id = NotificationOutbox.query.one().id
+
+    delays = []
+    for _ in range(3):
+        before = datetime.now()
+        assert len(send_once(worker)) == 1
+        row = reload(row_id)
+        assert row.status == 'PENDING'
+        assert row.claimed_by is None
+        delays.append(round((row.next_attempt_at - before).total_seconds()))
+        make_due(row_id)
+
+    assert delays == [30, 60, 90]
+    assert reload(row_id).last_error == 'Gateway down'
+
+    send_once(worker)
+    row = reload(row_id)
+    assert row.status == 'FAILED'
+    assert row.attempts == 4
+
+def test_rows_in_backoff_are_not_claimed(worker):
+    queue_notification('+254700000001', 'BP 165/112', provider='failing')
+    db.session.commit()
+
+    send_once(worker)
+
+    assert send_once(worker) == []
+    assert 0 < worker._seconds_until_next() <= 30
+
+def test_expired_lease_is_requeued(worker):
+    queue_notification('+254700000001', 'BP 165/112', provider='failing')
+    queue_notification('+254700000002', 'BP 170/115', provider='failing')
+    db.session.commit()
+    assert len(worker._claim(worker.providers['failing'])) == 2
+    stale, live = [row.id for row in NotificationOutbox.query.order_by(NotificationOutbox.id)]
+    reload(stale).claimed_at = datetime.now() - timedelta(seconds=worker.lease_seconds + 1)
+    db.session.commit()
+
+    worker._requeue_expired()
+
+    stale, live = reload(stale), reload(live)
+    assert (stale.status, stale.claimed_by) == ('PENDING', None)
+    assert (live.status, live.claimed_by) == ('SENDING', worker.worker_id)
+
+def test_receipts_after_losing_the_lease_are_ignored(worker):
+    queue_notification('+254700000001', 'BP 165/112', provider='failing')
+    db.session.commit()
+    batch = worker._claim(worker.providers['failing'])
+    NotificationOutbox.query.one().claimed_by = 'another-worker'
+    db.session.commit()
+
+    worker._record([{'id': batch[0]['id'], 'ok': True, 'receipt_id': 'late'}])
+
+    row = reload(batch[0]['id'])
+    assert row.status == 'SENDING'
+    assert row.attempts == 0
+    assert row.receipt_id is None
+
+def test_providers_must_implement_send_batch():
+    class Silent(NotificationProvider):
+        name = 'silent'
+
+    with pytest.raises(TypeError):
+        Silent()
+
+def test_alerting_service_alerts_go_through_the_outbox(app, tmp_path, monkeypatch):
+    contacts = tmp_path / 'contacts.json'
+    contacts.write_text(json.dumps({'*': {'nurse': ['+254700000001'], 'doctor': ['+254700000002']}}))
+    monkeypatch.setenv('ALERT_CONTACTS_FILE', str(contacts))
+    service = AlertingService(notify=OutboxNotifier(app))
+
+    service.send_alert('MRG001', 'High glucose alert: 215 mg/dL', 'high')
+    service.send_alert('MRG001', 'High glucose alert: 230 mg/dL', 'high')  # Repeat: not texted again
+    service.send_alert('MRG002', 'Missed visit', 'low')
+
+    rows = NotificationOutbox.query.all()
+    assert sorted(row.recipient for row in rows) == ['+254700000001', '+254700000002']
+    assert {row.message for row in rows} == {'[HIGH] MRG001: High glucose alert: 215 mg/dL'}
+
+    service.send_alert('MRG002', 'Missed visit', 'critical')  # Raised priority is texted
+    assert NotificationOutbox.query.count() == 4
+
+def test_alerts_with_no_contacts_are_reported(app, capsys):
+    service = AlertingService(notify=OutboxNotifier(app))
+
+    alert = service.send_alert('MRG001', 'BP 170/115', 'critical')
+
+    assert service.active_alerts == [alert]
+    assert NotificationOutbox.query.count() == 0
+    assert 'No contacts for nurse, doctor' in capsys.readouterr().out
@@ -0,0 +1,96 @@
+# tests/test_principals.py - Cached principals: TTL, LRU size, auth-version invalidation and sign-out
+import pytest
+
+from src.principals import PrincipalCache, UserPrincipal
+
+def principal(user_id: int = 1, auth_version: int = 1) -> UserPrincipal:
+    return UserPrincipal(user_id, f'user{user_id}', 'nurse', 'Test User', "Murang'a County Hospital", auth_version)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable time.monotonic for the cache"""
+    now = [1000.0]
+    monkeypatch.setattr('src.principals.time.monotonic', lambda: now[0])
+    return now
+
+def test_hit_needs_a_matching_auth_version(clock):
+    cache = PrincipalCache()
+    cached = cache.put(principal(auth_version=1))
+
+    assert cache.get(1, 1) is cached
+    assert cache.get(1, 2) is None  # A session stamped after a password change on another worker
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PrincipalCache(ttl_seconds=60)
+    cache.put(principal())
+
+    clock[0] += 59
+    assert cache.get(1, 1) is not None
+    clock[0] += 2
+    assert cache.get(1, 1) is None
+
+def test_least_recently_used_is_evicted(clock):
+    cache = PrincipalCache(max_size=2)
+    cache.put(principal(1))
+    cache.put(principal(2))
+    cache.get(1, 1)
+
+    cache.put(principal(3))
+
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None and cache.get(3, 1) is not None
+
+def test_invalidate_drops_the_entry(clock):
+    cache = PrincipalCache()
+    cache.put(principal())
+    cache.invalidate(1)
+    cache.invalidate(99)  # Unknown ids are ignored
+
+    assert cache.get(1, 1) is None
+
+def test_page_views_are_served_from_the_cache(login):
+    from muranga_dashboard import principal_cache
+
+    client = login('nurse1')
+    hits = principal_cache.hits
+
+    assert client.get('/').status_code == 200
+    assert client.get('/').status_code == 200
+    assert principal_cache.hits == hits + 2
+
+@pytest.mark.parametrize('change', [
+    lambda user: user.set_password('changed123'),
+    lambda user: setattr(user, 'role', 'doctor'),
+    lambda user: setattr(user, 'facility', 'Maragua Hospital'),
+])
+def test_auth_change_bumps_the_version_and_signs_out(login, change):
+    from muranga_dashboard import User, principal_cache
+    from src.database import db
+
+    client = login('nurse1')
+    assert client.get('/').status_code == 200
+    user = User.query.filter_by(username='nurse1').one()
+    version = user.auth_version
+
+    change(user)
+    db.session.commit()
+
+    assert user.auth_version == version + 1
+    assert principal_cache.get(user.id, version) is None
+    response = client.get('/')
+    assert response.status_code == 302 and '/login' in response.headers['Location']
+
+def test_other_changes_keep_the_session(login):
+    from muranga_dashboard import User
+    from src.database import db
+
+    client = login('nurse1')
+    user = User.query.filter_by(username='nurse1').one()
+    version = user.auth_version
+
+    user.full_name = 'Nurse Renamed'
+    db.session.commit()
+
+    assert user.auth_version == version
+    assert client.get('/').status_code == 200
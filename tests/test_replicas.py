@@ -0,0 +1,85 @@
+# tests/test_replicas.py - Report reads on read-only connections: URLs, session routing, views and fan-out
+import pytest
+from flask import g
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from src.database import db, Patient
+from src.replicas import ReadEngines, is_reading, read_engine, reading
+from src.sharding import fan_out
+
+@pytest.fixture
+def statements():
+    """(engine URL, SQL) for each statement run during the test; read-only URLs contain mode=ro"""
+    seen = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        seen.append((str(connection.engine.url), statement))
+
+    event.listen(Engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(Engine, 'before_cursor_execute', record)
+
+def test_sqlite_files_reopen_read_only(tmp_path):
+    path = tmp_path / 'clinic.db'
+    engines = ReadEngines(f"sqlite:///{path}")
+    primary = create_engine(f"sqlite:///{path}")
+    with primary.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE t (x INTEGER)')
+
+    replica = engines.for_engine(primary)
+
+    assert replica is not primary and engines.for_engine(primary) is replica
+    assert 'mode=ro' in str(replica.url)
+    with replica.connect() as connection:
+        assert connection.exec_driver_sql('SELECT count(*) FROM t').scalar() == 0
+        with pytest.raises(OperationalError, match='readonly'):
+            connection.exec_driver_sql('INSERT INTO t VALUES (1)')
+
+def test_memory_database_has_no_twin():
+    primary = create_engine('sqlite://')
+    assert ReadEngines('sqlite://').for_engine(primary) is primary
+
+def test_replica_url_stands_in_for_the_main_database(tmp_path):
+    main = f"sqlite:///{tmp_path / 'main.db'}"
+    engines = ReadEngines(main, 'postgresql://replica/anc')
+
+    assert engines.read_url(create_engine(main).url) == 'postgresql://replica/anc'
+    assert 'mode=ro' in engines.read_url(create_engine(f"sqlite:///{tmp_path / 'shard.db'}").url)
+
+def test_reading_routes_selects_not_writes(app):
+    statement = select(Patient.id)
+
+    assert db.session().get_bind(Patient.__mapper__, statement) is db.engine
+    with reading():
+        assert is_reading()
+        assert db.session().get_bind(Patient.__mapper__, statement) is read_engine(db.engine)
+        assert db.session().get_bind(Patient.__mapper__, Patient.__table__.insert()) is db.engine
+    assert not is_reading()
+
+def test_reading_restores_the_flag_on_error(app):
+    g.read_only = False
+    with pytest.raises(RuntimeError):
+        with reading():
+            raise RuntimeError
+    assert g.read_only is False
+    g.pop('read_only')
+
+def test_fan_out_reads_each_shard_read_only(app):
+    with reading():
+        flags = fan_out(is_reading)
+    assert len(flags) > 1 and all(flags)
+    assert not any(fan_out(is_reading))
+
+def test_report_views_read_from_read_only_engines(login, statements):
+    client = login('county1')
+
+    assert client.get('/reports').status_code == 200
+    writable = [sql for url, sql in statements if 'mode=ro' not in url]
+    assert any('mode=ro' in url for url, sql in statements)
+    assert all('FROM users' in sql for sql in writable)  # Only loading the user, before the view runs
+
+    statements.clear()
+    assert client.get('/').status_code == 200
+    assert statements and not any('mode=ro' in url for url, sql in statements)
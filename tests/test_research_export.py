@@ -0,0 +1,93 @@
+# tests/test_research_export.py - k-anonymity over the quasi-identifiers, keyed patient hashes, re-exports
+import csv
+import os
+from datetime import datetime
+
+import pytest
+
+from src.database import db
+from src.research_export import ResearchExporter
+from src.sharding import shard_key, shard_map, using_shard
+
+KANGEMA = 'Kangema Sub-County Hospital'
+MARAGUA = 'Maragua Hospital'
+VISIT_DATE = datetime(2024, 3, 4)
+
+def exported(output_dir) -> list:
+    rows = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.startswith('part-'):
+            with open(os.path.join(output_dir, name)) as f:
+                rows += list(csv.DictReader(f))
+    return rows
+
+def add_class(add_visit, prefix: str, count: int, facility: str = KANGEMA, **visit):
+    """count patients sharing every quasi-identifier: March 2024, 25-29, Kiharu, 14-27 weeks, first visit"""
+    for n in range(count):
+        add_visit(f"{prefix}{n:03d}", VISIT_DATE, facility=facility, village='Kiharu', **visit)
+
+@pytest.fixture
+def engines(app):
+    shards = shard_map()
+    return [db.engine] + [shards.engine(key) for key in shards.keys()]
+
+def test_patient_keys_are_stable_per_key():
+    first = ResearchExporter([object()], key='registry-2024')
+    again = ResearchExporter([object()], key='registry-2024')
+    other = ResearchExporter([object()], key='registry-2025')
+
+    assert first.patient_key('MUR001') == again.patient_key('MUR001')
+    assert first.patient_key('MUR001') != first.patient_key('MUR002')
+    assert first.patient_key('MUR001') != other.patient_key('MUR001')
+    assert len(first.patient_key('MUR001')) == 32 and 'MUR001' not in first.patient_key('MUR001')
+
+def test_small_classes_are_suppressed(add_visit, engines, tmp_path):
+    add_class(add_visit, 'MUR', 5)
+    add_visit('MUR900', VISIT_DATE, facility=KANGEMA, village='Kiharu', visit_number=2)  # Alone at visit 2
+
+    manifest = ResearchExporter(engines, key='k', k=5).export(str(tmp_path), fmt='csv')
+
+    rows = exported(tmp_path)
+    assert (manifest['rows'], manifest['rows_suppressed']) == (5, 1)
+    assert {(row['visit_month'], row['age_band'], row['sub_county'], row['gestation_band'], row['visit_number'])
+            for row in rows} == {('2024-03', '25-29', 'Kiharu', '14-27', '1')}
+    assert manifest['suppressed_classes'] == [['2024-03', '25-29', 'Kiharu', '14-27', '2']]
+
+def test_a_patient_in_two_databases_counts_once(add_visit, engines, tmp_path):
+    with using_shard(shard_key(KANGEMA)):
+        add_class(add_visit, 'MUR', 4)
+    with using_shard(shard_key(MARAGUA)):
+        add_visit('MUR000', VISIT_DATE, facility=MARAGUA, village='Kiharu')  # Re-registered at Maragua
+
+    manifest = ResearchExporter(engines, key='k', k=5).export(str(tmp_path), fmt='csv')
+
+    assert (manifest['rows'], manifest['rows_suppressed']) == (0, 5)
+
+def test_class_at_k_in_one_database_is_kept_everywhere(add_visit, engines, tmp_path):
+    with using_shard(shard_key(KANGEMA)):
+        add_class(add_visit, 'MUR', 5)
+    with using_shard(shard_key(MARAGUA)):
+        add_visit('MUR500', VISIT_DATE, facility=MARAGUA, village='Kiharu')
+
+    manifest = ResearchExporter(engines, key='k', k=5).export(str(tmp_path), fmt='csv')
+
+    assert (manifest['rows'], manifest['rows_suppressed']) == (6, 0)
+
+def test_late_visits_are_banded(add_visit, engines, tmp_path):
+    add_class(add_visit, 'MUR', 5, visit_number=6)
+    for n in range(5):
+        add_visit(f"MUR{n:03d}", VISIT_DATE, facility=KANGEMA, visit_number=5)
+
+    ResearchExporter(engines, key='k', k=5).export(str(tmp_path), fmt='csv')
+
+    assert {row['visit_number'] for row in exported(tmp_path)} == {'4+'}
+
+def test_reexport_removes_stale_parts(add_visit, engines, tmp_path):
+    add_class(add_visit, 'MUR', 6)
+    ResearchExporter(engines, key='k', k=5, chunk_size=2).export(str(tmp_path), fmt='csv')
+    assert len([name for name in os.listdir(tmp_path) if name.startswith('part-')]) == 3
+
+    manifest = ResearchExporter(engines, key='k', k=5).export(str(tmp_path), fmt='csv')
+
+    assert sorted(os.listdir(tmp_path)) == sorted(manifest['files'] + ['manifest.json'])
+    assert len(exported(tmp_path)) == 6
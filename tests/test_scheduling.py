@@ -0,0 +1,79 @@
+# tests/test_scheduling.py - TimerQueue rescheduling and cancelling by lazy deletion
+import threading
+from datetime import datetime, timedelta
+
+from src.scheduling import TimerQueue
+
+def in_seconds(seconds: float) -> datetime:
+    return datetime.now() + timedelta(seconds=seconds)
+
+def test_reschedule_replaces_the_live_entry():
+    queue = TimerQueue(lambda key: None)
+    first = in_seconds(60)
+    other = in_seconds(90)
+    queue.schedule('a', first)
+    queue.schedule('a', in_seconds(120))
+    queue.schedule('b', other)
+
+    assert len(queue) == 2
+    assert len(queue._heap) == 3  # The old entry for 'a' stays until it surfaces
+    assert queue.next_due() == other
+    assert len(queue._heap) == 2
+
+def test_cancel_is_skipped_when_it_surfaces():
+    queue = TimerQueue(lambda key: None)
+    soon = in_seconds(60)
+    queue.schedule('a', soon)
+    queue.schedule('b', in_seconds(90))
+
+    queue.cancel('a')
+    queue.cancel('missing')
+
+    assert len(queue) == 1
+    assert queue.next_due() > soon
+    assert [entry[2] for entry in queue._heap] == ['b']
+
+def test_only_live_timers_fire_in_due_order():
+    fired = []
+    done = threading.Event()
+
+    def callback(key):
+        fired.append(key)
+        if key == 'last':
+            done.set()
+
+    queue = TimerQueue(callback).start()
+    try:
+        queue.schedule('cancelled', in_seconds(0.05))
+        queue.schedule('moved', in_seconds(0.05))
+        queue.schedule('last', in_seconds(0.3))
+        queue.schedule('first', in_seconds(0.1))
+        queue.schedule('moved', in_seconds(0.2))
+        queue.cancel('cancelled')
+
+        assert done.wait(timeout=5)
+    finally:
+        queue.stop()
+
+    assert fired == ['first', 'moved', 'last']
+    assert len(queue) == 0
+
+def test_callback_errors_do_not_stop_the_thread():
+    fired = []
+    done = threading.Event()
+
+    def callback(key):
+        if key == 'bad':
+            raise RuntimeError('boom')
+        fired.append(key)
+        done.set()
+
+    queue = TimerQueue(callback).start()
+    try:
+        queue.schedule('bad', in_seconds(0.01))
+        queue.schedule('good', in_seconds(0.05))
+        assert done.wait(timeout=5)
+    finally:
+        queue.stop()
+
+    assert fired == ['good']
@@ -0,0 +1,103 @@
+# tests/test_sharding.py - County users read every facility database; alerts commit with their outbox rows
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import db, Alert, ANCVisit, FollowUp, NotificationOutbox
+from src.sharding import shard_key, using_shard
+
+HOSPITAL = "Murang'a County Hospital"
+KANGEMA = 'Kangema Sub-County Hospital'
+MARAGUA = 'Maragua Hospital'
+
+@pytest.fixture
+def sharded_patients(add_visit):
+    """Two Kiharu patients at Kangema and one at Maragua, each in that facility's database"""
+    seen = datetime.now() - timedelta(days=1)
+    for patient_id, facility in (('MUR101', KANGEMA), ('MUR102', KANGEMA), ('MUR201', MARAGUA)):
+        with using_shard(shard_key(facility)):
+            add_visit(patient_id, seen, facility=facility, village='Kiharu', last_visit_date=seen,
+                      last_risk_level='Low Risk')
+    return shard_key(KANGEMA), shard_key(MARAGUA)
+
+def test_county_patient_list_covers_every_shard(login, sharded_patients):
+    kangema, maragua = sharded_patients
+
+    page = login('county1').get('/patients').get_data(as_text=True)
+
+    assert 'Registered Patients (3)' in page
+    assert f'/patient/MUR101?shard={kangema}' in page
+    assert f'/patient/MUR201?shard={maragua}' in page
+
+def test_facility_patient_list_stays_in_its_shard(login, sharded_patients):
+    page = login('nurse1').get('/patients').get_data(as_text=True)
+    assert 'Registered Patients (0)' in page
+
+def test_county_opens_a_profile_in_a_shard(login, sharded_patients):
+    kangema, _ = sharded_patients
+    client = login('county1')
+
+    page = client.get(f'/patient/MUR101?shard={kangema}').get_data(as_text=True)
+    assert 'MUR101' in page
+    assert f'/api/patient/MUR101/bp-series?shard={kangema}' in page
+
+    response = client.get('/patient/MUR101')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(f'/patient/MUR101?shard={kangema}')
+
+    assert client.get(f'/api/patient/MUR101/bp-series?shard={kangema}').json['total'] == 1
+
+def test_facility_users_cannot_open_another_shard(login, sharded_patients):
+    kangema, _ = sharded_patients
+    response = login('nurse1').get(f'/patient/MUR101?shard={kangema}')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/patients')
+
+def test_county_dashboard_lists_recent_patients_from_shards(login, sharded_patients):
+    page = login('county1').get('/').get_data(as_text=True)
+    assert 'MUR101' in page and 'MUR201' in page
+
+def test_county_outreach_pages_across_shards(login, sharded_patients):
+    client = login('county1')
+
+    seen, cursors, cursor = [], [], 0
+    while cursor is not None:
+        result = client.get(f'/api/cohorts/outreach?village=Kiharu&limit=2&after={cursor}').json
+        seen += [(row['shard'], row['patient_id']) for row in result['patients']]
+        cursor = result['next_cursor']
+        cursors.append(cursor)
+
+    assert sorted(seen) == sorted([(sharded_patients[0], 'MUR101'), (sharded_patients[0], 'MUR102'),
+                                   (sharded_patients[1], 'MUR201')])
+    assert cursors[0].endswith(':2') and cursors[-1] is None
+
+def test_followups_owed_here_are_found_in_the_home_shard(login, sharded_patients):
+    _, maragua = sharded_patients
+    with using_shard(maragua):
+        visit_id = ANCVisit.query.filter_by(patient_id='MUR201').one().id
+        # Referred: recorded with the Maragua patient, but owed at Kangema
+        db.session.add(FollowUp(patient_id='MUR201', visit_id=visit_id, facility=KANGEMA, risk_level='Low Risk',
+                                reason='Routine ANC', due_at=datetime.now() + timedelta(days=1)))
+        db.session.commit()
+
+    page = login('county1').get(f'/followups?facility={KANGEMA}').get_data(as_text=True)
+
+    assert 'Due at Kangema Sub-County Hospital (1)' in page
+    assert f'/patient/MUR201?shard={maragua}' in page
+
+def test_alert_and_its_outbox_rows_share_a_database(login, tmp_path, monkeypatch):
+    contacts = tmp_path / 'contacts.json'
+    contacts.write_text(json.dumps({HOSPITAL: {'nurse': ['+254700000001'], 'doctor': ['+254700000002']}}))
+    monkeypatch.setenv('ALERT_CONTACTS_FILE', str(contacts))
+
+    login('doctor1').post('/assess', data={
+        'patient_id': 'MUR301', 'name': 'Jane Test', 'dob': '1999-01-01', 'gestation_weeks': '32',
+        'systolic_bp': '170', 'diastolic_bp': '115', 'urine_protein': '3', 'village': 'Kiharu'
+    })
+
+    with using_shard(shard_key(HOSPITAL)):
+        alert = Alert.query.filter_by(patient_id='MUR301').one()
+        assert {row.alert_id for row in NotificationOutbox.query} == {alert.id}
+        assert NotificationOutbox.query.count() == 2
+    assert NotificationOutbox.query.count() == 0  # Nothing in the main database
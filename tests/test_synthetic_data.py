@@ -0,0 +1,62 @@
+# tests/test_synthetic_data.py - Synthetic population: app-style ids, follow-ups, rows in their home database
+from datetime import datetime
+
+import pytest
+
+from src.database import db, ANCVisit, FollowUp, Patient
+from src.sharding import shard_key, shard_map, using_shard
+from src.synthetic_data import SyntheticDataGenerator
+
+CLINICS = ["Murang'a County Hospital", 'Kangema Sub-County Hospital', 'Maragua Hospital']
+NOW = datetime(2025, 6, 1, 12, 0)
+
+@pytest.fixture
+def generate(app):
+    def run(patients: int, shards=None):
+        generator = SyntheticDataGenerator(db.engine, CLINICS, seed=7, chunk_size=10, now=NOW, shards=shards)
+        return generator.generate(patients=patients)
+    return run
+
+def everywhere(query) -> list:
+    rows = []
+    for key in [None] + shard_map().keys():
+        with using_shard(key):
+            rows += query()
+    return rows
+
+def test_ids_follow_the_app_scheme_after_existing_patients(generate, add_visit):
+    from muranga_dashboard import generate_patient_id
+
+    add_visit('MUR002', NOW)
+    generate(3)
+
+    ids = sorted(patient_id for patient_id, in db.session.query(Patient.patient_id))
+    assert ids == ['MUR002', 'MUR003', 'MUR004', 'MUR005']
+    assert generate_patient_id() == 'MUR006'
+
+def test_every_visit_opens_a_follow_up(generate):
+    totals = generate(20)
+
+    assert totals['follow_ups'] == totals['visits'] == FollowUp.query.count()
+    for follow_up in FollowUp.query:
+        visit = ANCVisit.query.get(follow_up.visit_id)
+        assert (follow_up.patient_id, follow_up.risk_level) == (visit.patient_id, visit.risk_level)
+        if follow_up.status == 'COMPLETED':
+            assert ANCVisit.query.get(follow_up.completed_visit_id).visit_date <= follow_up.due_at
+        elif follow_up.status == 'MISSED':
+            assert follow_up.due_at <= NOW
+        else:
+            assert follow_up.due_at > NOW
+
+def test_rows_go_to_the_home_facility_database(generate):
+    totals = generate(30, shards=shard_map())
+
+    assert Patient.query.count() == 0  # Nothing in the main database
+    for facility in CLINICS:
+        # Columns, not objects: ids repeat across databases and the session would mix them up
+        with using_shard(shard_key(facility)):
+            patients = dict(db.session.query(Patient.patient_id, Patient.facility))
+            assert set(patients.values()) <= {facility}
+            assert {patient_id for patient_id, in db.session.query(ANCVisit.patient_id)} <= set(patients)
+    assert len(everywhere(lambda: db.session.query(Patient.id).all())) == totals['patients']
+    assert len(everywhere(lambda: db.session.query(FollowUp.id).all())) == totals['follow_ups']
@@ -6,20 +6,33 @@ import json
 # Add current directory to path
 sys.path.append(os.path.dirname(__file__))
 
+app = Flask(__name__)
+
 try:
     from src.models import DataSource, Patient, LabResult, ClinicalNote
     from src.ingestion import DataIngestion
     from src.storage import CentralizedDataStore
     from src.ai_engine import AIEngine
-    from src.services import AlertingService, ClinicalUIService, AnalyticsService
+    from src.services import AlertingService, AlertOverflowStore, ClinicalUIService, AnalyticsService
     from src.external import ExternalInterfaces
+    from src.database import init_db, create_schema
+    from src.notifications import NotificationWorker, OutboxNotifier, providers_from_env
+    
+    # High and critical alerts are texted through the dashboard's notification outbox
+    init_db(app)
+    with app.app_context():
+        create_schema()
+    notification_worker = NotificationWorker(app, providers_from_env())
+    if os.environ.get('ENABLE_SCHEDULERS', '1') == '1':
+        notification_worker.start()
     
     class HealthcareIntegrationSystem:
         def __init__(self):
             self.ingestion = DataIngestion()
             self.data_store = CentralizedDataStore()
             self.ai_engine = AIEngine()
-            self.alerting = AlertingService()
+            self.alerting = AlertingService(overflow=AlertOverflowStore(os.environ.get('ALERT_OVERFLOW_DB', 'alert_overflow.db')),
+                                            notify=OutboxNotifier(app, worker=notification_worker))
             self.clinical_ui = ClinicalUIService(self.data_store)
             self.analytics = AnalyticsService(self.data_store)
             self.external = ExternalInterfaces()
@@ -63,7 +76,7 @@ except Exception as e:
             self.analytics = type('obj', (object,), {
                 'get_statistics': lambda: {'total_patients': 0, 'total_lab_results': 0, 'total_notes': 0}
             })
-            self.alerting = type('obj', (object,), {'active_alerts': []})
+            self.alerting = type('obj', (object,), {'count': lambda: 0, 'top': lambda n: [], 'overflow_count': 0})
             self.external = type('obj', (object,), {
                 'generate_nhif_billing': lambda x, y: {'status': 'demo'}
             })
@@ -71,8 +84,6 @@ except Exception as e:
     system = HealthcareIntegrationSystem()
     print("⚠️ Using demo mode")
 
-app = Flask(__name__)
-
 @app.route('/')
 def home():
     return """
@@ -125,7 +136,7 @@ def home():
                 </div>
                 <div class="stat-card">
                     <h3>🚨 Active Alerts</h3>
-                    <p style="font-size: 24px; font-weight: bold;">""" + str(len(system.alerting.active_alerts)) + """</p>
+                    <p style="font-size: 24px; font-weight: bold;">""" + str(system.alerting.count()) + """</p>
                 </div>
             </div>
             
@@ -308,9 +319,12 @@ def view_patient(patient_id):
     html += "</div>"
     return html
 
+ANALYTICS_TOP_ALERTS = 20
+
 @app.route('/analytics')
 def analytics():
     stats = system.analytics.get_statistics()
+    top_alerts = system.alerting.top(ANALYTICS_TOP_ALERTS)
     
     html = """
     <div class="container">
@@ -333,16 +347,21 @@ def analytics():
         </div>
         
         <div class="card">
-            <h2>🚨 Active Alerts</h2>
+            <h2>🚨 Active Alerts (""" + str(system.alerting.count()) + """)</h2>
     """
-    
-    if system.alerting.active_alerts:
-        for alert in system.alerting.active_alerts:
+
+    if top_alerts:
+        for alert in top_alerts:
+            repeats = f" (x{alert['count']}, last {alert['last_seen']:%H:%M})" if alert['count'] > 1 else ""
             html += f"""
             <div style="color: #d63384; font-weight: bold; padding: 10px; background: #fff3f3; margin: 5px 0; border-radius: 3px;">
-                🚨 [{alert['priority'].upper()}] Patient {alert['patient_id']}: {alert['message']}
+                🚨 [{alert['priority'].upper()}] Patient {alert['patient_id']}: {alert['message']}{repeats}
             </div>
             """
+        if system.alerting.count() > len(top_alerts):
+            html += f"<p>Showing the {len(top_alerts)} most urgent alerts.</p>"
+        if system.alerting.overflow_count:
+            html += f"<p>{system.alerting.overflow_count} lower-priority alerts moved to storage.</p>"
     else:
         html += "<p>✅ No active alerts. System is running normally.</p>"
     